@@ -0,0 +1,19 @@
+"""
+Benchmarks of pyVoodoo. Every module registers its cases here, benchmarks.suite runs them, prints them and
+compares them against a baseline, see its docstring.
+"""
+from collections import OrderedDict
+
+CASES = OrderedDict()
+
+
+def case(name, ops, self_timed=False):
+    """
+    Register a case: setup(ops) prepares whatever it needs, untimed, and returns the callable that is timed,
+    which does ops operations. Work that can't be timed from here (in another process, say) is timed by the
+    callable itself when self_timed, it then returns the elapsed seconds.
+    """
+    def register(setup):
+        CASES[name] = setup, ops, self_timed
+        return setup
+    return register
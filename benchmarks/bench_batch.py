@@ -0,0 +1,41 @@
+"""
+Benchmark batch compilation of a source tree with a growing number of workers.
+
+    python -m benchmarks.bench_batch [suite options]
+
+Compiles the first FILES modules of the standard library once per worker count, one operation being one
+file, pool startup included.
+"""
+import os
+import sys
+import sysconfig
+from itertools import islice
+
+from benchmarks import case
+from pyVoodoo.batch import compile_batch, iter_sources
+
+FILES = 200
+
+
+def _compile(workers):
+    def setup(ops):
+        files = list(islice(iter_sources(sysconfig.get_paths()['stdlib']), ops))
+
+        def run():
+            for result in compile_batch(files, workers=workers):
+                pass
+        return run
+    return setup
+
+
+for _workers in sorted(set((1, 2, 4, os.cpu_count() or 1))):
+    case('batch/workers={0}'.format(_workers), FILES)(_compile(_workers))
+
+
+def main(argv=None):
+    from benchmarks.suite import main
+    return main(argv, 'batch')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+Benchmark constant lookups with growing constant pools.
+
+    python -m benchmarks.bench_constpool [suite options]
+
+Every size looks up each distinct constant twice, so half the lookups hit the pool and half of them
+miss. The lookup alone is timed for the ConstantPool and for the list scan LOAD_CONST used before it (only
+for the sizes where the scan finishes in reasonable time). The full LOAD_CONST/POP_TOP emission is the
+load_const case of benchmarks.suite.
+"""
+import sys
+
+from benchmarks import case
+from pyVoodoo.tables import ConstantPool
+from pyVoodoo.utils import is_hashable
+
+SIZES = (10, 100, 1000, 10000, 100000)
+LIST_SCAN_LIMIT = 10000
+
+
+def list_scan_index(consts, const):
+    pos = 0
+    hashable = is_hashable(const)
+    while 1:
+        try:
+            arg = consts.index(const, pos)
+            it = consts[arg]
+        except ValueError:
+            consts.append(const)
+            return len(consts) - 1
+        else:
+            if type(it) is type(const) and (hashable or it is const):
+                return arg
+        pos = arg + 1
+
+
+def _pool(ops):
+    add = ConstantPool([None]).add
+    size = ops // 2
+
+    def run():
+        for _ in range(2):
+            for i in range(size):
+                add(i)
+    return run
+
+
+def _list_scan(ops):
+    consts = [None]
+    size = ops // 2
+
+    def run():
+        for _ in range(2):
+            for i in range(size):
+                list_scan_index(consts, i)
+    return run
+
+
+for _size in SIZES:
+    case('constpool/pool/{0}'.format(_size), 2 * _size)(_pool)
+    if _size <= LIST_SCAN_LIMIT:
+        case('constpool/list_scan/{0}'.format(_size), 2 * _size)(_list_scan)
+
+
+def main(argv=None):
+    from benchmarks.suite import main
+    return main(argv, 'constpool')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
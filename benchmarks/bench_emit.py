@@ -0,0 +1,84 @@
+"""
+Benchmark instruction emission throughput.
+
+    python -m benchmarks.bench_emit [suite options]
+
+Emits the same straight line block (loads, stores, arithmetic, attribute and global lookups) through
+the Code opcode methods, through Code.emit with opcode names and with opcode numbers, and in bulk with
+Code.emit_many and Code.emit_encoded, one operation being one instruction.
+"""
+import sys
+
+from benchmarks import case
+from pyVoodoo.assembler import Code, opmap
+
+REPEAT = 20000
+
+BLOCK = [('LOAD_FAST', 'a'), ('LOAD_CONST', 2), ('BINARY_MULTIPLY', None), ('STORE_FAST', 'b'),
+         ('LOAD_GLOBAL', 'obj'), ('LOAD_ATTR', 'value'), ('LOAD_FAST', 'b'), ('BINARY_ADD', None),
+         ('STORE_FAST', 'a'), ('NOP', None)]
+
+
+def with_methods(repeat):
+    code = Code()
+    code.varnames.add('a')
+    calls = [(getattr(code, name), arg) for name, arg in BLOCK]
+    for _ in range(repeat):
+        for method, arg in calls:
+            if arg is None:
+                method()
+            else:
+                method(arg)
+    return code
+
+
+def with_emit(repeat, block=BLOCK):
+    code = Code()
+    emit = code.emit
+    for _ in range(repeat):
+        for op, arg in block:
+            emit(op, arg)
+    return code
+
+
+def with_emit_many(repeat):
+    code = Code()
+    code.emit_many(BLOCK * repeat)
+    return code
+
+
+def with_emit_encoded(repeat):
+    block = with_emit(1)
+    code = Code()
+    for table in ('consts', 'names', 'varnames'):
+        for entry in getattr(block, table):
+            getattr(code, table).add(entry)
+    code.emit_encoded(bytes(block.code) * repeat)
+    return code
+
+
+def with_emit_numbers(repeat):
+    return with_emit(repeat, [(opmap[name], arg) for name, arg in BLOCK])
+
+
+def _emitting(build):
+    def setup(ops):
+        # every path emits the same code
+        expected = bytes(with_emit(1).code)
+        assert bytes(build(1).code) == expected
+        return lambda: build(ops // len(BLOCK))
+    return setup
+
+
+for _label, _build in (('methods', with_methods), ('emit(name)', with_emit), ('emit(opcode)', with_emit_numbers),
+                       ('emit_many', with_emit_many), ('emit_encoded', with_emit_encoded)):
+    case('emit/' + _label, REPEAT * len(BLOCK))(_emitting(_build))
+
+
+def main(argv=None):
+    from benchmarks.suite import main
+    return main(argv, 'emit')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
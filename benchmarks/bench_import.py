@@ -0,0 +1,67 @@
+"""
+Benchmark the cost of importing pyVoodoo.
+
+    python -m benchmarks.bench_import [suite options]
+
+Every sample is a fresh interpreter, so nothing is cached besides the .pyc files (a warm up run writes
+them), one operation being one sample. Times the import of pyVoodoo, and the first build of a lazy opcode
+table and of a generated Code method, which import no longer pays for.
+"""
+import os
+import subprocess
+import sys
+
+from benchmarks import case
+from pyVoodoo.encoding import default_encoder
+
+SAMPLES = 5
+
+SCRIPT = """
+import sys
+import time
+start = time.perf_counter()
+import pyVoodoo
+imported = time.perf_counter()
+if sys.argv[1] == 'package':
+    print(imported - start)
+    sys.exit()
+from pyVoodoo import assembler
+# before python 3.7 the tables are built on import
+assert sys.version_info < (3, 7) or 'hasflow' not in vars(assembler) and 'LOAD_GLOBAL' not in vars(assembler.Code)
+start = time.perf_counter()
+if sys.argv[1] == 'opcode_table':
+    assembler.hasflow
+else:
+    assembler.Code().LOAD_GLOBAL('x')
+print(time.perf_counter() - start)
+"""
+
+
+def sample(what):
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    output = subprocess.check_output([sys.executable, '-c', SCRIPT, what], env=env, universal_newlines=True)
+    return float(output)
+
+
+def _first(what):
+    def setup(ops):
+        if what == 'generated_method':
+            # raises when the running python's bytecode isn't supported
+            default_encoder()
+        sample(what)
+        return lambda: sum(sample(what) for _ in range(ops))
+    return setup
+
+
+for _what in ('package', 'opcode_table', 'generated_method'):
+    case('import/' + _what, SAMPLES, self_timed=True)(_first(_what))
+
+
+def main(argv=None):
+    from benchmarks.suite import main
+    return main(argv, 'import')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""
+Benchmark label resolution on state machine shaped code.
+
+    python -m benchmarks.bench_jumps [suite options]
+
+Every state compares the state variable and jumps to its own block, so the number of branches grows with
+the number of states and most of the jumps need EXTENDED_ARG prefixes once the code passes 0xFF bytes.
+Emitting the code and resolving its labels are timed apart, one operation being one state.
+"""
+import sys
+
+from benchmarks import case
+from pyVoodoo.assembler import Code
+
+SIZES = (10, 100, 1000, 10000)
+
+
+def build(states):
+    code = Code()
+    code.argcount = 1
+    code.varnames.add('state')
+    blocks = []
+    for i in range(states):
+        code.LOAD_FAST('state')
+        code.LOAD_CONST(i)
+        code.COMPARE_OP(2)
+        blocks.append(code.POP_JUMP_IF_TRUE())
+    code.LOAD_CONST(None)
+    code.RETURN_VALUE()
+    for i, block in enumerate(blocks):
+        code.mark(block)
+        code.LOAD_CONST(i)
+        code.RETURN_VALUE()
+    return code
+
+
+def _emit(ops):
+    return lambda: build(ops)
+
+
+def _resolve(ops):
+    return build(ops).resolve
+
+
+for _states in SIZES:
+    case('jumps/emit/{0}'.format(_states), _states)(_emit)
+    case('jumps/resolve/{0}'.format(_states), _states)(_resolve)
+
+
+def main(argv=None):
+    from benchmarks.suite import main
+    return main(argv, 'jumps')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+Benchmark the peephole optimizer on generated arithmetic and branching code.
+
+    python -m benchmarks.bench_peephole [suite options]
+
+Every function is assembled twice, once left as emitted and once run through Code.optimize, both are
+turned into real functions and their calls timed, one operation being one call.
+"""
+import sys
+
+from benchmarks import case
+from pyVoodoo.assembler import Code
+
+TERMS = (4, 16, 64)
+CALLS = 20000
+
+
+def build(terms):
+    """f(x): a constant folded expression of terms operands per branch, behind a `not x` test"""
+    code = Code()
+    code.argcount = 1
+    code.varnames.add('x')
+    code.LOAD_CONST('unused')
+    code.POP_TOP()
+    code.LOAD_FAST('x')
+    code.UNARY_NOT()
+    other = code.POP_JUMP_IF_FALSE()
+    for value in range(terms):
+        code.LOAD_CONST(value)
+        if value:
+            code.BINARY_ADD()
+    code.RETURN_VALUE()
+    code.mark(other)
+    code.LOAD_FAST('x')
+    for value in range(terms):
+        code.LOAD_CONST(value)
+        code.BINARY_MULTIPLY()
+    code.RETURN_VALUE()
+    return code
+
+
+def _calls(terms, optimize):
+    def setup(ops):
+        code = build(terms)
+        plain = code.to_function()
+        if optimize:
+            code.optimize()
+        function = code.to_function()
+        assert plain(0) == function(0) and plain(1) == function(1)
+
+        def run():
+            for _ in range(ops):
+                function(0)
+        return run
+    return setup
+
+
+for _terms in TERMS:
+    case('peephole/plain/{0}'.format(_terms), CALLS)(_calls(_terms, False))
+    case('peephole/optimized/{0}'.format(_terms), CALLS)(_calls(_terms, True))
+
+
+def main(argv=None):
+    from benchmarks.suite import main
+    return main(argv, 'peephole')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
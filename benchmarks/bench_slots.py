@@ -0,0 +1,68 @@
+"""
+Benchmark local slot reuse on generated code with many short lived temporaries.
+
+    python -m benchmarks.bench_slots [suite options]
+
+Builds x -> x + 0 + 1 + ... with every partial sum going through its own temporary, for several chain
+lengths, behind a fast path returning x when it is false. Times a fast path call before (plain) and after
+(shared) Code.reuse_slots: frames are sized and cleared by co_nlocals, so that call is mostly frame setup
+and teardown.
+"""
+import sys
+
+from benchmarks import case
+from pyVoodoo.assembler import Code
+
+LENGTHS = (10, 100, 1000)
+CALLS = 20000
+
+
+def chain(length):
+    code = Code()
+    code.argcount = 1
+    code.varnames.add('x')
+    code.LOAD_FAST('x')
+    slow = code.POP_JUMP_IF_TRUE()
+    code.LOAD_FAST('x')
+    code.RETURN_VALUE()
+    code.mark(slow)
+    code.LOAD_FAST('x')
+    for i in range(length):
+        code.LOAD_CONST(i)
+        code.BINARY_ADD()
+        temp = code.temporary()
+        code.STORE_FAST(temp)
+        code.LOAD_FAST(temp)
+    code.RETURN_VALUE()
+    return code
+
+
+def _calls(length, shared):
+    def setup(ops):
+        code = chain(length)
+        plain = code.to_function()
+        if shared:
+            code.reuse_slots()
+            assert code.to_code_type().co_nlocals < plain.__code__.co_nlocals
+        function = code.to_function()
+        assert plain(1) == function(1)
+
+        def run():
+            for _ in range(ops):
+                function(0)
+        return run
+    return setup
+
+
+for _length in LENGTHS:
+    case('slots/plain/{0}'.format(_length), CALLS)(_calls(_length, False))
+    case('slots/shared/{0}'.format(_length), CALLS)(_calls(_length, True))
+
+
+def main(argv=None):
+    from benchmarks.suite import main
+    return main(argv, 'slots')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
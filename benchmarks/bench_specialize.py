@@ -0,0 +1,65 @@
+"""
+Benchmark calls to a generic function against the same function specialized for its fixed arguments.
+
+    python -m benchmarks.bench_specialize [suite options]
+
+convert takes a record plus a schema (field names and types) and options fixed for the life of the
+process. It is specialized for one schema and set of options with specialize_function, and both versions
+are called on the same record, one operation being one call.
+"""
+import sys
+
+from benchmarks import case
+from pyVoodoo.specializer import specialize_function
+
+CALLS = 100000
+SCHEMA = (('id', int), ('name', str), ('score', float))
+OPTIONS = ('strip', 'strict')
+RECORD = {'id': '7', 'name': ' voodoo ', 'score': '0.5'}
+
+
+def convert(record, schema, options, default=None):
+    strip = 'strip' in options
+    strict = 'strict' in options
+    lower = 'lower' in options
+    out = {}
+    for name, kind in schema:
+        value = record.get(name, default)
+        if value is None:
+            if strict:
+                raise KeyError(name)
+            continue
+        if strip and kind is str:
+            value = value.strip()
+        if lower and kind is str:
+            value = value.lower()
+        out[name] = kind(value)
+    return out
+
+
+@case('specialize/generic', CALLS)
+def generic(ops):
+    def run():
+        for _ in range(ops):
+            convert(RECORD, SCHEMA, OPTIONS)
+    return run
+
+
+@case('specialize/specialized', CALLS)
+def specialized(ops):
+    function = specialize_function(convert, {'schema': SCHEMA, 'options': OPTIONS})
+    assert function(RECORD) == convert(RECORD, SCHEMA, OPTIONS)
+
+    def run():
+        for _ in range(ops):
+            function(RECORD)
+    return run
+
+
+def main(argv=None):
+    from benchmarks.suite import main
+    return main(argv, 'specialize')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""
+Benchmark generating many code objects that only differ in their constants.
+
+    python -m benchmarks.bench_templates [suite options]
+
+Builds a per field validator (isinstance check and upper bound) VARIANTS times, once assembling a new Code
+and turning it into a code object every time and once specializing a frozen Template, one operation being
+one code object.
+"""
+import sys
+
+from benchmarks import case
+from pyVoodoo.assembler import Code
+from pyVoodoo.templates import Placeholder
+
+VARIANTS = 5000
+
+
+def validator(kind, limit):
+    code = Code()
+    code.argcount = 1
+    code.varnames.add('value')
+    fail = code.label()
+    code.LOAD_GLOBAL('isinstance')
+    code.LOAD_FAST('value')
+    code.LOAD_CONST(kind)
+    code.CALL_FUNCTION(2)
+    code.POP_JUMP_IF_FALSE(fail)
+    code.LOAD_FAST('value')
+    code.LOAD_CONST(limit)
+    code.COMPARE_OP(0)
+    code.RETURN_VALUE()
+    code.mark(fail)
+    code.set_stack_size(0)
+    code.LOAD_CONST(False)
+    code.RETURN_VALUE()
+    return code
+
+
+def assembled(variants):
+    return [validator(int, limit).to_code_type() for limit in range(variants)]
+
+
+def specialized(variants):
+    template = validator(Placeholder('kind'), Placeholder('limit')).freeze()
+    specialize = template.specialize
+    return [specialize(kind=int, limit=limit) for limit in range(variants)]
+
+
+def _building(build):
+    def setup(ops):
+        # both paths build the same code
+        assert [c.co_code for c in build(2)] == [c.co_code for c in assembled(2)]
+        return lambda: build(ops)
+    return setup
+
+
+case('templates/assemble', VARIANTS)(_building(assembled))
+case('templates/specialize', VARIANTS)(_building(specialized))
+
+
+def main(argv=None):
+    from benchmarks.suite import main
+    return main(argv, 'templates')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,295 @@
+"""
+Benchmark suite for the assembler hot paths, with machine readable results.
+
+    python -m benchmarks.suite [--output results.json] [--baseline baseline.json] [--threshold 0.1]
+
+Runs every case repeat times (best and median are kept), prints nanoseconds per operation and writes the
+results as JSON. With --baseline the results are compared case by case against an earlier run and the exit
+status is 1 when any case got slower by more than threshold. Everything runs in process, offline, besides
+the import cases, which time fresh interpreters.
+
+    python -m benchmarks.suite --output baseline.json
+    ... change things ...
+    python -m benchmarks.suite --baseline baseline.json
+
+The cases of one topic are registered by their module (bench_constpool, bench_emit, ...), which runs
+them alone with the same options: python -m benchmarks.bench_slots --baseline baseline.json. Cases the
+running python can't generate bytecode for are skipped.
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import sys
+import time
+from collections import OrderedDict
+
+from benchmarks import CASES, case
+from pyVoodoo.assembler import Code, Persistor, PythonParser, opmap
+from pyVoodoo.assemblerExceptions import AssemblerBytecodeException
+from pyVoodoo.disassembler import iter_code_objects
+
+FORMAT_VERSION = 1
+REPEAT = 5
+THRESHOLD = 0.1
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test', 'fixture')
+MODULES = ('bench_constpool', 'bench_jumps', 'bench_peephole', 'bench_batch', 'bench_import', 'bench_emit',
+           'bench_templates', 'bench_slots', 'bench_specialize')
+
+
+def load_cases():
+    """Register the cases of every benchmark module"""
+    for module in MODULES:
+        importlib.import_module('benchmarks.' + module)
+
+
+def _load_consts(size):
+    def run():
+        code = Code()
+        load_const = code.LOAD_CONST
+        pop_top = code.POP_TOP
+        for i in range(size):
+            load_const(i)
+            pop_top()
+    return run
+
+
+case('load_const/100', 100)(_load_consts)
+case('load_const/10000', 10000)(_load_consts)
+case('load_const/100000', 100000)(_load_consts)
+
+
+@case('fast_locals/1000', 20000)
+def fast_locals(ops):
+    names = ['v{0}'.format(i) for i in range(1000)]
+
+    def run():
+        code = Code()
+        for name in names:
+            code.varnames.add(name)
+        load_fast = code.LOAD_FAST
+        store_fast = code.STORE_FAST
+        for i in range(ops // 2):
+            name = names[i % 1000]
+            load_fast(name)
+            store_fast(name)
+    return run
+
+
+@case('emit_arg', 100000)
+def emit_arg(ops):
+    op = opmap['LOAD_CONST']
+    # mostly one byte arguments, every 16th needs an EXTENDED_ARG prefix
+    args = [i if i % 16 else i << 8 for i in range(256)]
+
+    def run():
+        code = Code()
+        emit = code.emit_arg
+        for i in range(ops):
+            emit(op, args[i & 255])
+    return run
+
+
+@case('find_opcode_index', 1000)
+def find_opcode_index(ops):
+    code = Code()
+    code.varnames.add('a')
+    for i in range(20000):
+        code.LOAD_FAST('a')
+        code.LOAD_CONST(i % 100)
+        code.BINARY_ADD()
+        code.STORE_FAST('a')
+    names = ('LOAD_FAST', 'LOAD_CONST', 'BINARY_ADD', 'RETURN_VALUE')
+
+    def run():
+        find = code.find_opcode_index
+        for i in range(ops):
+            find(names[i & 3])
+    return run
+
+
+@case('persistor', 2000)
+def persistor(ops):
+    code = Code()
+    code.varnames.add('a')
+    for i in range(500):
+        code.LOAD_FAST('a')
+        code.LOAD_CONST(i)
+        code.BINARY_ADD()
+        code.STORE_FAST('a')
+    code.LOAD_FAST('a')
+    code.RETURN_VALUE()
+    to_code_type = Persistor().to_code_type
+
+    def run():
+        for _ in range(ops):
+            code._code_object = None
+            to_code_type(code)
+    return run
+
+
+def _parse_all(code_objects, ops):
+    parse = PythonParser().parse
+    count = len(code_objects)
+
+    def run():
+        for i in range(ops):
+            parse(code_objects[i % count])
+    return run
+
+
+def _compiled(sources):
+    code_objects = []
+    for path, source in sources:
+        code_objects.extend(iter_code_objects(compile(source, path, 'exec', dont_inherit=True)))
+    return code_objects
+
+
+@case('parse/fixtures', 500)
+def parse_fixtures(ops):
+    sources = []
+    for name in sorted(os.listdir(FIXTURES)):
+        if name.endswith('.py'):
+            with open(os.path.join(FIXTURES, name)) as f:
+                sources.append((name, f.read()))
+    return _parse_all(_compiled(sources), ops)
+
+
+CORPUS_FUNCTION = """
+def function_{0}(items, limit={0}):
+    total = 0
+    for i, item in enumerate(items):
+        if item > limit and i % 3:
+            total += item * {0}
+        elif item:
+            total -= len(str(item))
+        else:
+            continue
+    return [x for x in (total, limit) if x] or None
+"""
+
+
+@case('parse/corpus', 2000)
+def parse_corpus(ops):
+    sources = [('module_{0}.py'.format(m), ''.join(CORPUS_FUNCTION.format(m * 100 + f) for f in range(100)))
+               for m in range(10)]
+    return _parse_all(_compiled(sources), ops)
+
+
+def run(names=None, repeat=REPEAT, scale=1.0, group=None):
+    """
+    ({case name: result}, {case name: reason}) for the cases in group (every case by default) whose name
+    contains one of names, the second dict holding the cases skipped because their bytecode isn't supported
+    """
+    results = OrderedDict()
+    skipped = OrderedDict()
+    for name, (setup, ops, self_timed) in CASES.items():
+        if group and not name.startswith(group + '/'):
+            continue
+        if names and not any(selected in name for selected in names):
+            continue
+        ops = max(1, int(ops * scale))
+        timings = []
+        try:
+            for _ in range(repeat):
+                timed = setup(ops)
+                start = time.perf_counter()
+                elapsed = timed()
+                timings.append(elapsed if self_timed else time.perf_counter() - start)
+        except AssemblerBytecodeException as e:
+            skipped[name] = str(e)
+            continue
+        timings.sort()
+        results[name] = OrderedDict([('ops', ops), ('best', timings[0]), ('median', timings[len(timings) // 2]),
+                                     ('ns_per_op', timings[0] / ops * 1e9)])
+    return results, skipped
+
+
+def report(results, skipped, repeat):
+    return OrderedDict([('format', FORMAT_VERSION),
+                        ('python', platform.python_version()),
+                        ('implementation', platform.python_implementation()),
+                        ('platform', platform.platform()),
+                        ('repeat', repeat),
+                        ('results', results),
+                        ('skipped', skipped)])
+
+
+def compare(current, baseline, threshold=THRESHOLD):
+    """
+    (name, baseline ns/op, current ns/op, relative change) for the cases in both reports, and the names of
+    the ones that got slower by more than threshold.
+    """
+    rows = []
+    regressions = []
+    before = baseline['results']
+    for name, result in current['results'].items():
+        if name not in before:
+            continue
+        old, new = before[name]['ns_per_op'], result['ns_per_op']
+        change = new / old - 1
+        rows.append((name, old, new, change))
+        if change > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def main(argv=None, group=None):
+    """Command line of the suite, or of the cases of group when a benchmark module runs them alone"""
+    prog = 'python -m benchmarks.' + ('bench_' + group if group else 'suite')
+    parser = argparse.ArgumentParser(prog=prog, description=__doc__.split('\n\n')[0])
+    parser.add_argument('cases', nargs='*', help='run only the cases whose name contains one of these')
+    parser.add_argument('--output', help='write the results as JSON to this file, - for stdout')
+    parser.add_argument('--baseline', help='compare against the results in this JSON file')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='relative slowdown reported as a regression (default %(default)s)')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='runs per case (default %(default)s)')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply the operations of every case')
+    parser.add_argument('--list', action='store_true', help='list the cases and exit')
+    args = parser.parse_args(argv)
+
+    if group is None:
+        load_cases()
+    if args.list:
+        for name in CASES:
+            if not group or name.startswith(group + '/'):
+                print(name)
+        return 0
+    results, skipped = run(args.cases, args.repeat, args.scale, group)
+    current = report(results, skipped, args.repeat)
+    out = sys.stderr if args.output == '-' else sys.stdout
+    if args.output == '-':
+        json.dump(current, sys.stdout, indent=2)
+        print()
+    else:
+        print("{0:>32} {1:>10} {2:>14}".format('case', 'ops', 'ns/op'))
+        for name, result in current['results'].items():
+            print("{0:>32} {1:>10} {2:>14,.1f}".format(name, result['ops'], result['ns_per_op']))
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(current, f, indent=2)
+    for name, reason in skipped.items():
+        print("skipped {0}: {1}".format(name, reason), file=out)
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('python') != current['python']:
+        print("baseline ran on python {0}, this is {1}".format(baseline.get('python'), current['python']),
+              file=sys.stderr)
+    rows, regressions = compare(current, baseline, args.threshold)
+    print("\n{0:>32} {1:>14} {2:>14} {3:>8}".format('case', 'baseline ns/op', 'ns/op', 'change'), file=out)
+    for name, old, new, change in rows:
+        flag = ' !' if name in regressions else ''
+        print("{0:>32} {1:>14,.1f} {2:>14,.1f} {3:>+7.1%}{4}".format(name, old, new, change, flag), file=out)
+    if regressions:
+        print("\n{0} regression(s) over {1:.0%}: {2}".format(len(regressions), args.threshold,
+                                                           ', '.join(regressions)), file=out)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
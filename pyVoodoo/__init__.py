@@ -1,6 +1,44 @@
 __author__ = 'ernesto'
 
+import sys
+from importlib import import_module
+
 from .assemblerExceptions import AssemblerBytecodeException
 from .stackeffects import *
 from .assembler import *
 from .codedumper import *
+from .disassembler import *
+from .templates import *
+
+# the public names of these modules are imported on first access, they pull in hashlib, mmap,
+# concurrent.futures, ... which most uses of the package never need
+_lazy_modules = {
+    'codecache': ('CodeCache', 'CacheInfo', 'code_digest', 'code_cache'),
+    'pyc': ('MAGIC_NUMBER', 'pyc_header', 'dumps_pyc', 'write_pyc', 'PycCache', 'PycHeader', 'PycFile',
+            'read_pyc_header', 'loads_pyc', 'load_pyc', 'load_pycs'),
+    'batch': ('CompileResult', 'iter_sources', 'compile_source', 'compile_batch'),
+    'instrumentation': ('Counters', 'Timing', 'instrument', 'report', 'uninstrument'),
+    'ir': ('Node', 'Block', 'Instr', 'FlowGraph'),
+    'liveness': ('SlotAllocation', 'block_liveness', 'interference', 'reuse_slots'),
+    'linetable': ('LineTable', 'encode_lnotab', 'encode_linetable', 'encode_locations'),
+    'specializer': ('Specializer', 'specialize', 'specialize_function'),
+}
+_lazy_names = dict((name, module) for module, names in _lazy_modules.items() for name in names)
+
+
+def __getattr__(name):
+    # opcode tables (hasflow, ...) and opcode globals (LOAD_CONST, ...) are built on first access by assembler
+    if name in assembler._tables or name in assembler.opmap:
+        return getattr(assembler, name)
+    if name in _lazy_names:
+        value = globals()[name] = getattr(import_module('.' + _lazy_names[name], __name__), name)
+        return value
+    if name in _lazy_modules:
+        return import_module('.' + name, __name__)
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
+
+
+if sys.version_info < (3, 7):
+    # no module __getattr__ (PEP 562), import them up front
+    for _name in _lazy_names:
+        __getattr__(_name)
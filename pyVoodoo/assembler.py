@@ -1,3 +1,5 @@
+import functools
+import heapq
 import opcode
 from collections import OrderedDict
 import dis
@@ -8,12 +10,20 @@ from pyVoodoo.assemblerExceptions import *
 import sys
 import types
 from .flags import *
-from .utils import listify
+from .utils import is_hashable
+from .tables import ConstantPool, SymbolTable, InstructionIndex
+from .encoding import default_encoder
+from .labels import Label, relax_jumps, relocator
+from .peephole import PeepholeOptimizer
+from .disassembler import disassemble
 from .codedumper import *
-from .stackeffects import _se
+from .stackeffects import _se, StackHistory
+from .flowgraph import stack_depths
+from .linetable import LineTable
 
-__all__ = ['opmap', 'opname', 'opcodes', 'cmp_op', 'hasarg', 'hasname', 'hasjrel', 'hasjabs', 'hasjump', 'haslocal',
-           'hascompare', 'hasfree', 'hascode', 'hasflow', 'Opcode', 'Code', 'PythonParser']
+# the lazy opcode tables and opcode globals stay out of __all__, a star import would build them all, the
+# package forwards them to the module __getattr__ instead (before python 3.7 they are all built and exported)
+__all__ = ['opmap', 'opname', 'opcodes', 'cmp_op', 'Opcode', 'Code', 'Label', 'Persistor', 'PythonParser']
 
 
 class Opcode(tuple):
@@ -36,35 +46,71 @@ opmap = OrderedDict(sorted(raw_opmap.values()))
 opname = dict((code, name) for name, code in opmap.items())
 opcodes = set(opname)
 make_opcode = lambda code: Opcode((opname[code], code))
+EXTENDED_ARG = opcode.opmap['EXTENDED_ARG']
 
 # CMP
 cmp_op = opcode.cmp_op
 
 
-# make ops global
-def globalize_opcodes():
-    for name, code in opmap.items():
-        globals()[name] = code
-        __all__.append(name)
+def _opcode_set(codes):
+    return set(make_opcode(x) for x in codes if x in opname)
+
+
+def _build_stack_effects():
+    effects = [(0, 0)] * (max(opname) + 1)
+    for name, op in opmap.items():
+        # stack effects table from the _se class
+        effects[op] = getattr(_se, name, effects[op])
+    return effects
+
+
+# Opcode tables are built on first access through the module __getattr__ (or _table from inside the
+# module), importing pyVoodoo doesn't pay for the ones that are never used
+_tables = {
+    'hasnoargs': lambda: set(x for x in raw_opmap.values() if x.code() < opcode.HAVE_ARGUMENT),
+    'hasarg': lambda: set(x for x in raw_opmap.values() if x.code() >= opcode.HAVE_ARGUMENT),
+    'hasconst': lambda: _opcode_set(opcode.hasconst),
+    'hasname': lambda: _opcode_set(opcode.hasname),
+    'hasjrel': lambda: _opcode_set(opcode.hasjrel),
+    'hasjabs': lambda: _opcode_set(opcode.hasjabs),
+    'hasjump': lambda: _table('hasjrel') | _table('hasjabs'),
+    'hasunconditional': lambda: set(x for x in _table('hasjump')
+                                    if 'IF' not in x.opcode_name() and x.opcode_name().startswith('JUMP')),
+    'haslocal': lambda: _opcode_set(opcode.haslocal),
+    'hascompare': lambda: _opcode_set(opcode.hascompare),
+    'hasfree': lambda: _opcode_set(opcode.hasfree),
+    'hasflow': lambda: opcodes - set(opmap[name] for name in (
+        'CALL_FUNCTION', 'CALL_FUNCTION_VAR', 'CALL_FUNCTION_KW', 'CALL_FUNCTION_VAR_KW', 'BUILD_TUPLE',
+        'BUILD_LIST', 'UNPACK_SEQUENCE', 'BUILD_SLICE', 'RAISE_VARARGS', 'MAKE_FUNCTION', 'MAKE_CLOSURE')
+                                     if name in opmap),
+    'hascode': lambda: set(opmap[name] for name in ('MAKE_FUNCTION', 'MAKE_CLOSURE') if name in opmap),
+    'stack_effects': _build_stack_effects,
+}
+
+
+def _table(name):
+    try:
+        return globals()[name]
+    except KeyError:
+        table = globals()[name] = _tables[name]()
+        return table
+
 
+def __getattr__(name):
+    # opcodes are module globals too (LOAD_CONST, ...), materialized like the tables
+    if name in _tables:
+        return _table(name)
+    if name in opmap:
+        value = globals()[name] = opmap[name]
+        return value
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
 
-globalize_opcodes()
 
-hasnoargs = set(x for x in sorted(raw_opmap.values()) if x.code() < opcode.HAVE_ARGUMENT)
-hasarg = set(x for x in raw_opmap.values() if x.code() >= opcode.HAVE_ARGUMENT)
-hasconst = set(make_opcode(x) for x in opcode.hasconst)
-hasname = set(make_opcode(x) for x in opcode.hasname)
-hasjrel = set(make_opcode(x) for x in opcode.hasjrel)
-hasjabs = set(make_opcode(x) for x in opcode.hasjabs)
-hasjump = hasjrel.union(hasjabs)
-haslocal = set(make_opcode(x) for x in opcode.haslocal)
-hascompare = set(make_opcode(x) for x in opcode.hascompare)
-hasfree = set(make_opcode(x) for x in opcode.hasfree)
-hasflow = opcodes - set([CALL_FUNCTION, CALL_FUNCTION_VAR, CALL_FUNCTION_KW,
-                         CALL_FUNCTION_VAR_KW, BUILD_TUPLE, BUILD_LIST,
-                         UNPACK_SEQUENCE, BUILD_SLICE,
-                         RAISE_VARARGS, MAKE_FUNCTION, MAKE_CLOSURE])
-hascode = set([MAKE_FUNCTION, MAKE_CLOSURE])
+if sys.version_info < (3, 7):
+    # no module __getattr__ (PEP 562), build everything up front and export it with the rest
+    for _name in list(_tables) + list(opmap):
+        __getattr__(_name)
+        __all__.append(_name)
 
 
 def opcode_by_name(name):
@@ -74,25 +120,93 @@ def opcode_by_name(name):
         raise InexistentInstruction(e)
 
 
+_template = (lambda: None).__code__
+
+
 class Persistor(object):
+    """
+    Turns a Code into a real code object. The code object is cached on the Code and rebuilt only once
+    something new is emitted or one of the attributes it is made of changes.
+    """
+
     def to_code_type(self, instance):
         if not isinstance(instance, Code):
             raise PersistorException('Invalid instance type for {0}'.format(instance))
-        return types.CodeType(instance.co_argcount, \
-                              instance.co_nlocals, \
-                              instance.co_stacksize, \
-                              instance.co_flags, \
-                              instance.co_code, \
-                              instance.co_consts, \
-                              instance.co_names, \
-                              instance.co_varnames, \
-                              instance.co_filename, \
-                              instance.co_name, \
-                              instance.co_firstlineno, \
-                              instance.co_lnotab)
+        if instance._probe is not None:
+            return instance._probe.persist(self, instance)
+        return self._to_code_type(instance)
+
+    def _to_code_type(self, instance):
+        instance.resolve()
+        key = instance._code_key()
+        cached = instance._code_object
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        if instance.static_stack:
+            instance.compute_stack_size()
+            key = instance._code_key()
+        try:
+            code_object = self._build(instance)
+        except (TypeError, ValueError) as e:
+            raise PersistorException('Invalid code object for {0}: {1}'.format(instance.name, e))
+        instance._code_object = key, code_object
+        return code_object
+
+    def to_function(self, instance, globals=None, name=None, argdefs=None, closure=None):
+        return types.FunctionType(self.to_code_type(instance), {} if globals is None else globals,
+                                  name, argdefs, closure)
+
+    @staticmethod
+    def _fields(instance):
+        fields = dict(co_argcount=instance.argcount,
+                      co_kwonlyargcount=instance.kwonlyargcount,
+                      co_nlocals=len(instance.varnames),
+                      co_stacksize=instance.stacksize,
+                      co_flags=instance.flags,
+                      co_code=bytes(instance.code),
+                      co_consts=instance.consts.as_tuple(),
+                      co_names=instance.names.as_tuple(),
+                      co_varnames=instance.varnames.as_tuple(),
+                      co_filename=instance.filename,
+                      co_name=instance.name,
+                      co_firstlineno=instance.firstlineno,
+                      co_freevars=instance.freevars.as_tuple(),
+                      co_cellvars=instance.cellvars.as_tuple())
+        if sys.version_info >= (3, 8):
+            fields['co_posonlyargcount'] = instance.posonlyargcount
+        table = instance.lines.encode(len(instance.code), instance.firstlineno)
+        if sys.version_info >= (3, 10):
+            fields['co_linetable'] = table
+        else:
+            fields['co_lnotab'] = table
+        if sys.version_info >= (3, 11):
+            # try blocks live in co_exceptiontable there, Code has no table to carry and relocate
+            raise PersistorException("Python {0}.{1} code objects are not supported".format(*sys.version_info))
+        return fields
+
+    def _build(self, instance):
+        return self._build_fields(self._fields(instance))
+
+    @staticmethod
+    def _build_fields(fields):
+        # CodeType.replace doesn't check these, a non str name is a fatal error on python 3.8
+        for table in ('co_names', 'co_varnames', 'co_freevars', 'co_cellvars'):
+            for entry in fields[table]:
+                if not isinstance(entry, str):
+                    raise PersistorException('{0} entries must be strings, got {1!r}'.format(table, entry))
+        if hasattr(_template, 'replace'):
+            return _template.replace(**fields)
+        # python < 3.8 only has the positional constructor
+        return types.CodeType(*[fields[name] for name in (
+            'co_argcount', 'co_kwonlyargcount', 'co_nlocals', 'co_stacksize', 'co_flags', 'co_code',
+            'co_consts', 'co_names', 'co_varnames', 'co_filename', 'co_name', 'co_firstlineno', 'co_lnotab',
+            'co_freevars', 'co_cellvars')])
 
 
 class PythonParser(object):
+    # see instrumentation.instrument
+    _probe = None
+
     def _parse_from_py(self, file, debug=True):
         import py_compile
 
@@ -100,26 +214,25 @@ class PythonParser(object):
         return self._parse_from_pyc(fd, debug)
 
     def _parse_from_pyc(self, file, debug=True):
-        import time, struct
-
-        with open(file, 'rb') as fd:
-            magic = fd.read(4)
-            moddate = fd.read(4)
-            modtime = time.asctime(time.localtime(struct.unpack('I', moddate)[0]))
-            try:
-                code = marshal.load(fd)
-            # Add a comment to this line
-            except ValueError:
-                fd.seek(0)
-                fd.read(8)  # skip magic & date & file size; file size added in Python 3.3
-                file_size = fd.read(4)
-                if debug:
-                    print("magic {0}".format(binascii.hexlify(magic)))
-                    print("moddate {0} ({1})".format(binascii.hexlify(moddate), modtime))
-                    print("file size {0}".format(file_size))
-                code = marshal.load(fd)
+        import time
+        from .pyc import load_pyc
+
+        header, code = load_pyc(file)
+        if debug:
+            print("magic {0}".format(binascii.hexlify(header.magic)))
+            if header.mtime is not None:
+                print("moddate {0} ({1})".format(header.mtime, time.asctime(time.localtime(header.mtime))))
+            if header.size is not None:
+                print("file size {0}".format(header.size))
+            if header.source_hash is not None:
+                print("source hash {0}".format(binascii.hexlify(header.source_hash)))
         return code
 
+    def load_pycs(self, files):
+        """Load many .pyc files, yielding (path, header, code, error) records, see pyVoodoo.pyc.load_pycs"""
+        from .pyc import load_pycs
+        return load_pycs(files)
+
     def convertToAssemblerCode(self, file, debug=False):
         code_object = self._parse_from_py(file)
         return self.parse(code_object)
@@ -134,40 +247,102 @@ class PythonParser(object):
         code_object = self._parse_from_py(file, debug)
         PythonCodeDumper().dump(code_object)
 
-    def parse(self, code_object):
-        pass
+    def compile_batch(self, paths, workers=None, chunksize=16, max_pending=None):
+        """
+        Compile a directory tree or a list of files in memory across a process pool, yielding
+        (path, code, error) results as they finish, see pyVoodoo.batch.compile_batch
+        """
+        from .batch import compile_batch
+        return compile_batch(paths, workers, chunksize, max_pending)
 
+    def disassemble(self, code_object, recursive=False):
+        """Lazily decoded instructions of code_object, see pyVoodoo.disassembler.disassemble"""
+        return disassemble(code_object, recursive)
 
-def is_hashable(value):
-    try:
-        hash(value)
-    except TypeError:
-        return False
-    return True
+    def parse(self, code_object):
+        """
+        Code holding the bytecode, tables and attributes of code_object, ready to be inspected, optimized or
+        persisted again. Nested code objects stay in the constants, disassemble(..., recursive=True) walks
+        them lazily. The stack size past the end is unknown, mark a label before emitting more code.
+        """
+        if self._probe is not None:
+            return self._probe.parse(self, code_object)
+        return self._parse(code_object)
+
+    def _parse(self, code_object):
+        if getattr(code_object, 'co_exceptiontable', b''):
+            # its offsets would go stale as soon as the Code is edited, see Persistor._fields
+            raise AssemblerBytecodeException("{0} has an exception table, which isn't supported".format(
+                code_object.co_name))
+        code = Code()
+        code.argcount = code_object.co_argcount
+        code.posonlyargcount = getattr(code_object, 'co_posonlyargcount', 0)
+        code.kwonlyargcount = code_object.co_kwonlyargcount
+        code.stacksize = code_object.co_stacksize
+        code.flags = code_object.co_flags
+        code.filename = code_object.co_filename
+        code.name = code_object.co_name
+        code.firstlineno = code_object.co_firstlineno
+        code.consts = ConstantPool()
+        for table, entries in ((code.consts, code_object.co_consts), (code.names, code_object.co_names),
+                               (code.varnames, code_object.co_varnames), (code.freevars, code_object.co_freevars),
+                               (code.cellvars, code_object.co_cellvars)):
+            for entry in entries:
+                table.append(entry)
+        if hasattr(code_object, 'co_lines'):
+            # keeps the ranges without a line, findlinestarts skips them
+            code.lines.extend((start, line) for start, end, line in code_object.co_lines())
+        else:
+            code.lines.extend(dis.findlinestarts(code_object))
+        code.code[:] = code_object.co_code
+        code.index.rebuild(code.encoder.iter_offsets(code.code))
+        code.stack_unknown()
+        return code
 
 
 class Code(object):
-    def __init__(self):
+    # see instrumentation.instrument, instrumented Codes shadow it
+    _probe = None
+
+    def __init__(self, encoder=None, static_stack=False):
         self.argcount = 0
+        self.posonlyargcount = 0
+        self.kwonlyargcount = 0
         self.stacksize = 0
         self.flags = CO_OPTIMIZED | CO_NEWLOCALS
         self.filename = '<generated code>'
         self.name = '<lambda>'
         self.firstlineno = 0
-        self.freevars = ()
-        self.cellvars = ()
-        self.code = array('B')
-        self.consts = [None]
-        self.names = []
-        self.varnames = []
-        self.lnotab = array('B')
+        self.freevars = SymbolTable()
+        self.cellvars = SymbolTable()
+        self.encoder = encoder or default_encoder()
+        self.code = bytearray()
+        self.consts = ConstantPool([None])
+        self.names = SymbolTable()
+        self.varnames = SymbolTable()
         self.stacksize = 0
+        # source line of the instructions, see set_lineno
+        self.lines = LineTable()
 
         self.emit_bytecode = self.code.append
+        self.index = InstructionIndex()
         self.blocks = []
-        self.stack_history = []
+        self.fixups = []
+        self.stack_history = StackHistory()
+        # with static_stack the running stack count is only a check where it is known, stacksize comes from
+        # compute_stack_size when the code is persisted
+        self.static_stack = static_stack
+        # locals from temporary(), whose slots reuse_slots may share
+        self.temporaries = set()
 
         self._ss = 0
+        self._code_object = None
+
+    def _code_key(self):
+        # everything a finished code object is built from besides the bytecode, the tables only ever grow
+        return (self.argcount, self.posonlyargcount, self.kwonlyargcount, self.stacksize, self.flags,
+                self.filename, self.name, self.firstlineno, len(self.consts), len(self.names),
+                len(self.varnames), len(self.freevars), len(self.cellvars), len(self.lines))
 
     def _code_as_list(self):
         return list(self.code)
@@ -177,9 +352,7 @@ class Code(object):
             raise AssemblerBytecodeException("Stack underflow")
         if size > self.stacksize:
             self.stacksize = size
-        bytes = len(self.code) - len(self.stack_history) + 1
-        if bytes > 0:
-            self.stack_history.extend([self._ss] * bytes)
+        self.stack_history.record(len(self.code), self._ss)
         self._ss = size
 
     def get_stack_size(self):
@@ -187,123 +360,336 @@ class Code(object):
 
     stack_size = property(get_stack_size, set_stack_size)
 
+    def set_lineno(self, line):
+        """
+        Instructions emitted from here on come from source line (None for no line). Only the line changes are
+        recorded, the line table is encoded when the code object is built.
+        """
+        self.lines.record(len(self.code), line)
+        self._code_object = None
+
+    def lineno_at(self, offset):
+        """Source line of the instruction at offset, None where there is none"""
+        return self.lines.line_at(offset)
+
+    def stack_depth_at(self, offset):
+        """Stack depth on entry to the instruction at offset, None where it isn't known"""
+        if offset >= len(self.code):
+            return self._ss
+        return self.stack_history.depth_at(offset)
+
+    def max_stack_depth(self, start=0, end=None):
+        """Maximum stack depth at the instruction boundaries between the offsets start and end"""
+        depth = self.stack_history.max_depth(start, end)
+        if (end is None or end >= len(self.code)) and self._ss is not None:
+            depth = self._ss if depth is None else max(depth, self._ss)
+        return depth
+
     def to_bytecode_string(self):
+        self.resolve()
         return bytes(self.code)
 
+    def _opcode_offsets(self, op):
+        if not isinstance(op, int):
+            op = opcode_by_name(op)
+        return self.index.offsets(op)
+
     def find_first_opcode_index(self, op):
-        results = self.find_opcode_index(op)
-        return results[0]
+        offsets = self._opcode_offsets(op)
+        if not offsets:
+            raise InstructionNotFoundException("No {0} in the code".format(op))
+        return offsets[0]
 
-    @listify
     def find_opcode_index(self, op):
-        _op = op
-        if not isinstance(op, int):
-            _op = opcode_by_name(op)
-
-        i = 0
-        while i < len(self.code):
-            if self.code[i] == _op:
-                yield i
-            if self.code[i] < opcode.HAVE_ARGUMENT:  # 90, as mentioned earlier
-                i += 1
-            else:
-                i += 3
+        """Offsets of every instruction with opcode op, an opcode number or name"""
+        return list(self._opcode_offsets(op))
 
-    def emit_arg(self, op, arg):
-        """
-        Emit argument. Instructions up to python 3.6 are based in 16 bits bytecode instructions
+    def find_opcodes_index(self, *ops):
+        """Sorted offsets of every instruction whose opcode is one of ops"""
+        return list(heapq.merge(*[self._opcode_offsets(op) for op in ops]))
+
+    def count_opcode(self, op):
+        return len(self._opcode_offsets(op))
+
+    def instruction_offsets(self):
+        """Start offset of every instruction, EXTENDED_ARG prefixes included"""
+        return list(self.index.starts)
 
-            |--------------|--------------|
-            |    oparg     |    opcode    |
-            |--------------|--------------|
-            0              8              16
+    def _index_emitted(self, start, op):
+        # instructions emitted from start on are op and the EXTENDED_ARG prefixes it needed
+        last = len(self.code) - self.encoder.instruction_size(op)
+        add = self.index.add
+        while start < last:
+            add(start, EXTENDED_ARG)
+            start += self.encoder.prefix_size
+        add(last, op)
 
-        if bytecode is more than 0xFFFF, then the argument actually takes more than just one byte, and we need to split into two bytes instead
+    def emit_arg(self, op, arg):
+        """
+        Emit an instruction with its argument in the format of self.encoder: 2 byte wordcode from python 3.6
+        on, 3 byte instructions before. Arguments that don't fit get the EXTENDED_ARG prefixes they need.
         """
         if not isinstance(op, int):
             op = opcode_by_name(op)
+        self._code_object = None
+        start = len(self.code)
+        self.encoder.emit(self.code, op, arg)
+        self._index_emitted(start, op)
 
-        emit = self.emit_bytecode
-        if arg > 0xFFFF:  # oparg is more than just one byte lenght
-            emit(opcode.EXTENDED_ARG)
-            emit((arg >> 16) & 255)
-            emit((arg >> 24) & 255)
-        emit(op)
-        emit(arg & 255)  # little endian stuff
-        emit((arg >> 8) & 255)
+    def emit_op(self, op):
+        """Emit an instruction that takes no argument"""
+        if not isinstance(op, int):
+            op = opcode_by_name(op)
+        self._code_object = None
+        self.index.add(len(self.code), op)
+        self.encoder.emit_op(self.code, op)
+
+    def emit(self, op, arg=None):
+        """
+        Emit op, an opcode number or name, through its precomputed emit record: arg is a constant, a name, a
+        local, a cell or free variable name, a jump address (see jump) or a raw oparg depending on op, and
+        is ignored for opcodes without argument. Unlike LOAD_FAST, locals are allocated on first use.
+        Returns the target label of jumps.
+        """
+        record = _emit_records.get(op) or _emit_record(op)
+        op, pops, pushes, kind, ends = record
+
+        ss = self._ss
+        if ss is None and not self.static_stack:
+            raise CodeTypeException("Unknown stack size at this location")
+        if kind == ARG_CONST:
+            arg = self.consts.add(arg)
+        elif kind == ARG_NAME:
+            arg = self.names.add(arg)
+        elif kind == ARG_LOCAL:
+            if not self.flags & CO_OPTIMIZED:
+                raise AssertionError("co_flags must include CO_OPTIMIZED to use fast locals")
+            arg = self.varnames.add(arg)
+        elif kind == ARG_FREE:
+            arg = self.deref_slot(arg)
+        code = self.code
+        if ss is not None:
+            if pops is None:
+                pops, pushes = _dynamic_effect(op, arg if kind == ARG_RAW else 0, kind)
+            if ss < pops:
+                raise AssemblerBytecodeException("Stack underflow")
+            self.stack_history.record(len(code), ss)
+            ss += pushes - pops
+            if ss > self.stacksize:
+                self.stacksize = ss
+            self._ss = ss
+
+        if kind == ARG_JUMP:
+            return self.jump(op, arg)
+        self._code_object = None
+        start = len(code)
+        encoder = self.encoder
+        if kind == ARG_NONE:
+            self.index.add(start, op)
+            encoder.emit_op(code, op)
+            if ends:
+                self._ss = None
+        elif encoder.wordcode and 0 <= arg <= 0xFF:
+            code.extend((op, arg))
+            self.index.add(start, op)
+        else:
+            encoder.emit(code, op, arg)
+            self._index_emitted(start, op)
+
+    def _oparg(self, kind, arg):
+        if kind == ARG_CONST:
+            return self.consts.add(arg)
+        if kind == ARG_NAME:
+            return self.names.add(arg)
+        if kind == ARG_LOCAL:
+            if not self.flags & CO_OPTIMIZED:
+                raise AssertionError("co_flags must include CO_OPTIMIZED to use fast locals")
+            return self.varnames.add(arg)
+        if kind == ARG_FREE:
+            return self.deref_slot(arg)
+        return arg
+
+    def emit_many(self, instructions):
+        """
+        Emit many instructions at once: (op, arg) pairs taken like the arguments of emit, jump args being
+        labels or raw ints, or an array of interleaved opcode numbers and raw opargs. Stack effects are checked
+        in one pass, the code is then extended in a single operation. If an instruction is refused nothing is
+        written: the constants, names and variables allocated on the way are dropped again.
+        """
+        tables = (self.consts, self.names, self.varnames, self.cellvars, self.freevars)
+        sizes = [len(table) for table in tables]
+        labels = []
+        try:
+            self._emit_many(instructions, labels)
+        except Exception:
+            for table, size in zip(tables, sizes):
+                table.truncate(size)
+            for label in labels:
+                label.stack_size = None
+            raise
+
+    def _emit_many(self, instructions, labels):
+        raw = isinstance(instructions, array)
+        if raw:
+            instructions = zip(instructions[::2], instructions[1::2])
+        encoder = self.encoder
+        wordcode = encoder.wordcode
+        start = len(self.code)
+        buf = bytearray()
+        depths = []
+        fixups = []
+        ss = self._ss
+        stacksize = self.stacksize
+        add_const = self.consts.add
+        add_name = self.names.add
+        for op, arg in instructions:
+            op, pops, pushes, kind, ends = _emit_records.get(op) or _emit_record(op)
+            if ss is None and not self.static_stack:
+                raise CodeTypeException("Unknown stack size at this location")
+            label = None
+            if raw or kind == ARG_RAW or kind == ARG_NONE:
+                pass
+            elif kind == ARG_CONST:
+                arg = add_const(arg)
+            elif kind == ARG_NAME:
+                arg = add_name(arg)
+            elif kind == ARG_JUMP and not isinstance(arg, int):
+                if not isinstance(arg, Label):
+                    raise AssemblerBytecodeException("{0} needs a label or an int, got {1!r}".format(opname[op], arg))
+                label, arg = arg, 0
+            else:
+                arg = self._oparg(kind, arg)
+            offset = len(buf)
+            depths.append((offset, ss))
+            if ss is not None:
+                if pops is None:
+                    pops, pushes = _dynamic_effect(op, arg if kind == ARG_RAW or raw else 0, kind)
+                if ss < pops:
+                    raise AssemblerBytecodeException("Stack underflow")
+                ss += pushes - pops
+                if ss > stacksize:
+                    stacksize = ss
+            if label is not None:
+                if label.stack_size is None:
+                    label.stack_size = ss
+                    labels.append(label)
+                fixups.append((start + offset, op, label))
+            if kind == ARG_NONE:
+                encoder.emit_op(buf, op)
+            elif wordcode and 0 <= arg <= 0xFF:
+                buf.extend((op, arg))
+            else:
+                encoder.emit(buf, op, arg)
+            if ends:
+                ss = None
+        self._extend_code(buf, depths, ss, stacksize)
+        self.fixups.extend(fixups)
+
+    def emit_encoded(self, buffer):
+        """
+        Append instructions already encoded in the format of self.encoder, opargs being slots of this Code's
+        tables and jump arguments final. Opcodes, table slots and stack effects are checked in one pass first,
+        past a block ending instruction the stack size is unknown and no longer checked.
+        """
+        limits = {ARG_CONST: len(self.consts), ARG_NAME: len(self.names), ARG_LOCAL: len(self.varnames),
+                  ARG_FREE: len(self.cellvars) + len(self.freevars)}
+        depths = []
+        ss = self._ss
+        stacksize = self.stacksize
+        try:
+            for offset, op, arg, end in self.encoder.iter_instructions(memoryview(buffer)):
+                op, pops, pushes, kind, ends = _emit_records.get(op) or _emit_record(op)
+                if kind in limits and arg >= limits[kind]:
+                    raise AssemblerBytecodeException("{0} at {1} refers to slot {2} past the end of its table".format(
+                        opname[op], offset, arg))
+                depths.append((offset, ss))
+                if ss is None:
+                    continue
+                if pops is None:
+                    pops, pushes = _dynamic_effect(op, arg, kind)
+                if ss < pops:
+                    raise AssemblerBytecodeException("Stack underflow at {0}".format(offset))
+                ss += pushes - pops
+                if ss > stacksize:
+                    stacksize = ss
+                if ends:
+                    ss = None
+        except IndexError:
+            raise AssemblerBytecodeException("Truncated instruction buffer")
+        self._extend_code(buffer, depths, ss, stacksize)
+
+    def _extend_code(self, buf, depths, ss, stacksize):
+        # commit a block of instructions checked by emit_many or emit_encoded, depths being the relative
+        # offset and entry depth of every instruction
+        code = self.code
+        start = len(code)
+        code += buf
+        self.index.extend((start + offset, op) for offset, op in self.encoder.iter_offsets(memoryview(buf)))
+        self.stack_history.extend((start + offset, depth) for offset, depth in depths)
+        self.stacksize = stacksize
+        self._ss = ss
+        self._code_object = None
 
     # Instructions...
     def LOAD_CONST(self, const):
         self.stackchange(_se.LOAD_CONST)
-        pos = 0
-        hashable = is_hashable(const)
-        while 1:
-            try:
-                arg = self.consts.index(const, pos)
-                it = self.consts[arg]
-            except ValueError:
-                arg = len(self.consts)
-                self.consts.append(const)
-                break
-            else:
-                if type(it) is type(const) and (hashable or it is const):
-                    break
-            pos = arg + 1
-            continue
-        return self.emit_arg('LOAD_CONST', arg)
+        return self.emit_arg('LOAD_CONST', self.consts.add(const))
 
     def RETURN_VALUE(self):
         self.stackchange(_se.RETURN_VALUE)
-        self.emit_bytecode(opmap['RETURN_VALUE'])
+        self.emit_op(opmap['RETURN_VALUE'])
         self.stack_unknown()
 
     def LOAD_FAST(self, const_name):
         self.stackchange(_se.LOAD_FAST)
-        try:
-            arg = self.varnames.index(const_name)
-        except ValueError:
+        arg = self.varnames.get(const_name)
+        if arg is None:
             self.STORE_FAST(const_name)
             arg = self.varnames.index(const_name)
 
         self.emit_arg('LOAD_FAST', arg)
 
-    LOAD_DEREF = LOAD_FAST
-
     def STORE_FAST(self, const_name):
         self.stackchange(_se.STORE_FAST)
-        try:
-            arg = self.varnames.index(const_name)
-        except ValueError:
-            arg = len(self.varnames)
-            self.varnames.append(const_name)
-        self.emit_arg('STORE_FAST', arg)
+        self.emit_arg('STORE_FAST', self.varnames.add(const_name))
+
+    def deref_slot(self, name):
+        """
+        Slot of a cell or free variable as used by the *_DEREF and LOAD_CLOSURE opcodes: cellvars come first,
+        freevars are numbered after them. Unknown names are allocated as freevars, so every cellvar has to be
+        declared before the first freevar is referenced.
+        """
+        arg = self.cellvars.get(name)
+        if arg is None:
+            arg = len(self.cellvars) + self.freevars.add(name)
+        return arg
 
     def YIELD_VALUE(self):
         self.stackchange(_se.YIELD_VALUE)
-        self.co_flags |= CO_GENERATOR
-        return self.emit(opmap['YIELD_VALUE'])
+        self.flags |= CO_GENERATOR
+        return self.emit_op(opmap['YIELD_VALUE'])
 
     def stackchange(self, *tuple_mod):
         (inputs, outputs) = tuple_mod[0]
         if self._ss is None:
+            if self.static_stack:
+                return
             raise CodeTypeException("Unknown stack size at this location")
         self.stack_size -= inputs
         self.stack_size += outputs
 
-    def CALL_FUNCTION(self, argc=0, kwargc=0, op=opmap['CALL_FUNCTION'], extra=0):
+    def CALL_FUNCTION(self, argc=0, kwargc=0, op='CALL_FUNCTION', extra=0):
         self.stackchange((1 + argc + 2 * kwargc + extra, 1))
-        self.emit(op)
-        self.emit(argc)
-        self.emit(kwargc)
+        self.emit_arg(op, (kwargc << 8) | argc)
 
     def CALL_FUNCTION_VAR(self, argc=0, kwargc=0):
-        self.CALL_FUNCTION(argc, kwargc, opmap['CALL_FUNCTION_VAR'], 1)  # 1 for *args
+        self.CALL_FUNCTION(argc, kwargc, 'CALL_FUNCTION_VAR', 1)  # 1 for *args
 
     def CALL_FUNCTION_KW(self, argc=0, kwargc=0):
-        self.CALL_FUNCTION(argc, kwargc, opmap['CALL_FUNCTION_KW'], 1)  # 1 for **kw
+        self.CALL_FUNCTION(argc, kwargc, 'CALL_FUNCTION_KW', 1)  # 1 for **kw
 
     def CALL_FUNCTION_VAR_KW(self, argc=0, kwargc=0):
-        self.CALL_FUNCTION(argc, kwargc, opmap['CALL_FUNCTION_VAR_KW'], 2)  # 2 *args,**kw
+        self.CALL_FUNCTION(argc, kwargc, 'CALL_FUNCTION_VAR_KW', 2)  # 2 *args,**kw
 
     def ROT_FOUR(self, count):
         """
@@ -352,17 +738,150 @@ class Code(object):
         self.stackchange((argc, 0))
         self.emit_arg('RAISE_VARARGS', argc)
 
+    def label(self):
+        """Create an unbound label, to be used as jump target and bound later with mark"""
+        return Label()
+
+    def mark(self, label=None):
+        """
+        Bind label (a new one if None) to the current position. When the stack size is unknown here, e.g.
+        right after a RETURN_VALUE or an unconditional jump, it is taken from the jumps to the label.
+        """
+        if label is None:
+            label = Label()
+        if label.bound:
+            raise AssemblerBytecodeException("{0!r} is already bound".format(label))
+        label.offset = len(self.code)
+        label.fixups = len(self.fixups)
+        if self._ss is None:
+            self._ss = label.stack_size
+        elif label.stack_size is None:
+            label.stack_size = self._ss
+        self.blocks.append(label)
+        return label
+
+    def jump(self, op, address=None):
+        """
+        Emit jump op to address and return its target label. address can be a Label, bound or not, None to
+        create a new label for a forward jump, or an int taken as the already encoded jump argument.
+        """
+        if not isinstance(op, int):
+            op = opcode_by_name(op)
+        if isinstance(address, int):
+            self.emit_arg(op, address)
+            return address
+
+        label = Label() if address is None else address
+        if label.stack_size is None:
+            label.stack_size = self._ss
+        self.fixups.append((len(self.code), op, label))
+        self.emit_arg(op, 0)
+        if (opname[op], op) in _table('hasunconditional'):
+            self.stack_unknown()
+        return label
+
+    def resolve(self):
+        """
+        Patch the arguments of every pending jump. Jumps whose argument doesn't fit get EXTENDED_ARG prefixes,
+        the widths are picked first (see relax_jumps) so the code and the offsets recorded for it are shifted
+        in a single pass.
+        """
+        fixups = self.fixups
+        if not fixups:
+            return
+        for offset, op, label in fixups:
+            if not label.bound:
+                raise AssemblerBytecodeException("{0} at {1} jumps to an unbound label".format(opname[op], offset))
+
+        encoder = self.encoder
+        patches, shifts = relax_jumps(encoder, fixups)
+        code = self.code
+        new_code = bytearray()
+        prev = 0
+        for (offset, op, label), (arg, prefixes) in zip(fixups, patches):
+            new_code += code[prev:offset]
+            encoder.emit_padded(new_code, op, arg, prefixes)
+            prev = offset + encoder.instruction_size(op)
+        new_code += code[prev:]
+
+        code[:] = new_code
+        self.index.rebuild(encoder.iter_offsets(code))
+        move = relocator(fixups, shifts)
+        self.stack_history.relocate(move)
+        self.lines.relocate(move)
+        for label in self.blocks:
+            label.offset += shifts[label.fixups]
+            label.fixups = 0
+        del fixups[:]
+
+    def optimize(self):
+        """Rewrite the code with the peephole optimizer, returns it with the before/after instruction counts"""
+        self._code_object = None
+        return PeepholeOptimizer(self).optimize()
+
+    def to_code_type(self):
+        """Finished code object, cached until the code changes"""
+        return Persistor().to_code_type(self)
+
+    def to_function(self, globals=None, name=None, argdefs=None, closure=None):
+        return Persistor().to_function(self, globals, name, argdefs, closure)
+
+    def compute_stack_size(self, strict=True):
+        """
+        Set stacksize from a control flow analysis of the finished code (see flowgraph.stack_depths) rather
+        than from the running count, and return the analysis. With strict set, stack underflows and blocks
+        reached at different depths outside of exception handlers raise CodeTypeException.
+        """
+        self.resolve()
+        analysis = stack_depths(self.code, self.encoder)
+        if strict:
+            if analysis.underflows:
+                raise CodeTypeException("Stack underflow at {0}".format(analysis.underflows[0]))
+            for merge in analysis.merges:
+                if not merge.handler:
+                    raise CodeTypeException("Inconsistent stack depth at {0}: {1} and {2} coming from {3}".format(
+                        merge.offset, merge.depth, merge.other, merge.source))
+        self.stacksize = analysis.max_depth
+        return analysis
+
+    def temporary(self, prefix='_tmp'):
+        """New local for a short lived value, reuse_slots may share its slot with other temporaries"""
+        name = '{0}{1}'.format(prefix, len(self.varnames))
+        while name in self.varnames:
+            name += '_'
+        self.varnames.add(name)
+        self.temporaries.add(name)
+        return name
+
+    def reuse_slots(self, temporaries=None):
+        """Share the slots of temporaries never live at the same time, see liveness.reuse_slots"""
+        from .liveness import reuse_slots
+        return reuse_slots(self, temporaries)
+
+    def specialize(self, known):
+        """New Code specialized for known, a dict of argument name -> value, see specializer.Specializer"""
+        from .specializer import specialize
+        return specialize(self, known)
+
+    def freeze(self):
+        """Template of this code, see templates.Template"""
+        from .templates import Template
+        return Template(self)
+
     def stack_unknown(self):
         self._ss = None
 
     def __getattr__(self, name):
-        def _missing(*args, **kwargs):
-            message = "A missing method was called\r\n"
-            message += "The object was {0}, the method was {1} \r\n".format(self, name)
-            message += "It was called with {0} and {1} as arguments\r\n".format(args, kwargs)
-            raise AssemblerBytecodeException(message)
+        if name in opmap:
+            return _opcode_method(name).__get__(self, Code)
+        return functools.partial(_missing, self, name)
+
 
-        return _missing
+def _missing(code, name, *args, **kwargs):
+    message = "A missing method was called\r\n"
+    message += "The object was {0}, the method was {1} \r\n".format(code, name)
+    message += "It was called with {0} and {1} as arguments\r\n".format(args, kwargs)
+    raise AssemblerBytecodeException(message)
 
 
 def with_name(f, name):
@@ -375,62 +894,66 @@ def with_name(f, name):
         )
 
 
-# stack effects allocation
-stack_effects = [(0, 0)] * 256
-
-for name in opname.values():
-    op = opmap[name]
-    name = name.replace('+', '_')
-
-    if hasattr(_se, name):
-        # update stack effects table from the _se class
-        stack_effects[op] = getattr(_se, name)
-
-    if not hasattr(Code, opname[op]):
-
-        # Create default method for Code class
-        if op >= opcode.HAVE_ARGUMENT:
-            def do_op(self, arg, op=op, se=stack_effects[op]):
-                self.stackchange(se)
-                self.emit_arg(op, arg)
-        else:
-            def do_op(self, op=op, se=stack_effects[op]):
-                self.stackchange(se)
-                self.emit(op)
-
-        setattr(Code, name, with_name(do_op, name))
-
-        if (name, op) in hasnoargs:
-            def treat_noargument(self, opname=name):
-                op = opmap[opname]
-                self.stackchange(stack_effects[op])
-                self.emit_bytecode(op)
-
-
-            setattr(Code, name, treat_noargument)
-
-        if (name, op) in haslocal:
-            def do_local(self, varname, op=op):
-                if not self.co_flags & CO_OPTIMIZED:
-                    raise AssertionError(
-                        "co_flags must include CO_OPTIMIZED to use fast locals"
-                    )
-                self.stackchange(stack_effects[op])
-                try:
-                    arg = self.co_varnames.index(varname)
-                except ValueError:
-                    arg = len(self.co_varnames)
-                    self.co_varnames.append(varname)
-                self.emit_arg(op, arg)
-
-
-            setattr(Code, name, with_name(do_local, opname[op]))
-
-        if (name, op) in hasjrel | hasjabs:
-            def do_jump(self, address=None, op=op):
-                self.stackchange(stack_effects[op])
-                return self.jump(op, address)
-
-
-            setattr(Code, name, with_name(do_jump, opname[op]))
-            # TODO: PRINT_EXPR should be separated in a separate method, the syntax should be handled in other way different
+# argument kinds of emit records: how Code.emit turns its arg into the oparg
+ARG_NONE, ARG_RAW, ARG_CONST, ARG_NAME, ARG_LOCAL, ARG_FREE, ARG_JUMP = range(7)
+
+_emit_records = {}
+
+
+def _emit_record(op):
+    """
+    (opcode, pops, pushes, argument kind, ends block) of op, an opcode number or name, computed once per
+    opcode. pops is None for opcodes whose stack effect depends on their argument, dis.stack_effect gives
+    it at emission. The stack size is unknown after opcodes ending a block (returns, unconditional jumps).
+    """
+    name = op if isinstance(op, str) else opname.get(op)
+    if name not in opmap:
+        raise InexistentInstruction(op)
+    code = opmap[name]
+    key = (name, code)
+    if key in _table('hasjrel') or key in _table('hasjabs'):
+        kind = ARG_JUMP
+    elif key in _table('hasfree'):
+        kind = ARG_FREE
+    elif key in _table('hasname'):
+        kind = ARG_NAME
+    elif key in _table('haslocal'):
+        kind = ARG_LOCAL
+    elif key in _table('hasconst'):
+        kind = ARG_CONST
+    elif code >= opcode.HAVE_ARGUMENT:
+        kind = ARG_RAW
+    else:
+        kind = ARG_NONE
+    pops, pushes = getattr(_se, name, (None, None))
+    ends = name == 'RETURN_VALUE' or key in _table('hasunconditional')
+    record = _emit_records[name] = _emit_records[code] = (code, pops, pushes, kind, ends)
+    return record
+
+
+def _dynamic_effect(op, arg, kind):
+    try:
+        effect = dis.stack_effect(op) if kind == ARG_NONE else dis.stack_effect(op, arg)
+    except ValueError:
+        # opcodes dis doesn't know the effect of (e.g. NOP on 3.6), like the _se defaults
+        effect = 0
+    return (-effect, 0) if effect < 0 else (0, effect)
+
+
+def _opcode_method(name):
+    """Default Code method emitting opcode name, built the first time a Code looks it up"""
+    op, pops, pushes, kind, ends = _emit_record(name)
+
+    if kind == ARG_JUMP:
+        def method(self, address=None):
+            return self.emit(op, address)
+    elif kind == ARG_NONE:
+        def method(self):
+            self.emit(op)
+    else:
+        def method(self, arg):
+            self.emit(op, arg)
+
+    method = with_name(method, name)
+    setattr(Code, name, method)
+    return method
@@ -0,0 +1,95 @@
+import marshal
+import os
+from collections import namedtuple
+from itertools import islice
+
+__all__ = ['CompileResult', 'iter_sources', 'compile_source', 'compile_batch']
+
+CompileResult = namedtuple('CompileResult', 'path code error')
+
+
+def iter_sources(paths):
+    """Lazily yield the .py files under paths, a file, a directory or an iterable of both"""
+    if isinstance(paths, (str, bytes, os.PathLike)):
+        paths = [paths]
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.endswith('.py'):
+                    yield os.path.join(root, name)
+
+
+def compile_source(path, optimize=-1):
+    """Compile the module at path in memory, no .pyc is written"""
+    with open(path, 'rb') as f:
+        source = f.read()
+    return compile(source, path, 'exec', dont_inherit=True, optimize=optimize)
+
+
+def _compile_chunk(paths, optimize):
+    # runs in the workers: code objects don't pickle, they travel marshalled
+    results = []
+    for path in paths:
+        try:
+            results.append((path, marshal.dumps(compile_source(path, optimize)), None))
+        except Exception as e:
+            results.append((path, None, e))
+    return results
+
+
+def _results(chunk):
+    for path, data, error in chunk:
+        yield CompileResult(path, None if data is None else marshal.loads(data), error)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def compile_batch(paths, workers=None, chunksize=16, max_pending=None, optimize=-1):
+    """
+    Compile every source under paths across a pool of workers processes (os.cpu_count() by default, 1 to
+    compile in this process) and yield a CompileResult per file as soon as its chunk is done, in completion
+    order. Failures don't stop the batch, they are reported in the error of their result.
+
+    Files are sent to the workers chunksize at a time and at most max_pending chunks (twice the workers by
+    default) are in flight, so memory stays bounded however many files there are.
+    """
+    chunks = _chunks(iter_sources(paths), chunksize)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for chunk in chunks:
+            for result in _results(_compile_chunk(chunk, optimize)):
+                yield result
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+    max_pending = max_pending or 2 * workers
+    with ProcessPoolExecutor(workers) as pool:
+        pending = set()
+        try:
+            for chunk in chunks:
+                pending.add(pool.submit(_compile_chunk, chunk, optimize))
+                if len(pending) < max_pending:
+                    continue
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for result in _results(future.result()):
+                        yield result
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for result in _results(future.result()):
+                        yield result
+        finally:
+            for future in pending:
+                future.cancel()
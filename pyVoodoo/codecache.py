@@ -0,0 +1,182 @@
+import hashlib
+import struct
+import threading
+import types
+import weakref
+from collections import OrderedDict, namedtuple
+
+from .assembler import Persistor, _template
+
+__all__ = ['CodeCache', 'CacheInfo', 'code_digest', 'code_cache']
+
+CacheInfo = namedtuple('CacheInfo', 'hits misses evictions maxsize currsize')
+
+
+# what a nested code object is made of, co_lnotab being derived from co_linetable from python 3.10 on
+_CODE_FIELDS = ('co_argcount', 'co_posonlyargcount', 'co_kwonlyargcount', 'co_nlocals', 'co_stacksize',
+                'co_flags', 'co_code', 'co_consts', 'co_names', 'co_varnames', 'co_freevars', 'co_cellvars',
+                'co_filename', 'co_name', 'co_firstlineno',
+                'co_linetable' if hasattr(_template, 'co_linetable') else 'co_lnotab')
+
+
+_header = struct.Struct('<cQ').pack
+_int64 = struct.Struct('<cq').pack
+_float = struct.Struct('<cd').pack
+_complex = struct.Struct('<cdd').pack
+
+
+def _encode(value, out):
+    """
+    Append a canonical encoding of value to the list out: a type tag then the value, strings as length
+    prefixed utf-8, numbers and bytes as raw bytes, containers item by item. Unlike marshal it doesn't depend
+    on interning or reference counts, so equal values built differently encode the same.
+    """
+    kind = type(value)
+    if kind is str:
+        data = value.encode('utf-8', 'surrogatepass')
+        out += (_header(b's', len(data)), data)
+    elif kind is tuple:
+        out.append(_header(b'(', len(value)))
+        for item in value:
+            if type(item) is str:
+                data = item.encode('utf-8', 'surrogatepass')
+                out += (_header(b's', len(data)), data)
+            else:
+                _encode(item, out)
+    elif kind is int:
+        if -1 << 63 <= value < 1 << 63:
+            out.append(_int64(b'i', value))
+        else:
+            data = value.to_bytes(value.bit_length() // 8 + 1, 'little', signed=True)
+            out += (_header(b'I', len(data)), data)
+    elif kind is bytes:
+        out += (_header(b'b', len(value)), value)
+    elif value is None or value is Ellipsis:
+        out.append(b'N' if value is None else b'.')
+    elif kind is bool:
+        out.append(b'T' if value else b'F')
+    elif kind is float:
+        out.append(_float(b'f', value))
+    elif kind is complex:
+        out.append(_complex(b'c', value.real, value.imag))
+    elif kind is frozenset:
+        # iteration order depends on how the set was built, sort the encoded items
+        items = []
+        for item in value:
+            encoded = []
+            _encode(item, encoded)
+            items.append(b''.join(encoded))
+        out.append(_header(b'{', len(items)))
+        out += sorted(items)
+    elif kind is types.CodeType:
+        out.append(b'C')
+        for name in _CODE_FIELDS:
+            _encode(getattr(value, name, None), out)
+    else:
+        # anything else only matches the very same object, the cached code keeps it alive so the id can't be
+        # reused while the entry lives
+        out.append(_header(b'\0', id(value)))
+
+
+def code_digest(instance):
+    """
+    Digest of everything the code object of instance is made of: bytecode, constant pool, symbol tables,
+    flags, argument counts and names. Structurally identical Code instances share it.
+    """
+    instance.resolve()
+    fields = Persistor._fields(instance)
+    out = []
+    for name in sorted(fields):
+        _encode(name, out)
+        _encode(fields[name], out)
+    return hashlib.blake2b(b''.join(out), digest_size=20).digest()
+
+
+class CodeCache(object):
+    """
+    Process wide cache of finished code objects and functions keyed by code_digest, so a Code structurally
+    identical to one seen before gets the already built object instead of being finalized again.
+
+    Holds up to maxsize entries (None for no bound) and evicts the least recently used one past that. With
+    weak=True entries are only weakly referenced and go away once nothing else uses them.
+    """
+
+    def __init__(self, maxsize=256, weak=False, persistor=None):
+        self.maxsize = maxsize
+        self.weak = weak
+        self.persistor = persistor or Persistor()
+        self.hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value = entry() if self.weak else entry
+                if value is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def _store(self, key, value):
+        with self._lock:
+            if self.weak:
+                entries = self._entries
+
+                def discard(ref, key=key):
+                    with self._lock:
+                        if entries.get(key) is ref:
+                            del entries[key]
+
+                entry = weakref.ref(value, discard)
+            else:
+                entry = value
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            if self.maxsize is not None:
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def _code_type(self, instance, digest):
+        code_object = self._lookup(digest)
+        if code_object is None:
+            return self._store(digest, self.persistor.to_code_type(instance))
+        instance._code_object = instance._code_key(), code_object
+        return code_object
+
+    def code_type(self, instance):
+        """Code object for instance, shared with every structurally identical Code"""
+        return self._code_type(instance, code_digest(instance))
+
+    def function(self, instance, globals=None):
+        """
+        Function for instance. The function is shared by every identical Code asking for the same globals
+        dict, or for none.
+        """
+        digest = code_digest(instance)
+        key = digest, None if globals is None else id(globals)
+        function = self._lookup(key)
+        if function is None:
+            code_object = self._code_type(instance, digest)
+            function = self._store(key, types.FunctionType(code_object, {} if globals is None else globals))
+        return function
+
+    def info(self):
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+code_cache = CodeCache()
@@ -1,3 +1,46 @@
+import binascii
+import dis
+import types
+from collections import deque
+
+from .disassembler import disassemble
+
+__all__ = ['PythonCodeDumper']
+
+HEX_CHUNK = 4096
+BUFFER_SIZE = 1 << 16
+
+
+def _hex_chunks(data, size=HEX_CHUNK):
+    view = memoryview(data)
+    for i in range(0, len(view), size):
+        yield binascii.hexlify(view[i:i + size]).decode('ascii')
+
+
+class _BufferedWriter(object):
+    """Collects text and writes it to a text or binary stream buffer_size characters at a time"""
+
+    def __init__(self, stream, buffer_size=BUFFER_SIZE):
+        self.stream = stream
+        self.binary = not hasattr(stream, 'encoding')
+        self.buffer_size = buffer_size
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            data = ''.join(self.parts)
+            self.stream.write(data.encode('utf-8') if self.binary else data)
+            self.parts = []
+            self.size = 0
+
+
 class PythonCodeDumper(object):
     def dump(self, code_object, indent=''):
         print("%scode" % indent)
@@ -24,10 +67,84 @@ class PythonCodeDumper(object):
         self.show_hex("lnotab", code_object.co_lnotab, indent=indent)
 
     def show_hex(self, label, h, indent):
-        h = binascii.hexlify(h)
-        if len(h) < 60:
-            print("%s%s %s" % (indent, label, h))
+        if len(h) < 30:
+            print("%s%s %s" % (indent, label, binascii.hexlify(h)))
         else:
             print("%s%s" % (indent, label))
-            for i in range(0, len(h), 60):
-                print("%s   %s" % (indent, h[i:i + 60]))
+            for chunk in _hex_chunks(h, 30):
+                print("%s   %s" % (indent, chunk))
+
+    def records(self, code_object, instructions=False):
+        """
+        Yield a dict per code object, code_object first and then the nested ones breadth first without
+        recursion. Every record has an id and the id of its parent, nested code objects show up in consts as
+        {"code": id}, other constants as their repr. Bytecode and lnotab are kept as bytes, with instructions
+        set the decoded (offset, opname, arg, argval repr) are included.
+        """
+        pending = deque([(code_object, None)])
+        next_id = 1
+        current = 0
+        while pending:
+            code_object, parent = pending.popleft()
+            consts = []
+            for const in code_object.co_consts:
+                if isinstance(const, types.CodeType):
+                    consts.append({'code': next_id})
+                    pending.append((const, current))
+                    next_id += 1
+                else:
+                    consts.append(repr(const))
+            record = {'id': current, 'parent': parent, 'name': code_object.co_name,
+                      'filename': code_object.co_filename, 'firstlineno': code_object.co_firstlineno,
+                      'argcount': code_object.co_argcount, 'kwonlyargcount': code_object.co_kwonlyargcount,
+                      'nlocals': code_object.co_nlocals, 'stacksize': code_object.co_stacksize,
+                      'flags': code_object.co_flags, 'consts': consts, 'names': code_object.co_names,
+                      'varnames': code_object.co_varnames, 'freevars': code_object.co_freevars,
+                      'cellvars': code_object.co_cellvars, 'code': code_object.co_code,
+                      'lnotab': code_object.co_lnotab}
+            if instructions:
+                record['instructions'] = [(i.offset, i.name, i.arg, repr(i.argval))
+                                          for i in disassemble(code_object)]
+            yield record
+            current += 1
+
+    def dump_tree(self, code_object, instructions=False):
+        """The records of code_object as a tree, nested code objects in the children of their parent"""
+        nodes = []
+        for record in self.records(code_object, instructions):
+            record['code'] = record['code'].hex()
+            record['lnotab'] = record['lnotab'].hex()
+            record['children'] = []
+            if record['parent'] is not None:
+                nodes[record['parent']]['children'].append(record)
+            nodes.append(record)
+        return nodes[0]
+
+    def dump_json(self, code_object, stream, instructions=False, buffer_size=BUFFER_SIZE):
+        """
+        Write the records of code_object to stream, text or binary, as JSON lines. Output goes through a
+        buffer of buffer_size characters and bytecode is hex encoded in chunks straight into it.
+        """
+        writer = _BufferedWriter(stream, buffer_size)
+        self._write_json(writer, code_object, instructions)
+        writer.flush()
+
+    def dump_json_many(self, code_objects, stream, instructions=False, buffer_size=BUFFER_SIZE):
+        """dump_json for every code object in code_objects, sharing one buffer"""
+        writer = _BufferedWriter(stream, buffer_size)
+        for code_object in code_objects:
+            self._write_json(writer, code_object, instructions)
+        writer.flush()
+
+    def _write_json(self, writer, code_object, instructions):
+        import json
+
+        for record in self.records(code_object, instructions):
+            blobs = record.pop('code'), record.pop('lnotab')
+            writer.write(json.dumps(record)[:-1])
+            for key, data in zip(('code', 'lnotab'), blobs):
+                writer.write(', "{0}": "'.format(key))
+                for chunk in _hex_chunks(data):
+                    writer.write(chunk)
+                writer.write('"')
+            writer.write('}\n')
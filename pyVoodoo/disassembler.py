@@ -0,0 +1,88 @@
+import opcode
+import sys
+import types
+from collections import namedtuple
+
+from .encoding import default_encoder
+
+__all__ = ['Instruction', 'disassemble', 'iter_code_objects']
+
+_hasconst = frozenset(opcode.hasconst)
+_hasname = frozenset(opcode.hasname)
+_haslocal = frozenset(opcode.haslocal)
+_hasfree = frozenset(opcode.hasfree)
+_hascompare = frozenset(opcode.hascompare)
+_hasjump = frozenset(opcode.hasjrel + opcode.hasjabs)
+
+# opcodes whose name index carries flags in its low bits
+_name_shifts = {}
+if sys.version_info >= (3, 11):
+    _name_shifts[opcode.opmap['LOAD_GLOBAL']] = 1
+if sys.version_info >= (3, 12):
+    _name_shifts[opcode.opmap['LOAD_ATTR']] = 1
+    _name_shifts[opcode.opmap['LOAD_SUPER_ATTR']] = 2
+
+
+class Instruction(namedtuple('Instruction', 'code offset op arg argval end')):
+    """
+    A decoded instruction of code, the code object it belongs to. offset is where it starts (its EXTENDED_ARG
+    prefixes included) and end where the next one does, argval the constant, name or jump target arg stands
+    for. arg is None for opcodes without argument.
+    """
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return opcode.opname[self.op]
+
+    def __repr__(self):
+        return '<{0} {1} ({2!r}) at {3}>'.format(self.name, self.arg, self.argval, self.offset)
+
+
+def _argval(code_object, encoder, op, arg, end):
+    if arg is None:
+        return None
+    if op in _hasconst:
+        return code_object.co_consts[arg]
+    if op in _hasname:
+        return code_object.co_names[arg >> _name_shifts.get(op, 0)]
+    if op in _haslocal:
+        return code_object.co_varnames[arg]
+    if op in _hasfree:
+        if hasattr(code_object, '_varname_from_oparg'):
+            # 3.11 on: cell and free variables are indexed like the rest of the fast locals
+            return code_object._varname_from_oparg(arg)
+        cells = code_object.co_cellvars
+        return cells[arg] if arg < len(cells) else code_object.co_freevars[arg - len(cells)]
+    if op in _hasjump:
+        return encoder.jump_target(op, end, arg)
+    if op in _hascompare:
+        return opcode.cmp_op[arg]
+    return arg
+
+
+def disassemble(code_object, recursive=False, encoder=None):
+    """
+    Lazily decode the instructions of code_object straight from a memoryview of its bytecode. With recursive
+    set the code objects in co_consts follow, each decoded only once iteration reaches it, so stopping early
+    or filtering never decodes more than what was consumed.
+    """
+    encoder = encoder or default_encoder()
+    for offset, op, arg, end in encoder.iter_instructions(memoryview(code_object.co_code)):
+        if op < opcode.HAVE_ARGUMENT:
+            arg = None
+        yield Instruction(code_object, offset, op, arg, _argval(code_object, encoder, op, arg, end), end)
+    if recursive:
+        for const in code_object.co_consts:
+            if isinstance(const, types.CodeType):
+                for instruction in disassemble(const, True, encoder):
+                    yield instruction
+
+
+def iter_code_objects(code_object):
+    """Yield code_object and every code object nested in it, depth first"""
+    yield code_object
+    for const in code_object.co_consts:
+        if isinstance(const, types.CodeType):
+            for nested in iter_code_objects(const):
+                yield nested
@@ -0,0 +1,213 @@
+import opcode
+import sys
+
+from .assemblerExceptions import AssemblerBytecodeException
+
+__all__ = ['LegacyEncoder', 'WordcodeEncoder', 'encoder_for_version', 'default_encoder']
+
+EXTENDED_ARG = opcode.opmap['EXTENDED_ARG']
+HAVE_ARGUMENT = opcode.HAVE_ARGUMENT
+MAX_ARG = 0xFFFFFFFF
+
+_hasjabs = frozenset(opcode.hasjabs)
+_hasjback = frozenset(code for name, code in opcode.opmap.items() if 'BACKWARD' in name)
+
+
+def _check_arg(arg):
+    if not 0 <= arg <= MAX_ARG:
+        raise AssemblerBytecodeException("Argument {0} doesn't fit in 32 bits".format(arg))
+
+
+class _Encoder(object):
+    jump_unit = 1
+
+    def jump_arg(self, op, after, target):
+        """
+        Argument of jump op to the byte offset target, after being the offset right past the jump instruction
+        """
+        if op in _hasjabs:
+            arg = target
+        elif op in _hasjback:
+            arg = after - target
+        else:
+            arg = target - after
+        if arg < 0:
+            raise AssemblerBytecodeException("{0} can't reach offset {1} from offset {2}".format(
+                opcode.opname[op], target, after))
+        return arg // self.jump_unit
+
+    def jump_target(self, op, after, arg):
+        """Byte offset jump op with argument arg lands on, the inverse of jump_arg"""
+        arg *= self.jump_unit
+        if op in _hasjabs:
+            return arg
+        if op in _hasjback:
+            return after - arg
+        return after + arg
+
+
+class LegacyEncoder(_Encoder):
+    """
+    Bytecode up to python 3.5: opcodes without argument take one byte, the rest take three
+
+        |--------------|--------------|--------------|
+        |    opcode    |   oparg lo   |   oparg hi   |
+        |--------------|--------------|--------------|
+
+    Arguments above 0xFFFF are preceded by a single EXTENDED_ARG carrying the upper 16 bits.
+    """
+    wordcode = False
+    prefix_size = 3
+
+    def emit(self, buf, op, arg):
+        if arg > 0xFFFF:
+            _check_arg(arg)
+            buf.extend((EXTENDED_ARG, (arg >> 16) & 255, (arg >> 24) & 255,
+                        op, arg & 255, (arg >> 8) & 255))
+        elif arg >= 0:
+            buf.extend((op, arg & 255, arg >> 8))
+        else:
+            _check_arg(arg)
+
+    def emit_op(self, buf, op):
+        buf.append(op)
+
+    def emit_padded(self, buf, op, arg, prefixes):
+        """Emit op with exactly the given number of EXTENDED_ARG prefixes, arg must fit in them"""
+        if prefixes:
+            buf.extend((EXTENDED_ARG, (arg >> 16) & 255, (arg >> 24) & 255))
+        buf.extend((op, arg & 255, (arg >> 8) & 255))
+
+    def prefixes(self, arg):
+        """Number of EXTENDED_ARG prefixes arg needs"""
+        _check_arg(arg)
+        return 1 if arg > 0xFFFF else 0
+
+    def instruction_size(self, op):
+        return 3 if op >= HAVE_ARGUMENT else 1
+
+    def iter_offsets(self, code):
+        """Yield (offset, opcode) for every instruction in code, EXTENDED_ARG prefixes included"""
+        i = 0
+        end = len(code)
+        while i < end:
+            op = code[i]
+            yield i, op
+            i += 3 if op >= HAVE_ARGUMENT else 1
+
+    def iter_instructions(self, code):
+        """
+        Yield (offset, opcode, arg, next offset) for every instruction, EXTENDED_ARG folded into the argument
+        of the instruction it prefixes (offset being the one of the prefix). arg is None for opcodes without
+        argument.
+        """
+        i = 0
+        start = 0
+        ext = 0
+        end = len(code)
+        while i < end:
+            op = code[i]
+            if op < HAVE_ARGUMENT:
+                yield i, op, None, i + 1
+                i += 1
+                start = i
+                continue
+            arg = ext | code[i + 1] | (code[i + 2] << 8)
+            i += 3
+            if op == EXTENDED_ARG:
+                ext = arg << 16
+                continue
+            yield start, op, arg, i
+            start = i
+            ext = 0
+
+
+class WordcodeEncoder(_Encoder):
+    """
+    Bytecode from python 3.6 on: every instruction is two bytes wide
+
+        |--------------|--------------|
+        |    opcode    |    oparg     |
+        |--------------|--------------|
+
+    Arguments wider than a byte are preceded by up to three EXTENDED_ARG prefixes, most significant first.
+    Jump arguments count bytes up to python 3.9 and instructions (jump_unit=2) from 3.10 on.
+    """
+    wordcode = True
+    prefix_size = 2
+
+    def __init__(self, jump_unit=1):
+        self.jump_unit = jump_unit
+
+    def emit(self, buf, op, arg):
+        if 0 <= arg <= 0xFF:
+            buf.extend((op, arg))
+        elif 0 <= arg <= 0xFFFF:
+            buf.extend((EXTENDED_ARG, arg >> 8, op, arg & 255))
+        elif 0 <= arg <= 0xFFFFFF:
+            buf.extend((EXTENDED_ARG, arg >> 16, EXTENDED_ARG, (arg >> 8) & 255, op, arg & 255))
+        else:
+            _check_arg(arg)
+            buf.extend((EXTENDED_ARG, arg >> 24, EXTENDED_ARG, (arg >> 16) & 255,
+                        EXTENDED_ARG, (arg >> 8) & 255, op, arg & 255))
+
+    def emit_op(self, buf, op):
+        buf.extend((op, 0))
+
+    def emit_padded(self, buf, op, arg, prefixes):
+        """Emit op with exactly the given number of EXTENDED_ARG prefixes, arg must fit in them"""
+        for shift in range(8 * prefixes, 0, -8):
+            buf.extend((EXTENDED_ARG, (arg >> shift) & 255))
+        buf.extend((op, arg & 255))
+
+    def prefixes(self, arg):
+        """Number of EXTENDED_ARG prefixes arg needs"""
+        _check_arg(arg)
+        return (arg > 0xFF) + (arg > 0xFFFF) + (arg > 0xFFFFFF)
+
+    def instruction_size(self, op):
+        return 2
+
+    def iter_offsets(self, code):
+        """Yield (offset, opcode) for every instruction in code, EXTENDED_ARG prefixes included"""
+        return zip(range(0, len(code), 2), code[::2])
+
+    def iter_instructions(self, code):
+        """
+        Yield (offset, opcode, arg, next offset) for every instruction, EXTENDED_ARG folded into the argument
+        of the instruction it prefixes (offset being the one of the prefix).
+        """
+        start = 0
+        ext = 0
+        for i in range(0, len(code), 2):
+            op = code[i]
+            if op == EXTENDED_ARG:
+                ext = (ext | code[i + 1]) << 8
+                continue
+            yield start, op, ext | code[i + 1], i + 2
+            start = i + 2
+            ext = 0
+
+
+_legacy = LegacyEncoder()
+_wordcode = WordcodeEncoder()
+_wordcode_310 = WordcodeEncoder(jump_unit=2)
+
+
+def encoder_for_version(version_info):
+    """
+    Encoder producing bytecode the interpreter identified by version_info runs directly. Python 3.11 and later
+    (inline cache entries, RESUME, the localsplus layout of cells) aren't supported.
+    """
+    version_info = tuple(version_info)
+    if version_info >= (3, 11):
+        raise AssemblerBytecodeException("Python {0}.{1} bytecode is not supported".format(*version_info[:2]))
+    if version_info >= (3, 10):
+        return _wordcode_310
+    if version_info >= (3, 6):
+        return _wordcode
+    return _legacy
+
+
+def default_encoder():
+    return encoder_for_version(sys.version_info)
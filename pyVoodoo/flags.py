@@ -3,10 +3,10 @@ CO_OPTIMIZED = 0x0001  # use LOAD/STORE_FAST instead of _NAME
 CO_NEWLOCALS = 0x0002  # only cleared for module/exec code
 CO_VARARGS = 0x0004
 CO_VARKEYWORDS = 0x0008
-CO_NESTED = 0x0016  # ???
-CO_GENERATOR = 0x0032
-CO_NOFREE = 0x0064  # set if no free or cell vars
-CO_GENERATOR_ALLOWED = 0x0128  # unused
+CO_NESTED = 0x0010
+CO_GENERATOR = 0x0020
+CO_NOFREE = 0x0040  # set if no free or cell vars
+CO_GENERATOR_ALLOWED = 0x1000  # unused
 
 #Futures
 CO_FUTURE_DIVISION = 0x2000
@@ -0,0 +1,168 @@
+import dis
+import opcode
+import sys
+from collections import namedtuple
+
+from .encoding import default_encoder
+
+__all__ = ['StackAnalysis', 'Merge', 'branch_effects', 'block_starts', 'stack_depths']
+
+StackAnalysis = namedtuple('StackAnalysis', 'max_depth depths merges underflows')
+Merge = namedtuple('Merge', 'offset depth other source handler')
+
+_jumps = frozenset(opcode.hasjrel + opcode.hasjabs)
+# no fall through edge after these
+_terminators = frozenset(opcode.opmap[name] for name in (
+    'RETURN_VALUE', 'RETURN_CONST', 'RAISE_VARARGS', 'RERAISE', 'JUMP_ABSOLUTE', 'JUMP_FORWARD', 'JUMP_BACKWARD',
+    'JUMP_BACKWARD_NO_INTERRUPT', 'BREAK_LOOP', 'CONTINUE_LOOP') if name in opcode.opmap)
+
+# dis.stack_effect tells the two edges of a branch apart from python 3.8 on, before that it gives the
+# larger one and the edges are taken from the compiler of 3.7
+_JUMP_EFFECTS = sys.version_info >= (3, 8)
+_legacy_effects = {opcode.opmap[name]: effects for name, effects in (
+    ('FOR_ITER', (1, -1)), ('JUMP_IF_TRUE_OR_POP', (-1, 0)), ('JUMP_IF_FALSE_OR_POP', (-1, 0)),
+    ('SETUP_EXCEPT', (0, 6)), ('SETUP_FINALLY', (0, 6)), ('SETUP_WITH', (1, 6)), ('SETUP_ASYNC_WITH', (0, 5)))
+    if name in opcode.opmap}
+# before 3.7 what the instructions closing a handler do depends on how it was entered: END_FINALLY pops
+# the None the end of a finally block pushes, raises the exception again, or unwinds to the depth of the block
+# when the __exit__ of a with block silenced it. The walk keeps a flag for every handler it is in, set when
+# the handler was entered by an exception
+_HANDLER_STATES = sys.version_info < (3, 7)
+if _HANDLER_STATES:
+    _END_FINALLY = opcode.opmap['END_FINALLY']
+    _POP_EXCEPT = opcode.opmap['POP_EXCEPT']
+    _WITH_CLEANUP_FINISH = opcode.opmap['WITH_CLEANUP_FINISH']
+    _legacy_effects[_POP_EXCEPT] = -3, -3
+# CONTINUE_LOOP unwinds the block stack before jumping, its target is reached at the depth of the loop
+# by the jump closing it anyway
+_unwinding = frozenset(opcode.opmap[name] for name in ('CONTINUE_LOOP',) if name in opcode.opmap)
+# the VM resets the stack to the depth of the block when entering the handlers these set up
+_handler_setups = frozenset(opcode.opmap[name] for name in (
+    'SETUP_EXCEPT', 'SETUP_FINALLY', 'SETUP_WITH', 'SETUP_ASYNC_WITH') if name in opcode.opmap)
+# GEN_START pops the value the frame of a 3.10 generator starts with, on top of co_stacksize
+_GEN_START = opcode.opmap.get('GEN_START')
+
+
+def _stack_effect(op, arg, **jump):
+    try:
+        return dis.stack_effect(op, arg if op >= opcode.HAVE_ARGUMENT else None, **jump)
+    except ValueError:
+        # opcodes the interpreter has no effect for, NOP on 3.6 for one
+        return 0
+
+
+def branch_effects(op, arg):
+    """(fall through, jump) stack effects of op with argument arg"""
+    if op == _GEN_START:
+        return 0, 0
+    if _JUMP_EFFECTS:
+        if op in _jumps:
+            return _stack_effect(op, arg, jump=False), _stack_effect(op, arg, jump=True)
+        effect = _stack_effect(op, arg)
+        return effect, effect
+    effects = _legacy_effects.get(op)
+    if effects is not None:
+        return effects
+    effect = _stack_effect(op, arg)
+    return effect, effect
+
+
+def block_starts(instructions, encoder):
+    """Offsets where a basic block starts: the first instruction, jump targets and what follows a branch"""
+    starts = set()
+    if instructions:
+        starts.add(instructions[0][0])
+    for offset, op, arg, end in instructions:
+        if op in _jumps:
+            starts.add(encoder.jump_target(op, end, arg))
+            starts.add(end)
+        elif op in _terminators:
+            starts.add(end)
+    return starts
+
+
+def stack_depths(code, encoder=None, entry_depth=0):
+    """
+    Stack depth analysis of the finished bytecode in code. The instructions are split in basic blocks and
+    depths propagated along fall through and jump edges with a worklist, every block is walked once from the
+    depth it is first reached with, so the whole pass is linear. Unreachable blocks are skipped.
+
+    Returns a StackAnalysis: max_depth, the exact co_stacksize, depths, the entry depth of every reached
+    block by offset, merges, a Merge(offset, depth, other, source, handler) for every edge from the
+    instruction at source that reaches a block with another depth than it was first reached with, and
+    underflows, the offsets of the instructions that pop more than there is. handler is set for merges at the
+    start of an exception handler, which are entered at two depths in code the compiler generates for
+    finally and with blocks. Before python 3.7 blocks in handlers are walked, and their depths compared,
+    once for every way the handlers around them were entered, depths has the first of them.
+    """
+    encoder = encoder or default_encoder()
+    instructions = list(encoder.iter_instructions(code))
+    positions = dict((instruction[0], i) for i, instruction in enumerate(instructions))
+    starts = block_starts(instructions, encoder)
+    handlers = set(encoder.jump_target(op, end, arg) for offset, op, arg, end in instructions
+                   if op in _handler_setups)
+    depths = {}
+    entries = {}
+    merges = []
+    underflows = []
+    worklist = []
+    max_depth = entry_depth
+
+    def reach(offset, depth, source, state, exception=False):
+        if offset not in positions:
+            return
+        if _HANDLER_STATES and offset in handlers:
+            state += (exception,)
+        known = entries.get((offset, state))
+        if known is None:
+            entries[offset, state] = depth
+            depths.setdefault(offset, depth)
+            worklist.append((offset, state))
+        elif known != depth:
+            merges.append(Merge(offset, known, depth, source, offset in handlers))
+
+    if instructions:
+        reach(instructions[0][0], entry_depth, None, ())
+    count = len(instructions)
+    while worklist:
+        start, state = worklist.pop()
+        depth = entries[start, state]
+        i = positions[start]
+        previous = None
+        while i < count:
+            offset, op, arg, end = instructions[i]
+            fall, jump = branch_effects(op, arg)
+            if _HANDLER_STATES:
+                if op == _WITH_CLEANUP_FINISH and not (state and state[-1]):
+                    # nothing to silence, pops the result of __exit__ and the None below it
+                    fall = -2
+                elif op == _END_FINALLY or op == _POP_EXCEPT:
+                    by_exception = state[-1] if state else False
+                    state = state[:-1]
+                    if op == _END_FINALLY and by_exception:
+                        if previous != _WITH_CLEANUP_FINISH:
+                            break
+                        # the exception, its status and the exception handled before, and the status
+                        fall = -7
+            if op in _jumps and op not in _unwinding:
+                target = depth + jump
+                if target < 0:
+                    underflows.append(offset)
+                    break
+                if target > max_depth:
+                    max_depth = target
+                reach(encoder.jump_target(op, end, arg), target, offset, state, op in _handler_setups)
+            depth += fall
+            if depth < 0:
+                underflows.append(offset)
+                break
+            if depth > max_depth:
+                max_depth = depth
+            if op in _terminators:
+                break
+            previous = op
+            i += 1
+            if end in starts:
+                reach(end, depth, offset, state)
+                break
+    return StackAnalysis(max_depth, depths, merges, sorted(underflows))
@@ -0,0 +1,176 @@
+import time
+from collections import namedtuple
+
+from .assembler import Code, PythonParser, opname
+from .assemblerExceptions import AssemblerBytecodeException
+
+__all__ = ['Counters', 'Timing', 'instrument', 'report', 'uninstrument']
+
+Timing = namedtuple('Timing', 'calls seconds')
+
+TABLES = ('consts', 'names', 'varnames', 'freevars', 'cellvars')
+
+
+class Counters(object):
+    """
+    Sink adding up what instrumented Codes and parsers report: emits by opcode name, constant pool hits and
+    misses, the last size seen of every table, the highest stack size and a Timing per phase.
+    """
+
+    def __init__(self):
+        self.emits = {}
+        self.const_hits = 0
+        self.const_misses = 0
+        self.table_sizes = {}
+        self.stack_high_water = 0
+        self.timings = {}
+
+    def __call__(self, event, name, value):
+        if event == 'emit':
+            self.emits[name] = self.emits.get(name, 0) + value
+        elif event == 'const_hit':
+            self.const_hits += value
+        elif event == 'const_miss':
+            self.const_misses += value
+        elif event == 'table_size':
+            self.table_sizes[name] = value
+        elif event == 'stack_high_water':
+            self.stack_high_water = max(self.stack_high_water, value)
+        elif event == 'timing':
+            calls, seconds = self.timings.get(name, (0, 0.0))
+            self.timings[name] = Timing(calls + 1, seconds + value)
+
+    @property
+    def const_hit_ratio(self):
+        lookups = self.const_hits + self.const_misses
+        return self.const_hits / lookups if lookups else None
+
+    def as_dict(self):
+        return {'emits': dict(self.emits), 'const_hits': self.const_hits, 'const_misses': self.const_misses,
+                'table_sizes': dict(self.table_sizes), 'stack_high_water': self.stack_high_water,
+                'timings': {name: timing._asdict() for name, timing in self.timings.items()}}
+
+
+def _opcode_counts(code):
+    return {op: len(offsets) for op, offsets in code.index.by_opcode.items()}
+
+
+class _CodeProbe(object):
+    """
+    Installed on an instrumented Code. Emits aren't counted as they happen, they are read off the instruction
+    index when the probe reports, so emission itself runs exactly as without instrumentation.
+    """
+
+    def __init__(self, code, sink):
+        self.sink = sink
+        self.seen = _opcode_counts(code)
+        self.hits = 0
+        self.misses = 0
+        pool = code.consts
+        add = type(pool).add.__get__(pool)
+
+        def counting_add(const):
+            size = len(pool)
+            arg = add(const)
+            if len(pool) == size:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return arg
+        pool.add = counting_add
+
+        optimize = Code.optimize.__get__(code)
+
+        def timed_optimize():
+            self.count_emits(code)
+            start = time.perf_counter()
+            try:
+                return optimize()
+            finally:
+                sink('timing', 'optimize', time.perf_counter() - start)
+                self.seen = _opcode_counts(code)
+        code.optimize = timed_optimize
+
+    def count_emits(self, code):
+        seen = self.seen
+        counts = _opcode_counts(code)
+        for op, count in counts.items():
+            if count > seen.get(op, 0):
+                self.sink('emit', opname[op], count - seen.get(op, 0))
+        self.seen = counts
+
+    def persist(self, persistor, code):
+        sink = self.sink
+        start = time.perf_counter()
+        code.resolve()
+        resolved = time.perf_counter()
+        code_object = persistor._to_code_type(code)
+        sink('timing', 'assemble', resolved - start)
+        sink('timing', 'persist', time.perf_counter() - resolved)
+        self.report(code)
+        return code_object
+
+    def report(self, code):
+        """Send what was counted since the last report to the sink"""
+        sink = self.sink
+        self.count_emits(code)
+        if self.hits:
+            sink('const_hit', 'consts', self.hits)
+        if self.misses:
+            sink('const_miss', 'consts', self.misses)
+        self.hits = self.misses = 0
+        for table in TABLES:
+            sink('table_size', table, len(getattr(code, table)))
+        sink('stack_high_water', code.name, code.stacksize)
+
+
+class _ParserProbe(object):
+    def __init__(self, sink):
+        self.sink = sink
+
+    def parse(self, parser, code_object):
+        start = time.perf_counter()
+        code = parser._parse(code_object)
+        self.sink('timing', 'parse', time.perf_counter() - start)
+        return code
+
+
+def instrument(target, sink, rate=1.0):
+    """
+    Report what target, a Code or a PythonParser, does to sink, a callable taking (event, name, value) such as
+    Counters. With a rate below 1 only that fraction of the targets is instrumented, the others are returned
+    untouched and cost nothing.
+
+    A Code reports when it is persisted (or on report(code)): 'emit' per opcode name, 'const_hit' and
+    'const_miss' for the constant pool, 'table_size' per table, 'stack_high_water' and 'timing' for the
+    'assemble' (jump resolution), 'persist' and 'optimize' phases. A parser reports a 'parse' timing.
+    """
+    if rate < 1:
+        import random
+        if random.random() >= rate:
+            return target
+    if isinstance(target, Code):
+        if target._probe is not None:
+            uninstrument(target)
+        target._probe = _CodeProbe(target, sink)
+    elif isinstance(target, PythonParser):
+        target._probe = _ParserProbe(sink)
+    else:
+        raise AssemblerBytecodeException('Can only instrument Code and PythonParser instances, not {0!r}'.format(target))
+    return target
+
+
+def report(code):
+    """Have an instrumented code send what it counted so far, without persisting it"""
+    if code._probe is not None:
+        code._probe.report(code)
+
+
+def uninstrument(target):
+    """Remove the instrumentation of target, returning it to the uninstrumented code paths"""
+    if isinstance(target, Code) and target._probe is not None:
+        target._probe.report(target)
+        target.consts.__dict__.pop('add', None)
+        del target.optimize
+    target.__dict__.pop('_probe', None)
+    return target
@@ -1,3 +1,337 @@
+import opcode
+import types
+from array import array
+from operator import itemgetter
+
+from .assemblerExceptions import AssemblerBytecodeException
+from .encoding import default_encoder
+from .flowgraph import block_starts, _jumps, _terminators
+
+__all__ = ['Node', 'Block', 'Instr', 'FlowGraph']
+
+
 class Node(tuple):
-    """Base class for AST"""
+    """Base class for AST and IR nodes, immutable tuples without per instance dict"""
     __slots__ = []
+
+
+class Block(Node):
+    """Basic block of a FlowGraph: its index and the range [start, end) of its instructions in the graph"""
+    __slots__ = ()
+
+    def __new__(cls, index, start, end):
+        return tuple.__new__(cls, (index, start, end))
+
+    index = property(itemgetter(0))
+    start = property(itemgetter(1))
+    end = property(itemgetter(2))
+
+    def __repr__(self):
+        return '<Block {0} [{1}:{2}]>'.format(*self)
+
+
+class Instr(Node):
+    """Instruction of a FlowGraph, arg being the index of the target block for jumps"""
+    __slots__ = ()
+
+    def __new__(cls, op, arg):
+        return tuple.__new__(cls, (op, arg))
+
+    op = property(itemgetter(0))
+    arg = property(itemgetter(1))
+
+    @property
+    def name(self):
+        return opcode.opname[self[0]]
+
+    @property
+    def is_jump(self):
+        return self[0] in _jumps
+
+    def __repr__(self):
+        return '<{0} {1}>'.format(self.name, self[1])
+
+
+def _csr(count, edges):
+    # compressed rows: row i holds targets[starts[i]:starts[i + 1]]
+    starts = array('I', bytes(4 * (count + 1)))
+    for source, target in edges:
+        starts[source + 1] += 1
+    for i in range(count):
+        starts[i + 1] += starts[i]
+    targets = array('I', bytes(4 * starts[count]))
+    fill = array('I', starts)
+    for source, target in edges:
+        targets[fill[source]] = target
+        fill[source] += 1
+    return starts, targets
+
+
+class FlowGraph(object):
+    """
+    Control flow graph of a code object in flat arrays: opcode, argument (EXTENDED_ARG folded in, jump
+    arguments replaced by the index of the target block) and offset of every instruction, the first
+    instruction of every block and the successor then predecessor edges in compressed rows. That is 9 bytes
+    per instruction and about 24 per block, some 12 bytes per instruction over the standard library, the
+    tables being shared with the code the graph comes from.
+
+    Dominators and loop nesting are computed on first use. Blocks only reached through unwinding (BREAK_LOOP
+    before python 3.8) or never reached are kept but have no immediate dominator.
+    """
+    __slots__ = ('encoder', 'ops', 'args', 'offsets', 'starts', 'edge_starts', 'edges', 'argcount',
+                 'posonlyargcount', 'kwonlyargcount', 'stacksize', 'flags', 'filename', 'name', 'firstlineno',
+                 'consts', 'names', 'varnames', 'freevars', 'cellvars', '_idom', '_order', '_loop_depth',
+                 '_loop_header')
+
+    def __init__(self, code, encoder=None):
+        """Graph of code, the bytecode of a code object or a (resolved) Code, with its attributes and tables"""
+        from .assembler import Code
+
+        if isinstance(code, Code):
+            code.resolve()
+            self.encoder = code.encoder
+            self.argcount, self.posonlyargcount, self.kwonlyargcount = (code.argcount, code.posonlyargcount,
+                                                                        code.kwonlyargcount)
+            self.stacksize, self.flags, self.filename, self.name, self.firstlineno = (
+                code.stacksize, code.flags, code.filename, code.name, code.firstlineno)
+            self.consts, self.names, self.varnames, self.freevars, self.cellvars = (
+                code.consts.as_tuple(), code.names.as_tuple(), code.varnames.as_tuple(), code.freevars.as_tuple(),
+                code.cellvars.as_tuple())
+            bytecode = code.code
+        elif isinstance(code, types.CodeType):
+            self.encoder = encoder or default_encoder()
+            self.argcount, self.posonlyargcount, self.kwonlyargcount = (
+                code.co_argcount, getattr(code, 'co_posonlyargcount', 0), code.co_kwonlyargcount)
+            self.stacksize, self.flags, self.filename, self.name, self.firstlineno = (
+                code.co_stacksize, code.co_flags, code.co_filename, code.co_name, code.co_firstlineno)
+            self.consts, self.names, self.varnames, self.freevars, self.cellvars = (
+                code.co_consts, code.co_names, code.co_varnames, code.co_freevars, code.co_cellvars)
+            bytecode = code.co_code
+        else:
+            raise AssemblerBytecodeException('Invalid instance type for {0}'.format(code))
+        self._idom = self._order = self._loop_depth = self._loop_header = None
+        self._build(memoryview(bytecode))
+
+    def _build(self, bytecode):
+        encoder = self.encoder
+        instructions = list(encoder.iter_instructions(bytecode))
+        leaders = block_starts(instructions, encoder)
+        ops = self.ops = array('B')
+        args = self.args = array('I')
+        offsets = self.offsets = array('I')
+        starts = self.starts = array('I')
+        blocks = {}
+        for i, (offset, op, arg, end) in enumerate(instructions):
+            if offset in leaders:
+                blocks[offset] = len(starts)
+                starts.append(i)
+            ops.append(op)
+            args.append(arg or 0)
+            offsets.append(offset)
+        starts.append(len(instructions))
+
+        edges = []
+        count = len(starts) - 1
+        for block in range(count):
+            last = starts[block + 1] - 1
+            offset, op, arg, end = instructions[last]
+            if op not in _terminators and block + 1 < count:
+                edges.append((block, block + 1))
+            if op in _jumps:
+                try:
+                    target = blocks[encoder.jump_target(op, end, arg)]
+                except KeyError:
+                    raise AssemblerBytecodeException('{0} at {1} jumps outside of the code'.format(
+                        opcode.opname[op], offset))
+                args[last] = target
+                if (block, target) not in edges[-2:]:
+                    edges.append((block, target))
+        succ_starts, succ_edges = _csr(count, edges)
+        # edges are in source order, so are the predecessors of every block
+        pred_starts, pred_edges = _csr(count, [(target, source) for source, target in edges])
+        shift = len(succ_edges)
+        self.edge_starts = succ_starts + array('I', [start + shift for start in pred_starts])
+        self.edges = succ_edges + pred_edges
+
+    def __len__(self):
+        return len(self.starts) - 1
+
+    @property
+    def nbytes(self):
+        """Bytes held by the arrays of the graph"""
+        return sum(a.itemsize * len(a) for a in (self.ops, self.args, self.offsets, self.starts, self.edge_starts,
+                                                  self.edges))
+
+    def block(self, index):
+        return Block(index, self.starts[index], self.starts[index + 1])
+
+    def blocks(self):
+        starts = self.starts
+        return [Block(i, starts[i], starts[i + 1]) for i in range(len(self))]
+
+    def instructions(self, block):
+        """Instr of every instruction of block, a Block or a block index"""
+        if not isinstance(block, Block):
+            block = self.block(block)
+        ops, args = self.ops, self.args
+        return [Instr(ops[i], args[i]) for i in range(block.start, block.end)]
+
+    def successors(self, block):
+        return self.edges[self.edge_starts[block]:self.edge_starts[block + 1]]
+
+    def predecessors(self, block):
+        row = len(self.starts) + block
+        return self.edges[self.edge_starts[row]:self.edge_starts[row + 1]]
+
+    def _reverse_postorder(self):
+        count = len(self)
+        seen = bytearray(count)
+        order = []
+        if not count:
+            return order
+        succ_starts, succ_edges = self.edge_starts, self.edges
+        stack = [(0, succ_starts[0])]
+        seen[0] = 1
+        while stack:
+            block, edge = stack[-1]
+            if edge < succ_starts[block + 1]:
+                stack[-1] = block, edge + 1
+                target = succ_edges[edge]
+                if not seen[target]:
+                    seen[target] = 1
+                    stack.append((target, succ_starts[target]))
+            else:
+                stack.pop()
+                order.append(block)
+        order.reverse()
+        return order
+
+    def dominators(self):
+        """
+        Immediate dominator of every block, -1 for unreachable ones and the entry block its own, with the
+        iterative algorithm of Cooper, Harvey and Kennedy over the reverse postorder.
+        """
+        if self._idom is not None:
+            return self._idom
+        count = len(self)
+        rpo = self._reverse_postorder()
+        order = array('i', [-1]) * count
+        for position, block in enumerate(rpo):
+            order[block] = position
+        idom = array('i', [-1]) * count
+        if rpo:
+            idom[0] = 0
+        pred_starts, pred_edges = self.edge_starts[len(self.starts):], self.edges
+        changed = True
+        while changed:
+            changed = False
+            for block in rpo[1:]:
+                new = -1
+                for edge in range(pred_starts[block], pred_starts[block + 1]):
+                    pred = pred_edges[edge]
+                    if idom[pred] == -1:
+                        continue
+                    if new == -1:
+                        new = pred
+                        continue
+                    a, b = pred, new
+                    while a != b:
+                        while order[a] > order[b]:
+                            a = idom[a]
+                        while order[b] > order[a]:
+                            b = idom[b]
+                    new = a
+                if idom[block] != new:
+                    idom[block] = new
+                    changed = True
+        self._idom, self._order = idom, order
+        return idom
+
+    def dominates(self, a, b):
+        """Whether block a dominates block b"""
+        idom = self.dominators()
+        if idom[b] == -1:
+            return False
+        while b != a:
+            if b == 0:
+                return False
+            b = idom[b]
+        return True
+
+    def _loops(self):
+        if self._loop_depth is not None:
+            return
+        count = len(self)
+        idom = self.dominators()
+        bodies = {}
+        for block in range(count):
+            if idom[block] == -1:
+                continue
+            for header in self.successors(block):
+                # a back edge goes to a block dominating its source
+                if self.dominates(header, block):
+                    body = bodies.setdefault(header, set([header]))
+                    pending = [block]
+                    while pending:
+                        member = pending.pop()
+                        if member not in body:
+                            body.add(member)
+                            pending.extend(self.predecessors(member))
+        depth = array('H', bytes(2 * count))
+        innermost = array('i', [-1]) * count
+        # outer loops first, inner ones then overwrite the innermost header
+        for header, body in sorted(bodies.items(), key=lambda item: -len(item[1])):
+            for member in body:
+                depth[member] += 1
+                innermost[member] = header
+        self._loop_depth, self._loop_header = depth, innermost
+
+    def loop_depth(self, block):
+        """Number of natural loops block is in"""
+        self._loops()
+        return self._loop_depth[block]
+
+    def loop_header(self, block):
+        """Header of the innermost natural loop block is in, -1 outside of loops"""
+        self._loops()
+        return self._loop_header[block]
+
+    def loop_headers(self):
+        self._loops()
+        return sorted(set(header for header in self._loop_header if header != -1))
+
+    def to_code(self):
+        """
+        Lower the graph into a new Code, blocks in index order with jumps through labels, so arguments and
+        EXTENDED_ARG prefixes are recomputed. The line number table isn't carried over and the stack size is
+        the one of the source, past the start the stack size is unknown like for PythonParser.parse.
+        """
+        from .assembler import Code, Label
+        from .tables import ConstantPool
+
+        code = Code(self.encoder)
+        code.argcount, code.posonlyargcount, code.kwonlyargcount = (self.argcount, self.posonlyargcount,
+                                                                    self.kwonlyargcount)
+        code.flags, code.filename, code.name, code.firstlineno = self.flags, self.filename, self.name, self.firstlineno
+        code.consts = ConstantPool()
+        for table, entries in ((code.consts, self.consts), (code.names, self.names), (code.varnames, self.varnames),
+                               (code.freevars, self.freevars), (code.cellvars, self.cellvars)):
+            for entry in entries:
+                table.append(entry)
+        code.stack_unknown()
+        labels = [Label() for _ in range(len(self))]
+        ops, args, starts = self.ops, self.args, self.starts
+        have_argument = opcode.HAVE_ARGUMENT
+        for block, label in enumerate(labels):
+            code.mark(label)
+            for i in range(starts[block], starts[block + 1]):
+                op = ops[i]
+                if op in _jumps:
+                    code.jump(op, labels[args[i]])
+                elif op >= have_argument:
+                    code.emit_arg(op, args[i])
+                else:
+                    code.emit_op(op)
+        code.resolve()
+        code.stacksize = self.stacksize
+        return code
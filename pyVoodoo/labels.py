@@ -0,0 +1,84 @@
+from array import array
+
+__all__ = ['Label']
+
+
+class Label(object):
+    """
+    A jump target inside a Code. Labels can be created before the position they stand for is known and be
+    bound later with Code.mark, every jump emitted to them is patched by Code.resolve.
+
+    offset is the byte offset the label was bound at, fixups the number of jumps emitted before it (only
+    those can move the label when they grow EXTENDED_ARG prefixes) and stack_size the stack depth expected
+    when control reaches it.
+    """
+    __slots__ = ('offset', 'fixups', 'stack_size')
+
+    def __init__(self):
+        self.offset = None
+        self.fixups = 0
+        self.stack_size = None
+
+    @property
+    def bound(self):
+        return self.offset is not None
+
+    def __repr__(self):
+        if not self.bound:
+            return '<Label unbound>'
+        return '<Label at {0}>'.format(self.offset)
+
+
+def relax_jumps(encoder, fixups):
+    """
+    Pick the number of EXTENDED_ARG prefixes every jump needs.
+
+    fixups holds (offset, op, label) for every jump in emission order, emitted with no prefix. Widths start
+    at zero and only grow, every pass recomputes the jump arguments from the current widths until no jump
+    needs a wider argument, which takes a handful of linear passes even with thousands of branches.
+    Returns the per jump (argument, prefixes) pairs and the running byte shift before every fixup, the last
+    entry being the total growth of the code.
+    """
+    psize = encoder.prefix_size
+    count = len(fixups)
+    widths = [0] * count
+    changed = True
+    while changed:
+        changed = False
+        shifts = [0] * (count + 1)
+        shift = 0
+        for i in range(count):
+            shifts[i] = shift
+            shift += widths[i] * psize
+        shifts[count] = shift
+
+        args = []
+        for i, (offset, op, label) in enumerate(fixups):
+            after = offset + shifts[i] + widths[i] * psize + encoder.instruction_size(op)
+            arg = encoder.jump_arg(op, after, label.offset + shifts[label.fixups])
+            needed = encoder.prefixes(arg)
+            if needed > widths[i]:
+                widths[i] = needed
+                changed = True
+            args.append(arg)
+    return list(zip(args, widths)), shifts
+
+
+def relocator(fixups, shifts):
+    """
+    Function moving a sorted array of offsets to where they land once the jumps in fixups grow by shifts
+    (as returned by relax_jumps). An offset equal to a jump's offset stays in front of its prefixes.
+    """
+    jump_offsets = [offset for offset, op, label in fixups]
+    count = len(jump_offsets)
+
+    def move(offsets):
+        moved = array(offsets.typecode)
+        j = 0
+        for offset in offsets:
+            while j < count and jump_offsets[j] < offset:
+                j += 1
+            moved.append(offset + shifts[j])
+        return moved
+
+    return move
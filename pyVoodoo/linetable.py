@@ -0,0 +1,171 @@
+import sys
+from array import array
+from bisect import bisect_right
+
+from .assemblerExceptions import CodeTypeException
+
+__all__ = ['LineTable', 'encode_lnotab', 'encode_linetable', 'encode_locations']
+
+
+class LineTable(object):
+    """
+    Source line of every instruction of a Code, run length encoded like StackHistory: an (offset, line) pair
+    is only stored where the line changes, in two arrays. Instructions without a line are stored as -1 and
+    instructions before the first record have none. The table of the running interpreter is only encoded
+    when the code object is built, see encode.
+    """
+    __slots__ = ('offsets', 'lines')
+
+    def __init__(self):
+        self.offsets = array('I')
+        self.lines = array('i')
+
+    def record(self, offset, line):
+        """Instructions from offset on are on line (None for no line), a later record at the same offset wins"""
+        if line is None:
+            line = -1
+        offsets, lines = self.offsets, self.lines
+        if offsets and offsets[-1] >= offset:
+            if offsets[-1] > offset:
+                raise CodeTypeException("Line recorded at {0}, before {1}".format(offset, offsets[-1]))
+            offsets.pop()
+            lines.pop()
+        if not lines or lines[-1] != line:
+            offsets.append(offset)
+            lines.append(line)
+
+    def extend(self, records):
+        """record every (offset, line) pair of records, in increasing offset order"""
+        for offset, line in records:
+            self.record(offset, line)
+
+    def relocate(self, move):
+        """Rewrite the recorded offsets with move, a function of the whole (sorted) offsets array"""
+        self.offsets = move(self.offsets)
+
+    def line_at(self, offset):
+        i = bisect_right(self.offsets, offset) - 1
+        if i < 0 or self.lines[i] < 0:
+            return None
+        return self.lines[i]
+
+    def items(self):
+        return zip(self.offsets, (None if line < 0 else line for line in self.lines))
+
+    def encode(self, size, firstlineno):
+        """
+        Line table of size bytes of code in the format of the running interpreter: co_lnotab before python
+        3.10, co_linetable in 3.10 and the location table from 3.11 on
+        """
+        if not self.offsets:
+            return b''
+        if sys.version_info >= (3, 11):
+            return encode_locations(self.offsets, self.lines, size, firstlineno)
+        if sys.version_info >= (3, 10):
+            return encode_linetable(self.offsets, self.lines, size, firstlineno)
+        return encode_lnotab(self.offsets, self.lines, size, firstlineno, signed=sys.version_info >= (3, 6))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __repr__(self):
+        return 'LineTable({0!r})'.format(list(self.items()))
+
+
+def encode_lnotab(offsets, lines, size, firstlineno, signed=True):
+    """
+    co_lnotab: (offset increment, line increment) byte pairs at every line start, the line increment being
+    signed from python 3.6 on. Instructions without a line keep the previous one.
+    """
+    table = bytearray()
+    prev_offset, prev_line = 0, firstlineno
+    for offset, line in zip(offsets, lines):
+        if line < 0 or line == prev_line or offset >= size:
+            continue
+        d_offset, d_line = offset - prev_offset, line - prev_line
+        if d_line < 0 and not signed:
+            raise CodeTypeException("Line {0} at {1} goes back, lnotab needs python 3.6".format(line, offset))
+        while d_offset > 255:
+            table += b'\xff\x00'
+            d_offset -= 255
+        while d_line > 127:
+            table += bytes((d_offset, 127))
+            d_offset, d_line = 0, d_line - 127
+        while d_line < -128:
+            table += bytes((d_offset, 0x80))
+            d_offset, d_line = 0, d_line + 128
+        table += bytes((d_offset, d_line & 0xFF))
+        prev_offset, prev_line = offset, line
+    return bytes(table)
+
+
+def _ranges(offsets, lines, size):
+    # (start, end, line) of every range of instructions on one line, -1 before the first record
+    start, line = 0, -1
+    for offset, next_line in zip(offsets, lines):
+        if offset >= size:
+            break
+        if offset > start:
+            yield start, offset, line
+        start, line = offset, next_line
+    if size > start:
+        yield start, size, line
+
+
+def encode_linetable(offsets, lines, size, firstlineno):
+    """
+    co_linetable of python 3.10: (byte length, line increment) pairs covering the whole code, ranges without
+    a line having an increment of -128
+    """
+    if not len(offsets):
+        return b''
+    table = bytearray()
+    prev_line = firstlineno
+    for start, end, line in _ranges(offsets, lines, size):
+        if line < 0:
+            d_line = -128
+        else:
+            d_line, prev_line = line - prev_line, line
+            while d_line > 127:
+                table += bytes((0, 127))
+                d_line -= 127
+            while d_line < -127:
+                table += bytes((0, 0x81))
+                d_line += 127
+        length = end - start
+        while length > 254:
+            table += bytes((254, d_line & 0xFF))
+            d_line = -128 if line < 0 else 0
+            length -= 254
+        table += bytes((length, d_line & 0xFF))
+    return bytes(table)
+
+
+def _varint(table, value):
+    while value >= 64:
+        table.append(0x40 | (value & 0x3F))
+        value >>= 6
+    table.append(value)
+
+
+def encode_locations(offsets, lines, size, firstlineno):
+    """
+    Location table of python 3.11 on, line numbers only: entries of up to 8 code units, either without
+    location or with a line increment and no column
+    """
+    if not len(offsets):
+        return b''
+    table = bytearray()
+    prev_line = firstlineno
+    for start, end, line in _ranges(offsets, lines, size):
+        units = (end - start) // 2
+        while units:
+            length = min(units, 8)
+            units -= length
+            if line < 0:
+                table.append(0x80 | (15 << 3) | (length - 1))
+                continue
+            table.append(0x80 | (13 << 3) | (length - 1))
+            d_line, prev_line = line - prev_line, line
+            _varint(table, -d_line << 1 | 1 if d_line < 0 else d_line << 1)
+    return bytes(table)
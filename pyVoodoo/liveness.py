@@ -0,0 +1,172 @@
+import opcode
+from collections import namedtuple
+
+from .flags import CO_VARARGS, CO_VARKEYWORDS
+from .flowgraph import _handler_setups
+from .ir import FlowGraph
+from .tables import SymbolTable
+
+__all__ = ['SlotAllocation', 'block_liveness', 'interference', 'reuse_slots']
+
+SlotAllocation = namedtuple('SlotAllocation', 'nlocals_before nlocals_after shared')
+
+_haslocal = frozenset(opcode.haslocal)
+_defines = frozenset(op for op in opcode.haslocal if opcode.opname[op].startswith(('STORE_', 'DELETE_')))
+
+
+def _bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def block_liveness(graph):
+    """
+    (live in, live out) of every block of graph, a FlowGraph, as lists of bit sets (ints) of local slots,
+    solved backwards with a worklist.
+    """
+    count = len(graph)
+    ops, args, starts = graph.ops, graph.args, graph.starts
+    uses = [0] * count
+    kills = [0] * count
+    for block in range(count):
+        used = killed = 0
+        for i in range(starts[block], starts[block + 1]):
+            op = ops[i]
+            if op in _haslocal:
+                bit = 1 << args[i]
+                if op in _defines:
+                    killed |= bit
+                elif not killed & bit:
+                    used |= bit
+        uses[block], kills[block] = used, killed
+
+    live_in = [0] * count
+    live_out = [0] * count
+    worklist = list(range(count))
+    pending = bytearray([1]) * count
+    while worklist:
+        block = worklist.pop()
+        pending[block] = 0
+        out = 0
+        for successor in graph.successors(block):
+            out |= live_in[successor]
+        live_out[block] = out
+        new = uses[block] | (out & ~kills[block])
+        if new != live_in[block]:
+            live_in[block] = new
+            for predecessor in graph.predecessors(block):
+                if not pending[predecessor]:
+                    pending[predecessor] = 1
+                    worklist.append(predecessor)
+    return live_in, live_out
+
+
+def interference(graph, live_out, candidates):
+    """
+    Slot -> bit set of the slots it interferes with, for the slots in candidates (a bit set): two locals
+    interfere when one is written while the other is live.
+    """
+    ops, args, starts = graph.ops, graph.args, graph.starts
+    edges = {}
+    for block in range(len(graph)):
+        live = live_out[block]
+        for i in range(starts[block + 1] - 1, starts[block] - 1, -1):
+            op = ops[i]
+            if op not in _haslocal:
+                continue
+            slot = args[i]
+            bit = 1 << slot
+            if op in _defines:
+                others = live & candidates & ~bit
+                if bit & candidates:
+                    edges[slot] = edges.get(slot, 0) | others
+                for other in _bits(others):
+                    edges[other] = edges.get(other, 0) | bit
+                live &= ~bit
+            else:
+                live |= bit
+    return edges
+
+
+def reuse_slots(code, temporaries=None):
+    """
+    Share local slots between the temporaries of code (code.temporaries by default, see Code.temporary)
+    that are never live at the same time, in place. Arguments, cells and every other local keep their own
+    slot and name. Temporaries live on entry to an exception handler aren't shared either, the handler can
+    be entered from anywhere in its block. Merged temporaries take the lowest slot of their group and the
+    other slots only move down, so arguments never need more EXTENDED_ARG prefixes and offsets, labels and
+    the stack history stay valid.
+
+    Run it on finished code: names of merged temporaries are gone from varnames afterwards.
+    Returns a SlotAllocation(nlocals_before, nlocals_after, shared), shared mapping every merged temporary
+    to the name it now shares a slot with.
+    """
+    varnames = code.varnames
+    before = len(varnames)
+    temporaries = code.temporaries if temporaries is None else temporaries
+    arguments = code.argcount + code.kwonlyargcount
+    arguments += bool(code.flags & CO_VARARGS) + bool(code.flags & CO_VARKEYWORDS)
+    candidates = 0
+    for name in temporaries:
+        slot = varnames.get(name)
+        if slot is not None and slot >= arguments and name not in code.cellvars:
+            candidates |= 1 << slot
+    if not candidates:
+        return SlotAllocation(before, before, {})
+
+    graph = FlowGraph(code)
+    live_in, live_out = block_liveness(graph)
+    encoder = graph.encoder
+    ops, args, starts = graph.ops, graph.args, graph.starts
+    # read before being written on some path, sharing would trade the UnboundLocalError for another value
+    if len(graph):
+        candidates &= ~live_in[0]
+    for block in range(len(graph)):
+        last = starts[block + 1] - 1
+        if last >= starts[block] and ops[last] in _handler_setups:
+            candidates &= ~live_in[args[last]]
+    edges = interference(graph, live_out, candidates)
+
+    # greedy colouring in slot order, the first member of a colour is the slot it keeps
+    colours = []
+    representative = {}
+    for slot in _bits(candidates):
+        conflicts = edges.get(slot, 0)
+        for colour in colours:
+            if not conflicts & colour[1]:
+                colour[1] |= 1 << slot
+                representative[slot] = colour[0]
+                break
+        else:
+            colours.append([slot, 1 << slot])
+
+    if not representative:
+        return SlotAllocation(before, before, {})
+    names = varnames.as_tuple()
+    slots = []
+    kept = []
+    for slot, name in enumerate(names):
+        if slot in representative:
+            slots.append(slots[representative[slot]])
+        else:
+            slots.append(len(kept))
+            kept.append(name)
+
+    bytecode = code.code
+    offsets = graph.offsets
+    size = len(bytecode)
+    for i, op in enumerate(ops):
+        if op in _haslocal and slots[args[i]] != args[i]:
+            start = offsets[i]
+            end = offsets[i + 1] if i + 1 < len(offsets) else size
+            prefixes = (end - start - encoder.instruction_size(op)) // encoder.prefix_size
+            patched = bytearray()
+            encoder.emit_padded(patched, op, slots[args[i]], prefixes)
+            bytecode[start:end] = patched
+    code.varnames = SymbolTable(kept)
+    code.temporaries = set(name for name in code.temporaries if name in code.varnames)
+    code._code_object = None
+    shared = dict((names[slot], names[rep]) for slot, rep in representative.items())
+    return SlotAllocation(before, len(kept), shared)
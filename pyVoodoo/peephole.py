@@ -0,0 +1,449 @@
+import operator
+import opcode
+
+from .assemblerExceptions import AssemblerBytecodeException
+from .labels import Label
+from .linetable import LineTable
+from .stackeffects import StackHistory
+from .tables import InstructionIndex
+
+__all__ = ['PeepholeOptimizer']
+
+_opmap = opcode.opmap
+
+LOAD_CONST = _opmap['LOAD_CONST']
+POP_TOP = _opmap['POP_TOP']
+UNARY_NOT = _opmap.get('UNARY_NOT')
+JUMP_FORWARD = _opmap['JUMP_FORWARD']
+JUMP_ABSOLUTE = _opmap.get('JUMP_ABSOLUTE')
+JUMP_BACKWARD = _opmap.get('JUMP_BACKWARD')
+GOTO = -1  # unconditional jump whose opcode is picked once its direction is known
+
+BINARY_OPERATORS = dict((_opmap[name], function) for name, function in (
+    ('BINARY_POWER', operator.pow),
+    ('BINARY_MULTIPLY', operator.mul),
+    ('BINARY_MODULO', operator.mod),
+    ('BINARY_ADD', operator.add),
+    ('BINARY_SUBTRACT', operator.sub),
+    ('BINARY_SUBSCR', operator.getitem),
+    ('BINARY_FLOOR_DIVIDE', operator.floordiv),
+    ('BINARY_TRUE_DIVIDE', operator.truediv),
+    ('BINARY_LSHIFT', operator.lshift),
+    ('BINARY_RSHIFT', operator.rshift),
+    ('BINARY_AND', operator.and_),
+    ('BINARY_XOR', operator.xor),
+    ('BINARY_OR', operator.or_),
+) if name in _opmap)
+
+UNARY_OPERATORS = dict((_opmap[name], function) for name, function in (
+    ('UNARY_POSITIVE', operator.pos),
+    ('UNARY_NEGATIVE', operator.neg),
+    ('UNARY_NOT', operator.not_),
+    ('UNARY_INVERT', operator.invert),
+) if name in _opmap)
+
+COMPARE_OP = _opmap['COMPARE_OP']
+IS_OP = _opmap.get('IS_OP')
+CONTAINS_OP = _opmap.get('CONTAINS_OP')
+_contains = lambda left, right: left in right
+_not_contains = lambda left, right: left not in right
+# 'exception match' and 'BAD' aren't folded
+COMPARE_OPERATORS = dict((index, function) for index, function in enumerate((
+    operator.lt, operator.le, operator.eq, operator.ne, operator.gt, operator.ge, _contains, _not_contains,
+    operator.is_, operator.is_not)) if index < len(opcode.cmp_op))
+
+# JUMP_IF_*_OR_POP opcode -> truth value it jumps on
+_jumps_or_pop = dict((_opmap[name], name == 'JUMP_IF_TRUE_OR_POP')
+                     for name in ('JUMP_IF_TRUE_OR_POP', 'JUMP_IF_FALSE_OR_POP') if name in _opmap)
+
+_hasjump = frozenset(opcode.hasjrel + opcode.hasjabs)
+_backward = frozenset(code for name, code in _opmap.items() if 'BACKWARD' in name)
+_forward = frozenset(opcode.hasjrel) - _backward
+_branches = frozenset(code for name, code in _opmap.items()
+                      if code in _hasjump and (name.startswith('JUMP') or name.startswith('POP_JUMP')))
+_unconditional = frozenset([GOTO]) | frozenset(code for name, code in _opmap.items()
+                                               if code in _hasjump and name.startswith('JUMP') and 'IF' not in name)
+_terminators = _unconditional | frozenset(_opmap[name] for name in
+                                          ('RETURN_VALUE', 'RETURN_CONST', 'RAISE_VARARGS', 'RERAISE')
+                                          if name in _opmap)
+# POP_JUMP_IF_* opcode -> truth value it jumps on, and the opcode jumping on the opposite one
+_jumps_if = {}
+_negated = {}
+for _name, _code in _opmap.items():
+    if _name.startswith('POP_JUMP') and _name.endswith(('_IF_TRUE', '_IF_FALSE')):
+        _jumps_if[_code] = _name.endswith('_IF_TRUE')
+        _opposite = _name[:-4] + 'FALSE' if _jumps_if[_code] else _name[:-5] + 'TRUE'
+        if _opposite in _opmap:
+            _negated[_code] = _opmap[_opposite]
+
+MAX_SIZE = 4096  # longest str, bytes or tuple produced by folding
+MAX_INT_BITS = 128  # widest int produced by folding
+
+_FOLDABLE_TYPES = frozenset([int, float, complex, str, bytes, bool, type(None)])
+
+
+def _foldable(value):
+    """Constants that are immutable all the way down, so folding them can't change what the code shares"""
+    if type(value) in (tuple, frozenset):
+        return all(_foldable(item) for item in value)
+    return type(value) in _FOLDABLE_TYPES
+
+
+def _binary_function(op, arg):
+    """Function computing the binary operation or comparison op with argument arg, None for other opcodes"""
+    if op == COMPARE_OP:
+        return COMPARE_OPERATORS.get(arg)
+    if op == IS_OP:
+        return operator.is_not if arg else operator.is_
+    if op == CONTAINS_OP:
+        return _not_contains if arg else _contains
+    return BINARY_OPERATORS.get(op)
+
+
+def _fold_unary(function, operand):
+    """Return (True, result) when function(operand) can be computed at assembly time"""
+    if not _foldable(operand):
+        return False, None
+    try:
+        result = function(operand)
+    except Exception:
+        return False, None
+    return _foldable(result), result
+
+
+def _fold(function, left, right):
+    """Return (True, result) when function(left, right) can be computed at assembly time"""
+    if not (_foldable(left) and _foldable(right)):
+        return False, None
+    # bools are ints too, True << 10 ** 7 is as big as 1 << 10 ** 7
+    ints = isinstance(left, int) and isinstance(right, int)
+    if function is operator.pow and ints and right > 0 and left.bit_length() * right > MAX_INT_BITS:
+        return False, None
+    if function is operator.lshift and ints and right > 0 and left.bit_length() + right > MAX_INT_BITS:
+        return False, None
+    if function is operator.mul:
+        if ints and left.bit_length() + right.bit_length() > MAX_INT_BITS:
+            return False, None
+        for sequence, count in ((left, right), (right, left)):
+            if isinstance(sequence, (str, bytes, tuple)) and isinstance(count, int) \
+                    and len(sequence) * count > MAX_SIZE:
+                return False, None
+    # formatting, '%0200000000d' % 1 is as big as its width, CPython doesn't fold it either
+    if function is operator.mod and isinstance(left, (str, bytes)):
+        return False, None
+    try:
+        result = function(left, right)
+    except Exception:
+        return False, None
+    if isinstance(result, (str, bytes, tuple)) and len(result) > MAX_SIZE:
+        return False, None
+    return _foldable(result), result
+
+
+class _Instruction(object):
+    __slots__ = ('op', 'arg', 'target', 'labels', 'origin')
+
+    def __init__(self, op, arg, origin, labels):
+        self.op = op
+        self.arg = arg
+        self.target = None
+        self.labels = labels
+        self.origin = origin
+
+    def __repr__(self):
+        name = {None: 'END', GOTO: 'GOTO'}.get(self.op) or opcode.opname[self.op]
+        return '<{0} {1} {2}>'.format(name, self.arg, self.target)
+
+
+class PeepholeOptimizer(object):
+    """
+    Rewrites the instruction stream of a Code the way CPython's peephole optimizer does:
+
+    * LOAD_CONST a; LOAD_CONST b; BINARY_* folds into LOAD_CONST (a * b) for immutable constants whose result
+      stays small, comparisons (COMPARE_OP, IS_OP, CONTAINS_OP) and UNARY_* fold the same way
+    * LOAD_CONST; POP_TOP is dropped
+    * UNARY_NOT; POP_JUMP_IF_FALSE becomes POP_JUMP_IF_TRUE and the other way round
+    * LOAD_CONST; POP_JUMP_IF_* becomes an unconditional jump or nothing, LOAD_CONST; JUMP_IF_*_OR_POP the
+      constant and an unconditional jump or nothing
+    * jumps to unconditional jumps go straight to the final target, jumps to the next instruction are removed
+    * code following a RETURN_VALUE, raise or unconditional jump that no jump reaches is removed
+
+    The passes repeat until none of them changes anything. The code is then reassembled: labels keep
+    pointing at the instruction they were bound to (or the next surviving one), folded results are added to
+    the constant pool, the stack history is carried over and stacksize recomputed from it.
+    before and after hold the instruction counts.
+    """
+
+    def __init__(self, code):
+        self.code = code
+        self.consts = code.consts
+        self.before = self.after = 0
+
+    def optimize(self):
+        instructions = self.decode()
+        self.before = len(instructions) - 1
+        instructions = self.simplify(instructions)
+        self.after = len(instructions) - 1
+        self.reassemble(instructions)
+        return self
+
+    def simplify(self, instructions):
+        """Run the passes over decoded instructions until none of them changes anything"""
+        changed = True
+        while changed:
+            instructions, changed = self.peephole(instructions)
+            changed |= self.thread_jumps(instructions)
+            instructions, removed = self.remove_dead_code(instructions)
+            changed |= removed
+            instructions, removed = self.remove_jumps_to_next(instructions)
+            changed |= removed
+        return instructions
+
+    def decode(self):
+        """Instructions of the resolved code plus a sentinel holding the labels bound at its end"""
+        code = self.code
+        code.resolve()
+        encoder = code.encoder
+        labels_at = {}
+        for label in code.blocks:
+            labels_at.setdefault(label.offset, []).append(label)
+
+        instructions = []
+        jumps = []
+        by_origin = {}
+        for offset, op, arg, after in encoder.iter_instructions(code.code):
+            instruction = _Instruction(op, arg, offset, labels_at.pop(offset, []))
+            if op in _hasjump:
+                jumps.append((instruction, encoder.jump_target(op, after, arg)))
+            instructions.append(instruction)
+            by_origin[offset] = instruction
+        end = len(code.code)
+        instructions.append(_Instruction(None, None, end, labels_at.pop(end, [])))
+        by_origin[end] = instructions[-1]
+
+        for instruction, target in jumps:
+            try:
+                landing = by_origin[target]
+            except KeyError:
+                raise AssemblerBytecodeException("Jump at {0} lands in the middle of an instruction".format(
+                    instruction.origin))
+            if not landing.labels:
+                landing.labels.append(Label())
+            instruction.target = landing.labels[0]
+        return instructions
+
+    @staticmethod
+    def _targeted(instructions):
+        return set(instruction.target for instruction in instructions if instruction.target is not None)
+
+    def peephole(self, instructions):
+        """Single pass over the instructions, folding against the tail of the already rewritten ones"""
+        targeted = self._targeted(instructions)
+        out = []
+        pending = []  # labels of dropped instructions, they move to the next instruction kept
+        changed = False
+        for instruction in instructions:
+            op = instruction.op
+            is_target = any(label in targeted for label in instruction.labels)
+            last = out[-1] if out else None
+            if last is not None and not is_target:
+                function = _binary_function(op, instruction.arg)
+                if function is not None and last.op == LOAD_CONST and len(out) > 1 \
+                        and out[-2].op == LOAD_CONST and not any(label in targeted for label in last.labels):
+                    folded, result = _fold(function, self.consts[out[-2].arg], self.consts[last.arg])
+                    if folded:
+                        out.pop()
+                        pending.extend(last.labels)
+                        pending.extend(instruction.labels)
+                        out[-1].arg = self.consts.add(result)
+                        changed = True
+                        continue
+                elif op in UNARY_OPERATORS and last.op == LOAD_CONST:
+                    folded, result = _fold_unary(UNARY_OPERATORS[op], self.consts[last.arg])
+                    if folded:
+                        pending.extend(instruction.labels)
+                        last.arg = self.consts.add(result)
+                        changed = True
+                        continue
+                elif op == POP_TOP and last.op == LOAD_CONST:
+                    out.pop()
+                    pending.extend(last.labels)
+                    pending.extend(instruction.labels)
+                    changed = True
+                    continue
+                elif op in _negated and last.op == UNARY_NOT:
+                    last.op = _negated[op]
+                    last.arg = 0
+                    last.target = instruction.target
+                    pending.extend(instruction.labels)
+                    changed = True
+                    continue
+                elif op in _jumps_if and last.op == LOAD_CONST and _foldable(self.consts[last.arg]):
+                    if bool(self.consts[last.arg]) == _jumps_if[op]:
+                        last.op, last.arg, last.target = GOTO, 0, instruction.target
+                    else:
+                        out.pop()
+                        pending.extend(last.labels)
+                    pending.extend(instruction.labels)
+                    changed = True
+                    continue
+                elif op in _jumps_or_pop and last.op == LOAD_CONST and _foldable(self.consts[last.arg]):
+                    if bool(self.consts[last.arg]) == _jumps_or_pop[op]:
+                        instruction.op, instruction.arg = GOTO, 0
+                        out.append(instruction)
+                    else:
+                        out.pop()
+                        pending.extend(last.labels)
+                        pending.extend(instruction.labels)
+                    changed = True
+                    continue
+            if pending:
+                instruction.labels = pending + instruction.labels
+                pending = []
+            out.append(instruction)
+        return out, changed
+
+    @staticmethod
+    def _where(instructions):
+        return dict((label, i) for i, instruction in enumerate(instructions) for label in instruction.labels)
+
+    @staticmethod
+    def _reaches(op, source, destination):
+        if op in _forward:
+            return destination > source
+        if op in _backward:
+            return destination <= source
+        return True
+
+    def thread_jumps(self, instructions):
+        where = self._where(instructions)
+        changed = False
+        for i, instruction in enumerate(instructions):
+            if instruction.op not in _branches and instruction.op != GOTO:
+                continue
+            target = instruction.target
+            seen = set([target])
+            while True:
+                landing = instructions[where[target]]
+                if landing.op not in _unconditional or landing.target in seen:
+                    break
+                if not self._reaches(instruction.op, i, where[landing.target]):
+                    break
+                target = landing.target
+                seen.add(target)
+            if target is not instruction.target:
+                instruction.target = target
+                changed = True
+        return changed
+
+    def remove_dead_code(self, instructions):
+        targeted = self._targeted(instructions)
+        out = []
+        pending = []
+        reachable = True
+        for instruction in instructions:
+            if instruction.op is None or any(label in targeted for label in instruction.labels):
+                reachable = True
+            if not reachable:
+                pending.extend(instruction.labels)
+                continue
+            if pending:
+                instruction.labels = pending + instruction.labels
+                pending = []
+            out.append(instruction)
+            if instruction.op in _terminators:
+                reachable = False
+        return out, len(out) != len(instructions)
+
+    def remove_jumps_to_next(self, instructions):
+        where = self._where(instructions)
+        out = []
+        pending = []
+        changed = False
+        for i, instruction in enumerate(instructions):
+            if instruction.target is not None and where[instruction.target] == i + 1:
+                if instruction.op in _unconditional:
+                    pending.extend(instruction.labels)
+                    changed = True
+                    continue
+                if instruction.op in _jumps_if:
+                    instruction.op, instruction.arg, instruction.target = POP_TOP, None, None
+                    changed = True
+            if pending:
+                instruction.labels = pending + instruction.labels
+                pending = []
+            out.append(instruction)
+        return out, changed
+
+    def _goto(self, source, destination):
+        if destination > source:
+            return JUMP_FORWARD
+        return JUMP_ABSOLUTE if JUMP_ABSOLUTE is not None else JUMP_BACKWARD
+
+    def reassemble(self, instructions):
+        code = self.code
+        where = self._where(instructions)
+        history = code.stack_history
+        del code.code[:]
+        del code.fixups[:]
+        code.index = InstructionIndex()
+        blocks = []
+        moved = []
+        for i, instruction in enumerate(instructions):
+            offset = len(code.code)
+            for label in instruction.labels:
+                label.offset = offset
+                label.fixups = len(code.fixups)
+                blocks.append(label)
+            op = instruction.op
+            if op is None:
+                break
+            moved.append((instruction.origin, offset))
+            if op == GOTO:
+                op = self._goto(i, where[instruction.target])
+            if instruction.target is not None:
+                code.fixups.append((offset, op, instruction.target))
+                code.emit_arg(op, 0)
+            elif op >= opcode.HAVE_ARGUMENT:
+                code.emit_arg(op, instruction.arg)
+            else:
+                code.emit_op(op)
+        code.blocks[:] = blocks
+
+        if len(history):
+            code.stack_history = self._move_history(history, moved, len(code.code))
+            code.stacksize = code.max_stack_depth() or 0
+        if len(code.lines):
+            code.lines = self._move_lines(code.lines, moved, len(code.code))
+        code.resolve()
+
+    @staticmethod
+    def _landing(records, moved, end):
+        """
+        Carry (offset, value) records over to the new offsets: a record at a removed instruction applies from
+        the next instruction kept on, the last record wins when several land on the same one.
+        """
+        landing = []
+        i = 0
+        for offset, value in records:
+            while i < len(moved) and moved[i][0] < offset:
+                i += 1
+            target = moved[i][1] if i < len(moved) else end
+            if landing and landing[-1][0] == target:
+                landing[-1] = (target, value)
+            else:
+                landing.append((target, value))
+        return landing
+
+    def _move_history(self, history, moved, end):
+        """Stack history carried over to the new offsets, see _landing"""
+        new = StackHistory()
+        for offset, depth in self._landing(history.items(), moved, end):
+            new.record(offset, depth)
+        return new
+
+    def _move_lines(self, lines, moved, end):
+        """Line table carried over to the new offsets, see _landing"""
+        new = LineTable()
+        new.extend(self._landing(lines.items(), moved, end))
+        return new
@@ -0,0 +1,217 @@
+import hashlib
+import marshal
+import mmap
+import os
+import struct
+import sys
+import time
+import types
+from collections import namedtuple
+from importlib.util import MAGIC_NUMBER
+
+from .assembler import Code, Persistor
+from .assemblerExceptions import PersistorException
+
+__all__ = ['MAGIC_NUMBER', 'pyc_header', 'dumps_pyc', 'write_pyc', 'PycCache', 'PycHeader', 'PycFile',
+           'read_pyc_header', 'loads_pyc', 'load_pyc', 'load_pycs']
+
+# PEP 552 flags, python 3.7 on
+FLAG_HASH_BASED = 0b01
+FLAG_CHECK_SOURCE = 0b10
+
+_HAS_FLAGS = sys.version_info >= (3, 7)
+HEADER_SIZE = 16 if _HAS_FLAGS else 12
+
+# first python 3 magic numbers with a source size field (3210, 3.3a2) and with PEP 552 flags (3.7), python 2
+# magic numbers are all above _PY2_MAGIC
+_SIZE_MAGIC = 3210
+_FLAGS_MAGIC = 3392
+_PY2_MAGIC = 20000
+
+PycHeader = namedtuple('PycHeader', 'magic flags mtime size source_hash header_size')
+PycFile = namedtuple('PycFile', 'path header code error')
+
+
+def _source_hash(data):
+    from importlib.util import source_hash
+    return source_hash(data)
+
+
+def pyc_header(source=None, mtime=None, hash_based=False, check_source=True):
+    """
+    Header of a .pyc for the running interpreter. Timestamp based headers store mtime (now by default) and
+    the size of source, hash based ones (PEP 552, 3.7 on) the hash of source, which the import system checks
+    against the source file only when check_source is set.
+    """
+    if hash_based:
+        if not _HAS_FLAGS:
+            raise PersistorException('Hash based pycs need python 3.7 or later')
+        if source is None:
+            raise PersistorException('Hash based pycs need the source to hash')
+        flags = FLAG_HASH_BASED | (FLAG_CHECK_SOURCE if check_source else 0)
+        return MAGIC_NUMBER + struct.pack('<I', flags) + _source_hash(source)
+    if mtime is None:
+        mtime = time.time()
+    size = len(source) if source is not None else 0
+    timestamp = struct.pack('<II', int(mtime) & 0xFFFFFFFF, size & 0xFFFFFFFF)
+    if _HAS_FLAGS:
+        return MAGIC_NUMBER + struct.pack('<I', 0) + timestamp
+    return MAGIC_NUMBER + timestamp
+
+
+def _code_object(code):
+    if isinstance(code, Code):
+        return Persistor().to_code_type(code)
+    if not isinstance(code, types.CodeType):
+        raise PersistorException('Invalid instance type for {0}'.format(code))
+    return code
+
+
+def dumps_pyc(code, source=None, mtime=None, hash_based=False, check_source=True):
+    """Contents of a .pyc holding code, a Code or a code object, see pyc_header for the rest"""
+    return pyc_header(source, mtime, hash_based, check_source) + marshal.dumps(_code_object(code))
+
+
+def _atomic_write(path, data):
+    import tempfile
+
+    directory = os.path.dirname(path) or '.'
+    fd, temp = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp, path)
+    except BaseException:
+        try:
+            os.unlink(temp)
+        except OSError:
+            pass
+        raise
+
+
+def write_pyc(code, path, source=None, mtime=None, hash_based=False, check_source=True):
+    """Write code as a .pyc at path. The file is written aside and renamed, readers never see half of it"""
+    _atomic_write(path, dumps_pyc(code, source, mtime, hash_based, check_source))
+
+
+class PycCache(object):
+    """
+    Directory of generated code saved as .pyc files, so the next process start loads it with a single
+    marshal.loads instead of assembling it again.
+
+    Entries live in a subdirectory named after the interpreter magic number, a different interpreter never
+    sees them. Files are hash based pycs over their own marshalled code when the interpreter supports it,
+    truncated or corrupted entries are then treated as missing.
+    """
+
+    def __init__(self, directory):
+        self.root = directory
+        self.directory = os.path.join(directory, MAGIC_NUMBER.hex())
+
+    def path(self, key):
+        name = hashlib.blake2b(key.encode('utf-8'), digest_size=20).hexdigest()
+        return os.path.join(self.directory, name + '.pyc')
+
+    def get(self, key):
+        """Code object stored under key, None when there is no valid entry"""
+        try:
+            with open(self.path(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if data[:4] != MAGIC_NUMBER or len(data) < HEADER_SIZE:
+            return None
+        body = memoryview(data)[HEADER_SIZE:]
+        if _HAS_FLAGS and struct.unpack('<I', data[4:8])[0] & FLAG_HASH_BASED:
+            if data[8:16] != _source_hash(body):
+                return None
+        try:
+            code_object = marshal.loads(body)
+        except (EOFError, ValueError, TypeError):
+            return None
+        return code_object if isinstance(code_object, types.CodeType) else None
+
+    def put(self, key, code):
+        """Store code, a Code or a code object, under key and return the code object"""
+        code_object = _code_object(code)
+        body = marshal.dumps(code_object)
+        if _HAS_FLAGS:
+            header = pyc_header(body, hash_based=True, check_source=False)
+        else:
+            header = pyc_header(body, mtime=0)
+        os.makedirs(self.directory, exist_ok=True)
+        _atomic_write(self.path(key), header + body)
+        return code_object
+
+    def get_or_build(self, key, build):
+        """Code object under key, calling build() for a Code or code object and storing it when missing"""
+        code_object = self.get(key)
+        if code_object is None:
+            code_object = self.put(key, build())
+        return code_object
+
+    def remove(self, key):
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+
+def read_pyc_header(data):
+    """
+    Parse the header at the start of data by its magic number: 8 bytes up to python 3.2 (magic, mtime),
+    12 bytes for 3.3 to 3.6 (plus the source size) and 16 bytes from 3.7 on (PEP 552 flags, then mtime and
+    size or the source hash). Fields a header doesn't have are None.
+    """
+    if len(data) < 8 or bytes(data[2:4]) != b'\r\n':
+        raise PersistorException('Not a pyc file')
+    magic = bytes(data[:4])
+    number = struct.unpack('<H', data[:2])[0]
+    if number >= _PY2_MAGIC or number < _SIZE_MAGIC:
+        return PycHeader(magic, None, struct.unpack('<I', data[4:8])[0], None, None, 8)
+    if number < _FLAGS_MAGIC:
+        if len(data) < 12:
+            raise PersistorException('Truncated pyc header')
+        mtime, size = struct.unpack('<II', data[4:12])
+        return PycHeader(magic, None, mtime, size, None, 12)
+    if len(data) < 16:
+        raise PersistorException('Truncated pyc header')
+    flags = struct.unpack('<I', data[4:8])[0]
+    if flags & FLAG_HASH_BASED:
+        return PycHeader(magic, flags, None, None, bytes(data[8:16]), 16)
+    mtime, size = struct.unpack('<II', data[8:16])
+    return PycHeader(magic, flags, mtime, size, None, 16)
+
+
+def loads_pyc(data):
+    """(header, code object) of the pyc contents in data, any bytes like object"""
+    header = read_pyc_header(data)
+    with memoryview(data)[header.header_size:] as body:
+        try:
+            code_object = marshal.loads(body)
+        except (EOFError, ValueError, TypeError) as e:
+            raise PersistorException('Invalid pyc data: {0}'.format(e))
+    return header, code_object
+
+
+def load_pyc(path):
+    """(header, code object) of the .pyc at path, unmarshalled straight from a memory map of the file"""
+    with open(path, 'rb') as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can't be mapped
+            raise PersistorException('Not a pyc file')
+    with buffer:
+        return loads_pyc(buffer)
+
+
+def load_pycs(paths):
+    """Yield a PycFile(path, header, code, error) per path, a failing file only sets its error"""
+    for path in paths:
+        try:
+            header, code_object = load_pyc(path)
+        except (OSError, PersistorException) as e:
+            yield PycFile(path, None, None, e)
+        else:
+            yield PycFile(path, header, code_object, None)
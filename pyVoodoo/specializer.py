@@ -0,0 +1,171 @@
+import opcode
+import types
+
+from .assemblerExceptions import PersistorException
+from .flags import CO_VARARGS, CO_VARKEYWORDS
+from .peephole import PeepholeOptimizer, _Instruction
+from .tables import SymbolTable
+
+__all__ = ['Specializer', 'specialize', 'specialize_function']
+
+_opmap = opcode.opmap
+LOAD_CONST = _opmap['LOAD_CONST']
+LOAD_FAST = _opmap['LOAD_FAST']
+STORE_FAST = _opmap['STORE_FAST']
+STORE_DEREF = _opmap['STORE_DEREF']
+_haslocal = frozenset(opcode.haslocal)
+# instructions after which the straight line code a function starts with may stop
+_prefix_ends = frozenset(code for name, code in _opmap.items()
+                         if name.startswith(('SETUP_', 'RETURN_', 'RAISE_', 'YIELD_', 'GEN_START', 'RERAISE')))
+
+
+class Specializer(PeepholeOptimizer):
+    """
+    Partial evaluation of a Code for known argument values, in place: the known arguments leave the
+    signature, their LOAD_FASTs become LOAD_CONSTs and the peephole passes then fold the constant operations
+    and branches and drop the paths no longer reached, locals set once from a constant on entry being
+    replaced by it too (see propagate_constants). Only immutable values (see peephole._foldable) fold, other
+    values are still loaded as constants.
+
+    Arguments the code assigns or deletes, and arguments captured by closures, are set from their constant
+    once on entry instead. Known arguments left without any use are dropped from varnames.
+    """
+
+    def __init__(self, code, known):
+        PeepholeOptimizer.__init__(self, code)
+        self.known = known
+
+    def optimize(self):
+        code = self.code
+        names = code.varnames.as_tuple()
+        total = code.argcount + code.kwonlyargcount
+        for name in self.known:
+            slot = code.varnames.get(name)
+            if slot is None or slot >= total:
+                raise PersistorException("{0} has no argument {1}".format(code.name, name))
+
+        instructions = self.decode()
+        self.before = len(instructions) - 1
+        known = dict((names.index(name), value) for name, value in self.known.items())
+        assigned = set(instruction.arg for instruction in instructions
+                       if instruction.op in _haslocal and instruction.op != LOAD_FAST and instruction.arg in known)
+        prologue = []
+        for slot, value in sorted(known.items()):
+            name = names[slot]
+            if name in code.cellvars:
+                prologue.append(_Instruction(LOAD_CONST, self.consts.add(value), -1, []))
+                prologue.append(_Instruction(STORE_DEREF, code.cellvars.get(name), -1, []))
+            elif slot in assigned:
+                prologue.append(_Instruction(LOAD_CONST, self.consts.add(value), -1, []))
+                prologue.append(_Instruction(STORE_FAST, slot, -1, []))
+        for instruction in instructions:
+            if instruction.op == LOAD_FAST and instruction.arg in known and instruction.arg not in assigned:
+                instruction.op, instruction.arg = LOAD_CONST, self.consts.add(known[instruction.arg])
+        instructions = prologue + instructions
+
+        # remaining arguments, *args and **kwargs first, then the known arguments still used as locals
+        arguments = total + bool(code.flags & CO_VARARGS) + bool(code.flags & CO_VARKEYWORDS)
+        kept = [slot for slot in range(total) if slot not in known]
+        kept += range(total, arguments)
+        kept += sorted(slot for slot in known if any(instruction.op in _haslocal and instruction.arg == slot
+                                                     for instruction in instructions))
+        kept += range(arguments, len(names))
+        slots = dict((old, new) for new, old in enumerate(kept))
+        for instruction in instructions:
+            if instruction.op in _haslocal:
+                instruction.arg = slots[instruction.arg]
+        code.varnames = SymbolTable([names[slot] for slot in kept])
+        positional = code.argcount
+        code.posonlyargcount -= sum(1 for slot in known if slot < code.posonlyargcount)
+        code.argcount -= sum(1 for slot in known if slot < positional)
+        code.kwonlyargcount -= sum(1 for slot in known if slot >= positional)
+        if prologue:
+            code.stacksize = max(code.stacksize, 1)
+
+        locals_start = arguments - len(known)
+        changed = True
+        while changed:
+            instructions = self.simplify(instructions)
+            instructions, changed = self.propagate_constants(instructions, locals_start)
+        self.after = len(instructions) - 1
+        self.reassemble(instructions)
+        return self
+
+    def propagate_constants(self, instructions, first):
+        """
+        Replace the loads of locals from slot first on that are only ever stored once, from a constant, in the
+        straight line code the function starts with: every later load sees that constant. Stores left without
+        loads are dropped with their constant.
+        """
+        stores = {}
+        for instruction in instructions:
+            if instruction.op in _haslocal and instruction.op != LOAD_FAST:
+                stores[instruction.arg] = stores.get(instruction.arg, 0) + 1
+        targeted = self._targeted(instructions)
+        constants = {}
+        store_at = {}
+        for i, instruction in enumerate(instructions):
+            if instruction.op is None or any(label in targeted for label in instruction.labels):
+                break
+            if instruction.target is not None or instruction.op in _prefix_ends:
+                break
+            if instruction.op == STORE_FAST and i and instruction.arg >= first and stores[instruction.arg] == 1 \
+                    and instructions[i - 1].op == LOAD_CONST:
+                constants[instruction.arg] = instructions[i - 1].arg
+                store_at[instruction.arg] = i
+        if not constants:
+            return instructions, False
+
+        loaded = set()
+        changed = False
+        for i, instruction in enumerate(instructions):
+            if instruction.op == LOAD_FAST and instruction.arg in constants:
+                if i > store_at[instruction.arg]:
+                    instruction.op, instruction.arg = LOAD_CONST, constants[instruction.arg]
+                    changed = True
+                else:
+                    loaded.add(instruction.arg)
+        dropped = set()
+        for slot, i in store_at.items():
+            if slot not in loaded and not (instructions[i - 1].labels or instructions[i].labels):
+                dropped.update((i - 1, i))
+        if dropped:
+            instructions = [instruction for i, instruction in enumerate(instructions) if i not in dropped]
+        return instructions, changed or bool(dropped)
+
+
+def _source_code(source):
+    from .assembler import Code, PythonParser
+
+    if isinstance(source, types.FunctionType):
+        source = source.__code__
+    elif isinstance(source, Code):
+        source = source.to_code_type()
+    if not isinstance(source, types.CodeType):
+        raise PersistorException('Invalid instance type for {0}'.format(source))
+    return PythonParser().parse(source)
+
+
+def specialize(source, known):
+    """
+    New Code of source (a Code, a code object or a function) specialized for known, a dict of argument name ->
+    value, see Specializer. The Code source is left untouched.
+    """
+    code = _source_code(source)
+    Specializer(code, known).optimize()
+    return code
+
+
+def specialize_function(function, known, globals=None):
+    """function specialized for known, see specialize, with the defaults and closure of the remaining arguments"""
+    code = specialize(function, known)
+    remaining = function.__code__.co_varnames[:function.__code__.co_argcount]
+    defaults = function.__defaults__ or ()
+    defaulted = remaining[len(remaining) - len(defaults):]
+    defaults = tuple(value for name, value in zip(defaulted, defaults) if name not in known) or None
+    specialized = code.to_function(function.__globals__ if globals is None else globals, function.__name__,
+                                   defaults, function.__closure__)
+    if function.__kwdefaults__:
+        specialized.__kwdefaults__ = dict((name, value) for name, value in function.__kwdefaults__.items()
+                                          if name not in known) or None
+    return specialized
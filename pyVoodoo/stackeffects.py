@@ -1,4 +1,8 @@
 import sys
+from array import array
+from bisect import bisect_right
+
+__all__ = ['StackHistory']
 
 class _se(object):
     """Quick way of defining static stack effects of opcodes"""
@@ -45,3 +49,74 @@ class _se(object):
 
 if sys.version >= "2.5":
     _se.YIELD_VALUE = 1, 1
+
+
+class StackHistory(object):
+    """
+    Stack depth on entry to every instruction of a Code, run length encoded: an (offset, depth) pair is only
+    stored where the depth changes, in two arrays. Unknown depths (after RETURN_VALUE or an unconditional
+    jump) are stored as -1 and reported as None.
+    """
+    __slots__ = ('offsets', 'depths', '_last')
+
+    def __init__(self):
+        self.offsets = array('I')
+        self.depths = array('i')
+        self._last = -1
+
+    def record(self, offset, depth):
+        """Record the entry depth of the instruction at offset, later records for the same offset are ignored"""
+        if offset <= self._last:
+            return
+        self._last = offset
+        if depth is None:
+            depth = -1
+        if not self.depths or self.depths[-1] != depth:
+            self.offsets.append(offset)
+            self.depths.append(depth)
+
+    def extend(self, records):
+        """record every (offset, depth) pair of records, in increasing offset order"""
+        offsets, depths = self.offsets, self.depths
+        last = self._last
+        current = depths[-1] if depths else None
+        for offset, depth in records:
+            if offset <= last:
+                continue
+            last = offset
+            if depth is None:
+                depth = -1
+            if depth != current:
+                offsets.append(offset)
+                depths.append(depth)
+                current = depth
+        self._last = last
+
+    def depth_at(self, offset):
+        i = bisect_right(self.offsets, offset) - 1
+        if i < 0 or self.depths[i] < 0:
+            return None
+        return self.depths[i]
+
+    def max_depth(self, start=0, end=None):
+        """Maximum depth at the instruction boundaries in [start, end]"""
+        first = max(bisect_right(self.offsets, start) - 1, 0)
+        last = len(self.offsets) if end is None else bisect_right(self.offsets, end)
+        if first >= last:
+            return None
+        depth = max(self.depths[first:last])
+        return None if depth < 0 else depth
+
+    def relocate(self, move):
+        """Rewrite the recorded offsets with move, a function of the whole (sorted) offsets array"""
+        self.offsets = move(self.offsets)
+        self._last = self.offsets[-1] if self.offsets else -1
+
+    def items(self):
+        return zip(self.offsets, (None if depth < 0 else depth for depth in self.depths))
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __repr__(self):
+        return 'StackHistory({0!r})'.format(list(self.items()))
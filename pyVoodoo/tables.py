@@ -0,0 +1,168 @@
+import math
+from array import array
+
+from .utils import is_hashable
+
+__all__ = ['ConstantPool', 'SymbolTable', 'InstructionIndex']
+
+
+class _IndexedTable(object):
+    """Insertion ordered list of entries plus a key -> slot dict, subclasses define how entries are keyed"""
+
+    def __init__(self, entries=()):
+        self._items = []
+        self._index = {}
+        for entry in entries:
+            self.add(entry)
+
+    @staticmethod
+    def _key(entry):
+        return entry
+
+    def add(self, entry):
+        """Return the slot of entry, appending it to the table if it isn't there yet"""
+        key = self._key(entry)
+        try:
+            return self._index[key]
+        except KeyError:
+            arg = self._index[key] = len(self._items)
+            self._items.append(entry)
+            return arg
+
+    def append(self, entry):
+        """Allocate a new slot for entry, like list.append. Lookups keep resolving to the first slot of it"""
+        self._index.setdefault(self._key(entry), len(self._items))
+        self._items.append(entry)
+
+    def truncate(self, size):
+        """Drop the entries from slot size on, undoing the adds and appends made since the table had size entries"""
+        for entry in self._items[size:]:
+            key = self._key(entry)
+            if self._index.get(key, -1) >= size:
+                del self._index[key]
+        del self._items[size:]
+
+    def get(self, entry, default=None):
+        return self._index.get(self._key(entry), default)
+
+    def index(self, entry):
+        try:
+            return self._index[self._key(entry)]
+        except KeyError:
+            raise ValueError('{0!r} is not in the {1}'.format(entry, type(self).__name__))
+
+    def as_tuple(self):
+        return tuple(self._items)
+
+    def __contains__(self, entry):
+        return self._key(entry) in self._index
+
+    def __getitem__(self, item):
+        return self._items[item]
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __eq__(self, other):
+        if isinstance(other, _IndexedTable):
+            other = other._items
+        try:
+            return self._items == list(other)
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '{0}({1!r})'.format(type(self).__name__, self._items)
+
+
+class ConstantPool(_IndexedTable):
+    """
+    Ordered pool of constants with O(1) lookup.
+
+    Hashable constants are keyed like CPython's _PyCode_ConstantKey: by (type, value), so 1, 1.0 and True get
+    separate slots even though they compare equal, with the sign of float and complex zeros as a tag so 0.0
+    and -0.0 stay apart too, and tuples and frozensets keyed item by item. Unhashable constants are keyed by
+    identity, the pool keeps a reference to them so the id can't be reused while the entry lives.
+    """
+
+    @staticmethod
+    def _key(const):
+        if not is_hashable(const):
+            return id, id(const)
+        kind = type(const)
+        if kind is float:
+            if const == 0.0 and math.copysign(1.0, const) < 0:
+                return kind, const, None
+        elif kind is complex:
+            return kind, const, (math.copysign(1.0, const.real), math.copysign(1.0, const.imag))
+        elif kind is tuple:
+            return kind, tuple(ConstantPool._key(item) for item in const)
+        elif kind is frozenset:
+            return kind, frozenset(ConstantPool._key(item) for item in const)
+        return kind, const
+
+
+class SymbolTable(_IndexedTable):
+    """
+    Ordered table of names (varnames, names, freevars, cellvars) with O(1) slot lookup and allocation.
+    """
+
+
+class InstructionIndex(object):
+    """
+    Start offset of every instruction of a Code (EXTENDED_ARG prefixes included) in emission order, plus
+    the offsets of every opcode, both kept in arrays and filled in as instructions are emitted.
+    """
+    __slots__ = ('starts', 'by_opcode')
+
+    def __init__(self):
+        self.starts = array('I')
+        self.by_opcode = {}
+
+    def add(self, offset, op):
+        self.starts.append(offset)
+        offsets = self.by_opcode.get(op)
+        if offsets is None:
+            offsets = self.by_opcode[op] = array('I')
+        offsets.append(offset)
+
+    def extend(self, instructions):
+        """add every (offset, opcode) pair of instructions, in increasing offset order"""
+        grouped = {}
+        starts = []
+        for offset, op in instructions:
+            starts.append(offset)
+            offsets = grouped.get(op)
+            if offsets is None:
+                offsets = grouped[op] = []
+            offsets.append(offset)
+        self.starts.extend(starts)
+        by_opcode = self.by_opcode
+        for op, offsets in grouped.items():
+            if op in by_opcode:
+                by_opcode[op].extend(offsets)
+            else:
+                by_opcode[op] = array('I', offsets)
+
+    def rebuild(self, instructions):
+        """Index (offset, opcode) pairs from scratch, for when the code is rewritten as a whole"""
+        self.starts = array('I')
+        self.by_opcode = {}
+        add = self.add
+        for offset, op in instructions:
+            add(offset, op)
+
+    def offsets(self, op):
+        return self.by_opcode.get(op, ())
+
+    def __len__(self):
+        return len(self.starts)
@@ -0,0 +1,118 @@
+import types
+
+from .assembler import Code, Persistor
+from .assemblerExceptions import AssemblerBytecodeException, PersistorException
+
+__all__ = ['Placeholder', 'Template']
+
+
+class Placeholder(object):
+    """
+    Stand in for a constant or a name of a Code that becomes a Template, filled in by Template.specialize.
+    Placeholders with the same key share their table slot.
+    """
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __eq__(self, other):
+        return isinstance(other, Placeholder) and other.key == self.key
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((Placeholder, self.key))
+
+    def __repr__(self):
+        return 'Placeholder({0!r})'.format(self.key)
+
+
+class Template(object):
+    """
+    A Code assembled once and stamped out into specialized code objects. The code object is finished when
+    the template is made, placeholders in the constants and names are remembered by slot, so specialize only
+    patches those tables (and the arguments registered with patch_arg) and calls CodeType.replace.
+    """
+
+    def __init__(self, code):
+        if not isinstance(code, Code):
+            raise PersistorException('Invalid instance type for {0}'.format(code))
+        code.resolve()
+        self.encoder = code.encoder
+        self.consts = list(code.consts)
+        self.names = list(code.names)
+        self.const_slots = [(i, const.key) for i, const in enumerate(self.consts) if isinstance(const, Placeholder)]
+        self.name_slots = [(i, name.key) for i, name in enumerate(self.names) if isinstance(name, Placeholder)]
+        for i, key in self.name_slots:
+            if not isinstance(key, str):
+                raise PersistorException('Name placeholder keys must be strings, got {0!r}'.format(key))
+        fields = Persistor._fields(code)
+        # co_names only takes strings, placeholders go in as their key until specialized
+        fields['co_names'] = tuple(name.key if isinstance(name, Placeholder) else name for name in self.names)
+        fields['co_consts'] = tuple(None if isinstance(c, Placeholder) else c for c in self.consts)
+        self.fields = fields
+        self.code_object = Persistor._build_fields(fields)
+        self.arg_slots = []
+
+    def patch_arg(self, key, offset):
+        """
+        Let specialize set the argument of the instruction at offset from the value of key. The new argument
+        has to fit in the EXTENDED_ARG prefixes the instruction already has.
+        """
+        for start, op, arg, end in self.encoder.iter_instructions(self.code_object.co_code):
+            if start <= offset < end:
+                self.arg_slots.append((key, start, op, (end - start - self.encoder.instruction_size(op)) //
+                                       self.encoder.prefix_size))
+                return
+        raise AssemblerBytecodeException('No instruction at offset {0}'.format(offset))
+
+    @staticmethod
+    def _value(values, key):
+        try:
+            return values[key]
+        except KeyError:
+            raise PersistorException('No value for placeholder {0!r}'.format(key))
+
+    def specialize(self, **values):
+        """Code object with every placeholder replaced by the value given for its key"""
+        changes = {}
+        if self.const_slots:
+            consts = list(self.consts)
+            for i, key in self.const_slots:
+                consts[i] = self._value(values, key)
+            changes['co_consts'] = tuple(consts)
+        if self.name_slots:
+            names = list(self.names)
+            for i, key in self.name_slots:
+                name = names[i] = self._value(values, key)
+                # replace aborts the interpreter on names that aren't strings
+                if not isinstance(name, str):
+                    raise PersistorException('Name for placeholder {0!r} is not a string: {1!r}'.format(key, name))
+            changes['co_names'] = tuple(names)
+        if self.arg_slots:
+            code = bytearray(self.code_object.co_code)
+            encoder = self.encoder
+            for key, start, op, prefixes in self.arg_slots:
+                arg = self._value(values, key)
+                if encoder.prefixes(arg) > prefixes:
+                    raise AssemblerBytecodeException('{0} for {1!r} needs a wider argument than the template has'
+                                                     .format(arg, key))
+                patched = bytearray()
+                encoder.emit_padded(patched, op, arg, prefixes)
+                code[start:start + len(patched)] = patched
+            changes['co_code'] = bytes(code)
+        if not changes:
+            return self.code_object
+        try:
+            if hasattr(self.code_object, 'replace'):
+                return self.code_object.replace(**changes)
+            fields = dict(self.fields)
+            fields.update(changes)
+            return Persistor._build_fields(fields)
+        except (TypeError, ValueError) as e:
+            raise PersistorException('Invalid code object for {0}: {1}'.format(self.code_object.co_name, e))
+
+    def function(self, globals=None, **values):
+        return types.FunctionType(self.specialize(**values), {} if globals is None else globals)
@@ -5,3 +5,11 @@ def listify(gen):
         return list(gen(*args, **kwargs))
 
     return patched
+
+
+def is_hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
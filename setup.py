@@ -13,7 +13,7 @@ setup(name='PyVoodoo',
       url='https://github.com/bossiernesto/pyVoodoo',
       license='GPL v3',
       keywords='',
-      packages=find_packages(exclude=["test"]),
+      packages=find_packages(exclude=["test", "benchmarks"]),
       data_files=[
           (templates_dir, templates_files)
       ],
@@ -1 +1,5 @@
+import sys
+from unittest import skipIf
 
+# generating python 3.11+ bytecode isn't supported, see pyVoodoo.encoding.encoder_for_version
+supported_bytecode = skipIf(sys.version_info >= (3, 11), "python 3.11 bytecode is not supported")
@@ -9,4 +9,9 @@ def load_and_return():
 
 def not_and_pop():
     a = 1
-    not a
\ No newline at end of file
+    not a
+
+def branch(x):
+    if x:
+        return 1
+    return 2
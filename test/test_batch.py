@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from pyVoodoo.assembler import PythonParser
+from pyVoodoo.batch import iter_sources, compile_batch
+
+
+class BatchCompileTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write('a.py', 'value = 1\n')
+        self.write('broken.py', 'def (:\n')
+        self.write('notes.txt', 'not python')
+        os.mkdir(os.path.join(self.directory, 'pkg'))
+        for i in range(5):
+            self.write(os.path.join('pkg', 'm{0}.py'.format(i)), 'value = {0}\n'.format(i))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, source):
+        with open(os.path.join(self.directory, name), 'w') as f:
+            f.write(source)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def check(self, results):
+        results = dict((result.path, result) for result in results)
+        self.assertEqual(7, len(results))
+        self.assertIsInstance(results[self.path('broken.py')].error, SyntaxError)
+        self.assertIsNone(results[self.path('broken.py')].code)
+        namespace = {}
+        exec(results[self.path(os.path.join('pkg', 'm3.py'))].code, namespace)
+        self.assertEqual(3, namespace['value'])
+        self.assertEqual(self.path('a.py'), results[self.path('a.py')].code.co_filename)
+
+    def test_iter_sources(self):
+        sources = list(iter_sources(self.directory))
+        self.assertEqual(self.path('a.py'), sources[0])
+        self.assertEqual(7, len(sources))
+        self.assertEqual(['x.py'], list(iter_sources('x.py')))
+
+    def test_in_process(self):
+        self.check(compile_batch(self.directory, workers=1))
+
+    def test_process_pool(self):
+        self.check(PythonParser().compile_batch([self.directory], workers=2, chunksize=2, max_pending=2))
+
+    def test_missing_file(self):
+        result, = compile_batch([self.path('missing.py')], workers=1)
+        self.assertIsInstance(result.error, OSError)
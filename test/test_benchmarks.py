@@ -0,0 +1,101 @@
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from unittest import TestCase
+from benchmarks import CASES, case
+from benchmarks import suite
+from pyVoodoo.assemblerExceptions import AssemblerBytecodeException
+
+
+def results(**ns_per_op):
+    return {'results': dict((name, {'ns_per_op': value}) for name, value in ns_per_op.items())}
+
+
+class CompareTest(TestCase):
+    def test_regressions(self):
+        rows, regressions = suite.compare(results(a=120.0, b=105.0, c=50.0), results(a=100.0, b=100.0, c=100.0))
+        self.assertEqual(['a'], regressions)
+        self.assertEqual({'a': 0.2, 'b': 0.05, 'c': -0.5},
+                         dict((name, round(change, 6)) for name, old, new, change in rows))
+
+    def test_threshold(self):
+        self.assertEqual(['b'], suite.compare(results(b=105.0), results(b=100.0), threshold=0.01)[1])
+        self.assertEqual([], suite.compare(results(a=120.0), results(a=100.0), threshold=0.5)[1])
+
+    def test_cases_missing_from_either_side(self):
+        rows, regressions = suite.compare(results(new=500.0, a=100.0), results(gone=1.0, a=100.0))
+        self.assertEqual([('a', 100.0, 100.0, 0.0)], rows)
+        self.assertEqual([], regressions)
+
+
+class RunTest(TestCase):
+    def setUp(self):
+        self.names = []
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for name in self.names:
+            del CASES[name]
+        shutil.rmtree(self.directory)
+
+    def register(self, name, ops, setup, self_timed=False):
+        self.names.append(name)
+        case(name, ops, self_timed)(setup)
+
+    def test_run(self):
+        calls = []
+        self.register('test/counted', 10, lambda ops: lambda: calls.append(ops))
+        self.register('test/self_timed', 4, lambda ops: lambda: 2e-6, self_timed=True)
+        self.register('other/ignored', 1, lambda ops: self.fail("not in the group"))
+
+        timings, skipped = suite.run(repeat=3, scale=0.5, group='test')
+        self.assertEqual(['test/counted', 'test/self_timed'], list(timings))
+        self.assertEqual([5, 5, 5], calls)
+        self.assertEqual(5, timings['test/counted']['ops'])
+        self.assertEqual((2e-6, 2e-6, 1000.0), tuple(timings['test/self_timed'][key] for key in (
+            'best', 'median', 'ns_per_op')))
+        self.assertEqual({}, skipped)
+
+    def test_unsupported_bytecode_is_skipped(self):
+        def setup(ops):
+            raise AssemblerBytecodeException("Python 3.11 bytecode is not supported")
+        self.register('test/unsupported', 1, setup)
+
+        timings, skipped = suite.run(group='test')
+        self.assertEqual({}, timings)
+        self.assertEqual({'test/unsupported': "Python 3.11 bytecode is not supported"}, skipped)
+
+    def test_main_baseline(self):
+        self.register('test/fixed', 1, lambda ops: lambda: 1e-3, self_timed=True)
+        baseline = os.path.join(self.directory, 'baseline.json')
+        with open(baseline, 'w') as f:
+            json.dump(dict(suite.report(results(**{'test/fixed': 1e5})['results'], {}, 1)), f)
+
+        with redirect_stdout(io.StringIO()) as out:
+            self.assertEqual(1, suite.main(['--baseline', baseline, '--repeat', '1'], 'test'))
+        self.assertIn('1 regression(s) over 10%: test/fixed', out.getvalue())
+
+        output = os.path.join(self.directory, 'results.json')
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(0, suite.main(['--output', output, '--repeat', '1'], 'test'))
+        with open(output) as f:
+            self.assertEqual(1e6, json.load(f)['results']['test/fixed']['ns_per_op'])
+
+
+class CasesTest(TestCase):
+    def test_modules_register_their_group(self):
+        suite.load_cases()
+        groups = set(name.split('/')[0] for name in CASES)
+        for module in suite.MODULES:
+            self.assertIn(module[len('bench_'):], groups)
+
+    def test_interpreter_support(self):
+        timings, skipped = suite.run(['load_const/100'], repeat=1, scale=0.01)
+        if sys.version_info >= (3, 11):
+            self.assertIn('load_const/100', skipped)
+        else:
+            self.assertIn('load_const/100', timings)
@@ -0,0 +1,95 @@
+import gc
+from unittest import TestCase
+from pyVoodoo.assembler import Code
+from pyVoodoo.codecache import CodeCache, code_digest
+from test import supported_bytecode
+
+
+def build(value):
+    code = Code()
+    code.LOAD_CONST(value)
+    code.RETURN_VALUE()
+    return code
+
+
+@supported_bytecode
+class CodeDigestTest(TestCase):
+    def test_identical_code_same_digest(self):
+        self.assertEqual(code_digest(build(1)), code_digest(build(1)))
+
+    def test_constant_types_differ(self):
+        digests = set(code_digest(build(value)) for value in (1, 1.0, True, -0.0, 0.0))
+        self.assertEqual(5, len(digests))
+
+    def test_runtime_built_strings_same_digest(self):
+        first, second = Code(), Code()
+        first.LOAD_GLOBAL('len')
+        second.LOAD_GLOBAL(''.join(['l', 'en']))
+        for code, text in ((first, 'name'), (second, ''.join(['na', 'me']))):
+            code.LOAD_CONST((text, frozenset([text, 'other']), 2 ** 70))
+            code.BUILD_TUPLE(2)
+            code.RETURN_VALUE()
+        self.assertEqual(code_digest(first), code_digest(second))
+
+    def test_names_and_flags_differ(self):
+        first, second = build(1), build(1)
+        second.name = 'other'
+        self.assertNotEqual(code_digest(first), code_digest(second))
+        second.name = first.name
+        second.flags |= 0x20
+        self.assertNotEqual(code_digest(first), code_digest(second))
+
+    def test_unhashable_constant_by_identity(self):
+        marker = object()
+        self.assertEqual(code_digest(build(marker)), code_digest(build(marker)))
+        self.assertNotEqual(code_digest(build(marker)), code_digest(build(object())))
+
+
+@supported_bytecode
+class CodeCacheTest(TestCase):
+    def setUp(self):
+        self.cache = CodeCache(maxsize=2)
+
+    def test_hit_returns_same_code_object(self):
+        first = self.cache.code_type(build(1))
+        second = build(1)
+
+        self.assertIs(first, self.cache.code_type(second))
+        self.assertIs(first, second.to_code_type())
+        self.assertEqual((1, 1, 0, 2, 1), tuple(self.cache.info()))
+
+    def test_lru_eviction(self):
+        one = self.cache.code_type(build(1))
+        self.cache.code_type(build(2))
+        self.cache.code_type(build(1))
+        self.cache.code_type(build(3))
+
+        self.assertEqual(1, self.cache.info().evictions)
+        self.assertIs(one, self.cache.code_type(build(1)))
+        self.cache.code_type(build(2))
+        self.assertEqual((2, 4, 2, 2, 2), tuple(self.cache.info()))
+
+    def test_function_shared_per_globals(self):
+        namespace = {}
+        function = self.cache.function(build(1), namespace)
+
+        self.assertEqual(1, function())
+        self.assertIs(function, self.cache.function(build(1), namespace))
+        self.assertIsNot(function, self.cache.function(build(1), {}))
+        self.assertIs(function.__code__, self.cache.function(build(1)).__code__)
+
+    def test_weak_entries_collected(self):
+        cache = CodeCache(weak=True)
+        function = cache.function(build(1))
+        self.assertEqual(2, len(cache))
+        del function
+        gc.collect()
+
+        self.assertEqual(0, len(cache))
+        cache.function(build(1))
+        self.assertEqual(0, cache.info().hits)
+
+    def test_clear(self):
+        self.cache.code_type(build(1))
+        self.cache.clear()
+        self.assertEqual((0, 0, 0, 2, 0), tuple(self.cache.info()))
@@ -0,0 +1,64 @@
+import io
+import json
+from unittest import TestCase
+from pyVoodoo.codedumper import PythonCodeDumper
+from test import supported_bytecode
+
+SOURCE = """
+def outer(x):
+    def inner(y):
+        return x + y
+    return inner
+
+class Point(object):
+    pass
+"""
+
+
+@supported_bytecode
+class CodeDumperTest(TestCase):
+    def setUp(self):
+        self.module = compile(SOURCE, '<string>', 'exec')
+        self.dumper = PythonCodeDumper()
+
+    def test_records_breadth_first(self):
+        records = list(self.dumper.records(self.module))
+
+        self.assertEqual(['<module>', 'outer', 'Point', 'inner'], [r['name'] for r in records])
+        self.assertEqual([None, 0, 0, 1], [r['parent'] for r in records])
+        self.assertIn({'code': 1}, records[0]['consts'])
+        self.assertEqual(self.module.co_code, records[0]['code'])
+
+    def test_json_lines_text(self):
+        stream = io.StringIO()
+        self.dumper.dump_json(self.module, stream, instructions=True, buffer_size=16)
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+
+        self.assertEqual(4, len(lines))
+        self.assertEqual(self.module.co_code.hex(), lines[0]['code'])
+        self.assertEqual('LOAD_CONST', lines[0]['instructions'][0][1])
+        self.assertEqual(['x'], lines[1]['cellvars'])
+        self.assertEqual(['y'], lines[3]['varnames'])
+
+    def test_json_lines_binary(self):
+        stream = io.BytesIO()
+        self.dumper.dump_json_many([self.module, self.module.co_consts[0]], stream)
+        lines = stream.getvalue().decode('utf-8').splitlines()
+
+        self.assertEqual(6, len(lines))
+        self.assertEqual('outer', json.loads(lines[4])['name'])
+
+    def test_tree(self):
+        tree = self.dumper.dump_tree(self.module)
+
+        self.assertEqual(['outer', 'Point'], [child['name'] for child in tree['children']])
+        self.assertEqual('inner', tree['children'][0]['children'][0]['name'])
+        self.assertEqual(self.module.co_lnotab.hex(), tree['lnotab'])
+
+    def test_deep_nesting(self):
+        source = 'x = 1\n'
+        for i in range(90):
+            source = 'def f{0}():\n{1}'.format(i, ''.join('    ' + line + '\n' for line in source.splitlines()))
+        records = list(self.dumper.records(compile(source, '<string>', 'exec')))
+
+        self.assertEqual(91, len(records))
@@ -0,0 +1,86 @@
+import dis
+import sys
+from itertools import islice
+from unittest import TestCase, skipIf
+from pyVoodoo.assembler import Code, PythonParser
+from pyVoodoo.assemblerExceptions import AssemblerBytecodeException
+from pyVoodoo.disassembler import disassemble, iter_code_objects
+from test.fixture.code_test_fixture import branch
+from test import supported_bytecode
+
+SOURCE = """
+def outer(x):
+    def inner(y):
+        return x + y
+    return inner
+
+value = outer(1)(2)
+"""
+
+
+@supported_bytecode
+class DisassemblerTest(TestCase):
+    def setUp(self):
+        self.module = compile(SOURCE, '<string>', 'exec')
+
+    def test_matches_dis(self):
+        expected = [(i.offset, i.opcode, i.argval) for i in dis.get_instructions(branch)]
+        decoded = [(i.offset, i.op, i.argval) for i in disassemble(branch.__code__)]
+
+        self.assertEqual(expected, decoded)
+
+    def test_records(self):
+        first = next(disassemble(self.module))
+
+        self.assertIs(self.module, first.code)
+        self.assertEqual((0, 'LOAD_CONST'), (first.offset, first.name))
+        self.assertEqual(self.module.co_consts[first.arg], first.argval)
+
+    def test_recursive_is_lazy(self):
+        outer = self.module.co_consts[0]
+        names = set(i.code.co_name for i in disassemble(self.module, recursive=True))
+        count = len(list(disassemble(self.module)))
+        prefix = list(islice(disassemble(self.module, recursive=True), count + 1))
+
+        self.assertEqual({'<module>', 'outer', 'inner'}, names)
+        self.assertIs(outer, prefix[-1].code)
+
+    def test_iter_code_objects(self):
+        self.assertEqual(['<module>', 'outer', 'inner'], [c.co_name for c in iter_code_objects(self.module)])
+
+
+@supported_bytecode
+class ParseTest(TestCase):
+    def test_parse_function(self):
+        code = PythonParser().parse(branch.__code__)
+
+        self.assertIsInstance(code, Code)
+        self.assertEqual(branch.__code__.co_code, bytes(code.code))
+        self.assertEqual(list(branch.__code__.co_consts), list(code.consts))
+        self.assertEqual(['x'], list(code.varnames))
+        self.assertEqual(len(list(disassemble(branch.__code__))), len(code.instruction_offsets()))
+        function = code.to_function()
+        self.assertEqual(branch(0), function(0))
+        self.assertEqual(branch(1), function(1))
+
+    def test_convert_from_source(self):
+        code = PythonParser().convertFromSource(SOURCE)
+        namespace = {}
+        exec(code.to_code_type(), namespace)
+
+        self.assertEqual('<module>', code.name)
+        self.assertEqual(3, namespace['value'])
+
+    def test_parse_keeps_equal_constants_apart(self):
+        code = PythonParser().parse(compile('a = 0.0; b = -0.0', '<string>', 'exec'))
+        namespace = {}
+        exec(code.to_code_type(), namespace)
+
+        self.assertEqual('-0.0', repr(namespace['b']))
+
+
+@skipIf(sys.version_info < (3, 11), "co_exceptiontable is python 3.11")
+class ExceptionTableParseTest(TestCase):
+    def test_refused(self):
+        code_object = compile('try:\n    x\nexcept NameError:\n    pass', '<string>', 'exec')
+        self.assertRaisesRegex(AssemblerBytecodeException, 'exception table', PythonParser().parse, code_object)
@@ -0,0 +1,95 @@
+from unittest import TestCase
+from pyVoodoo.assembler import Code
+from pyVoodoo.assemblerExceptions import AssemblerBytecodeException
+from pyVoodoo.encoding import LegacyEncoder, WordcodeEncoder, encoder_for_version
+from test import supported_bytecode
+
+
+class EncoderSelectionTest(TestCase):
+    def test_encoder_for_version(self):
+        self.assertIsInstance(encoder_for_version((3, 5, 2)), LegacyEncoder)
+        self.assertIsInstance(encoder_for_version((3, 6, 0)), WordcodeEncoder)
+        self.assertIsInstance(encoder_for_version((3, 8, 18, 'final', 0)), WordcodeEncoder)
+        self.assertRaises(AssemblerBytecodeException, encoder_for_version, (3, 11, 7))
+
+
+class WordcodeEncoderTest(TestCase):
+    def setUp(self):
+        self.encoder = WordcodeEncoder()
+        self.buf = bytearray()
+
+    def test_extended_arg_chains(self):
+        self.encoder.emit(self.buf, 100, 0xFF)
+        self.encoder.emit(self.buf, 100, 0x1234)
+        self.encoder.emit(self.buf, 100, 0x123456)
+        self.encoder.emit(self.buf, 100, 0x12345678)
+
+        self.assertEqual([100, 0xFF,
+                          144, 0x12, 100, 0x34,
+                          144, 0x12, 144, 0x34, 100, 0x56,
+                          144, 0x12, 144, 0x34, 144, 0x56, 100, 0x78], list(self.buf))
+
+    def test_arg_out_of_range(self):
+        self.assertRaises(AssemblerBytecodeException, self.encoder.emit, self.buf, 100, 0x100000000)
+        self.assertRaises(AssemblerBytecodeException, self.encoder.emit, self.buf, 100, -1)
+
+    def test_offsets(self):
+        self.encoder.emit(self.buf, 100, 0x1234)
+        self.encoder.emit_op(self.buf, 83)
+
+        self.assertEqual([(0, 144), (2, 100), (4, 83)], list(self.encoder.iter_offsets(self.buf)))
+
+
+class LegacyEncoderTest(TestCase):
+    def setUp(self):
+        self.code = Code(encoder=LegacyEncoder())
+
+    def test_code_load_return(self):
+        self.code.LOAD_CONST(1)
+        self.code.STORE_FAST(0)
+        self.code.LOAD_FAST(0)
+        self.code.RETURN_VALUE()
+
+        self.assertEqual([100, 1, 0, 125, 0, 0, 124, 0, 0, 83], self.code._code_as_list())
+        self.assertEqual([0, 3, 6, 9], [offset for offset, _ in self.code.encoder.iter_offsets(self.code.code)])
+
+    def test_code_store_big_index(self):
+        for i in range(65539):
+            self.code.varnames.append(None)
+        self.code.LOAD_CONST(1)
+        self.code.LOAD_FAST(1)
+
+        self.assertEqual([100, 1, 0, 144, 1, 0, 125, 3, 0, 144, 1, 0, 124, 3, 0], self.code._code_as_list())
+        self.assertEqual([6], self.code.find_opcode_index(125))
+        self.assertEqual([3, 9], self.code.find_opcode_index(144))
+
+
+@supported_bytecode
+class DecoderTest(TestCase):
+    def test_wordcode_round_trip(self):
+        encoder = WordcodeEncoder()
+        buf = bytearray()
+        for arg in (0, 0xFF, 0x100, 0x12345, 0x12345678):
+            encoder.emit(buf, 100, arg)
+        encoder.emit_op(buf, 83)
+
+        self.assertEqual([(0, 100, 0, 2), (2, 100, 0xFF, 4), (4, 100, 0x100, 8), (8, 100, 0x12345, 14),
+                          (14, 100, 0x12345678, 22), (22, 83, 0, 24)], list(encoder.iter_instructions(buf)))
+
+    def test_legacy_round_trip(self):
+        encoder = LegacyEncoder()
+        buf = bytearray()
+        encoder.emit(buf, 100, 0x1234)
+        encoder.emit(buf, 100, 0x12345678)
+        encoder.emit_op(buf, 83)
+
+        self.assertEqual([(0, 100, 0x1234, 3), (3, 100, 0x12345678, 9), (9, 83, None, 10)],
+                         list(encoder.iter_instructions(buf)))
+
+    def test_jump_target_inverts_jump_arg(self):
+        import opcode
+        for encoder in (WordcodeEncoder(), WordcodeEncoder(jump_unit=2), LegacyEncoder()):
+            for name in ('JUMP_FORWARD', 'POP_JUMP_IF_FALSE'):
+                op = opcode.opmap[name]
+                arg = encoder.jump_arg(op, 10, 40)
+                self.assertEqual(40, encoder.jump_target(op, 10, arg))
@@ -0,0 +1,137 @@
+import sys
+from unittest import TestCase
+from pyVoodoo.assembler import Code, PythonParser
+from pyVoodoo.assemblerExceptions import CodeTypeException
+from pyVoodoo.flowgraph import stack_depths
+from test import supported_bytecode
+
+
+def loops(items):
+    total = 0
+    for item in items:
+        while item > total:
+            total += item
+        if item and total or not item:
+            continue
+    return total
+
+
+def handlers(path):
+    try:
+        with open(path) as f:
+            return [line.split() for line in f]
+    except (OSError, ValueError) as e:
+        return e
+    finally:
+        path = None
+
+
+def reraised(obj):
+    try:
+        obj.run
+    except AttributeError as err:
+        raise TypeError() from err
+    else:
+        return obj
+
+
+def nested(a, b):
+    return [(x, y) for x in a for y in b if x and y] or {k: v for k, v in zip(a, b)}
+
+
+@supported_bytecode
+class StackDepthsTest(TestCase):
+    def assertStackSize(self, function):
+        analysis = stack_depths(function.__code__.co_code)
+        if sys.version_info >= (3, 7):
+            self.assertEqual(function.__code__.co_stacksize, analysis.max_depth)
+        else:
+            # 3.6 sizes blocks for exception handlers more than they need
+            self.assertLessEqual(analysis.max_depth, function.__code__.co_stacksize)
+        self.assertEqual([], analysis.underflows)
+        self.assertEqual([], [merge for merge in analysis.merges if not merge.handler])
+
+    def test_loops(self):
+        self.assertStackSize(loops)
+
+    def test_handlers(self):
+        self.assertStackSize(handlers)
+
+    def test_reraised_in_handler(self):
+        self.assertStackSize(reraised)
+        code = PythonParser().parse(reraised.__code__)
+        code.compute_stack_size()
+        function = code.to_function(globals())
+        self.assertEqual(TestCase, function(TestCase))
+        self.assertRaises(TypeError, function, object())
+
+    def test_nested(self):
+        self.assertStackSize(nested)
+
+    def test_block_depths(self):
+        analysis = stack_depths(loops.__code__.co_code)
+        self.assertEqual(0, analysis.depths[0])
+        self.assertTrue(all(depth >= 0 for depth in analysis.depths.values()))
+
+
+@supported_bytecode
+class StaticStackTest(TestCase):
+    def setUp(self):
+        self.code = Code(static_stack=True)
+        self.code.argcount = 1
+        self.code.varnames.add('x')
+
+    def test_block_after_return(self):
+        code = self.code
+        start = code.JUMP_FORWARD()
+        helper = code.mark()
+        code.LOAD_CONST(2)
+        code.RETURN_VALUE()
+        code.mark(start)
+        code.LOAD_FAST('x')
+        code.POP_JUMP_IF_TRUE(helper)
+        code.LOAD_CONST(1)
+        code.RETURN_VALUE()
+        function = code.to_function()
+        self.assertEqual((2, 1), (function(True), function(False)))
+        self.assertEqual(1, code.stacksize)
+
+    def test_unknown_stack_still_raises_by_default(self):
+        code = Code()
+        code.LOAD_CONST(1)
+        code.RETURN_VALUE()
+        code.mark()
+        self.assertRaises(CodeTypeException, code.LOAD_CONST, 2)
+
+    def test_exact_stack_size(self):
+        code = self.code
+        code.set_stack_size(10)
+        code.set_stack_size(0)
+        code.LOAD_CONST(1)
+        code.RETURN_VALUE()
+        code.to_code_type()
+        self.assertEqual(1, code.stacksize)
+
+    def test_inconsistent_merge(self):
+        code = self.code
+        code.LOAD_CONST(1)
+        code.LOAD_FAST('x')
+        skip = code.POP_JUMP_IF_TRUE()
+        code.LOAD_CONST(2)
+        code.mark(skip)
+        code.RETURN_VALUE()
+        offset = skip.offset
+        with self.assertRaisesRegex(CodeTypeException, 'at {0}'.format(offset)):
+            code.to_code_type()
+        analysis = code.compute_stack_size(strict=False)
+        self.assertEqual([offset], [merge.offset for merge in analysis.merges])
+
+    def test_underflow(self):
+        code = self.code
+        start = code.JUMP_FORWARD()
+        helper = code.mark()
+        code.POP_TOP()
+        code.RETURN_VALUE()
+        code.mark(start)
+        code.JUMP_ABSOLUTE(helper)
+        self.assertRaisesRegex(CodeTypeException, 'underflow', code.to_code_type)
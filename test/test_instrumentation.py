@@ -0,0 +1,87 @@
+from unittest import TestCase
+from pyVoodoo.assembler import Code, PythonParser
+from pyVoodoo.assemblerExceptions import AssemblerBytecodeException
+from pyVoodoo.instrumentation import Counters, instrument, report, uninstrument
+from test import supported_bytecode
+
+
+def build(code):
+    code.LOAD_CONST(1)
+    code.LOAD_CONST(2)
+    code.LOAD_CONST(1)
+    code.BUILD_TUPLE(3)
+    code.RETURN_VALUE()
+    return code
+
+
+@supported_bytecode
+class InstrumentationTest(TestCase):
+    def setUp(self):
+        self.counters = Counters()
+
+    def test_counts_on_persist(self):
+        code = build(instrument(Code(), self.counters))
+        self.assertEqual({}, self.counters.emits)
+        self.assertEqual((1, 2, 1), code.to_function()())
+        self.assertEqual({'LOAD_CONST': 3, 'BUILD_TUPLE': 1, 'RETURN_VALUE': 1}, self.counters.emits)
+        self.assertEqual((1, 2), (self.counters.const_hits, self.counters.const_misses))
+        self.assertAlmostEqual(1 / 3, self.counters.const_hit_ratio)
+        self.assertEqual(3, self.counters.table_sizes['consts'])
+        self.assertEqual(3, self.counters.stack_high_water)
+        self.assertEqual({'assemble', 'persist'}, set(self.counters.timings))
+        self.assertEqual(1, self.counters.timings['persist'].calls)
+
+    def test_counts_emit_paths(self):
+        code = instrument(Code(), self.counters)
+        code.emit('LOAD_CONST', 1)
+        code.emit_many([('LOAD_CONST', 1), ('BUILD_TUPLE', 2), ('RETURN_VALUE', None)])
+        report(code)
+        self.assertEqual({'LOAD_CONST': 2, 'BUILD_TUPLE': 1, 'RETURN_VALUE': 1}, self.counters.emits)
+        self.assertEqual((1, 1), (self.counters.const_hits, self.counters.const_misses))
+
+    def test_reports_only_new_counts(self):
+        code = build(instrument(Code(), self.counters))
+        report(code)
+        report(code)
+        self.assertEqual(3, self.counters.emits['LOAD_CONST'])
+        self.assertEqual(1, self.counters.const_hits)
+
+    def test_optimize_timed(self):
+        code = instrument(Code(), self.counters)
+        code.LOAD_CONST(1)
+        code.UNARY_NOT()
+        code.RETURN_VALUE()
+        code.optimize()
+        self.assertEqual(1, self.counters.timings['optimize'].calls)
+        self.assertEqual(1, self.counters.emits['UNARY_NOT'])
+
+    def test_parser(self):
+        parser = instrument(PythonParser(), self.counters)
+        parser.parse(compile('x = 1', '<test>', 'exec'))
+        self.assertEqual(1, self.counters.timings['parse'].calls)
+
+    def test_custom_sink(self):
+        events = []
+        build(instrument(Code(), lambda *event: events.append(event))).to_code_type()
+        self.assertIn(('emit', 'BUILD_TUPLE', 1), events)
+        self.assertIn(('table_size', 'names', 0), events)
+
+    def test_uninstrument(self):
+        code = instrument(Code(), self.counters)
+        code.LOAD_CONST(1)
+        uninstrument(code)
+        self.assertEqual(1, self.counters.emits['LOAD_CONST'])
+        self.assertNotIn('add', vars(code.consts))
+        self.assertNotIn('_probe', vars(code))
+        code.LOAD_CONST(2)
+        code.RETURN_VALUE()
+        code.to_code_type()
+        self.assertEqual(1, self.counters.emits['LOAD_CONST'])
+
+    def test_sampling(self):
+        self.assertNotIn('_probe', vars(instrument(Code(), self.counters, rate=0)))
+        self.assertIn('_probe', vars(instrument(Code(), self.counters, rate=1)))
+
+    def test_invalid_target(self):
+        with self.assertRaises(AssemblerBytecodeException):
+            instrument(object(), self.counters)
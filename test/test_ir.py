@@ -0,0 +1,113 @@
+from unittest import TestCase
+from pyVoodoo.assembler import Code, opmap
+from pyVoodoo.assemblerExceptions import AssemblerBytecodeException
+from pyVoodoo.ir import Block, FlowGraph, Instr, Node
+from test import supported_bytecode
+
+
+def diamond():
+    code = Code()
+    code.argcount = 1
+    code.varnames.add('x')
+    code.LOAD_FAST('x')
+    other = code.POP_JUMP_IF_FALSE()
+    code.LOAD_CONST(1)
+    end = code.JUMP_FORWARD()
+    code.mark(other)
+    code.LOAD_CONST(2)
+    code.mark(end)
+    code.RETURN_VALUE()
+    return code
+
+
+def nested_loops(rows):
+    total = 0
+    for row in rows:
+        for cell in row:
+            total += cell
+    while total > 100:
+        total //= 2
+    return total
+
+
+@supported_bytecode
+class FlowGraphTest(TestCase):
+    def test_blocks_and_edges(self):
+        graph = FlowGraph(diamond())
+        self.assertEqual(4, len(graph))
+        self.assertEqual([[1, 2], [3], [3], []], [list(graph.successors(b)) for b in range(4)])
+        self.assertEqual([[], [0], [0], [1, 2]], [list(graph.predecessors(b)) for b in range(4)])
+        block = graph.block(1)
+        self.assertIsInstance(block, Block)
+        self.assertIsInstance(block, Node)
+        self.assertEqual(block, graph.blocks()[1])
+
+    def test_instructions(self):
+        graph = FlowGraph(diamond())
+        first = graph.instructions(0)
+        self.assertEqual(['LOAD_FAST', 'POP_JUMP_IF_FALSE'], [instr.name for instr in first])
+        self.assertIsInstance(first[1], Instr)
+        # jump arguments are target blocks
+        self.assertEqual(2, first[1].arg)
+        self.assertTrue(first[1].is_jump)
+
+    def test_dominators(self):
+        graph = FlowGraph(diamond())
+        self.assertEqual([0, 0, 0, 0], list(graph.dominators()))
+        self.assertTrue(graph.dominates(0, 3))
+        self.assertFalse(graph.dominates(1, 3))
+        self.assertTrue(graph.dominates(2, 2))
+
+    def test_unreachable(self):
+        code = Code()
+        code.LOAD_CONST(None)
+        code.RETURN_VALUE()
+        code.mark()
+        code.set_stack_size(0)
+        code.LOAD_CONST(1)
+        code.RETURN_VALUE()
+        graph = FlowGraph(code)
+        self.assertEqual(-1, graph.dominators()[1])
+        self.assertFalse(graph.dominates(0, 1))
+
+    def test_loops(self):
+        graph = FlowGraph(nested_loops.__code__)
+        self.assertEqual(3, len(graph.loop_headers()))
+        depths = [graph.loop_depth(block) for block in range(len(graph))]
+        self.assertEqual(2, max(depths))
+        self.assertEqual(0, depths[0])
+        for block in range(len(graph)):
+            header = graph.loop_header(block)
+            if header != -1:
+                self.assertTrue(graph.dominates(header, block))
+
+    def test_lowering(self):
+        graph = FlowGraph(nested_loops.__code__)
+        function = graph.to_code().to_function()
+        for rows in ([], [[1, 2], [3]], [[500], [20]]):
+            self.assertEqual(nested_loops(rows), function(rows))
+        lowered = FlowGraph(diamond()).to_code().to_function()
+        self.assertEqual((1, 2), (lowered(True), lowered(False)))
+
+    def test_lowering_extended_args(self):
+        code = Code()
+        code.argcount = 1
+        code.varnames.add('x')
+        code.LOAD_FAST('x')
+        skip = code.POP_JUMP_IF_TRUE()
+        for _ in range(300):
+            code.NOP()
+        code.mark(skip)
+        code.LOAD_FAST('x')
+        code.RETURN_VALUE()
+        graph = FlowGraph(code)
+        self.assertEqual(opmap['POP_JUMP_IF_TRUE'], graph.ops[1])
+        self.assertEqual(5, graph.to_code().to_function()(5))
+
+    def test_compact(self):
+        graph = FlowGraph(nested_loops.__code__)
+        self.assertLessEqual(graph.nbytes, 9 * len(graph.ops) + 32 * len(graph))
+        self.assertFalse(hasattr(graph, '__dict__'))
+
+    def test_invalid_source(self):
+        self.assertRaises(AssemblerBytecodeException, FlowGraph, b'\x00')
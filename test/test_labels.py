@@ -0,0 +1,100 @@
+from unittest import TestCase
+from pyVoodoo.assembler import Code, opmap
+from pyVoodoo.assemblerExceptions import AssemblerBytecodeException
+from test.fixture.code_test_fixture import branch
+from test import supported_bytecode
+
+POP_JUMP_IF_FALSE = opmap.get('POP_JUMP_IF_FALSE')
+BACKWARD_JUMP = 'JUMP_ABSOLUTE' if 'JUMP_ABSOLUTE' in opmap else 'JUMP_BACKWARD'
+
+
+@supported_bytecode
+class LabelTest(TestCase):
+    def setUp(self):
+        self.code = Code()
+
+    def build_branch(self):
+        self.code.argcount = 1
+        self.code.varnames.add('x')
+        self.code.LOAD_FAST('x')
+        else_ = self.code.POP_JUMP_IF_FALSE()
+        self.code.LOAD_CONST(1)
+        self.code.RETURN_VALUE()
+        self.code.mark(else_)
+        self.code.LOAD_CONST(2)
+        self.code.RETURN_VALUE()
+        return else_
+
+    def encoded_jump(self, after, target, op=POP_JUMP_IF_FALSE):
+        arg = self.code.encoder.jump_arg(op, after, target)
+        return [144, arg >> 8, op, arg & 255]
+
+    def test_semantic_equivalence_branch(self):
+        self.build_branch()
+
+        self.assertEqual(branch.__code__.co_code, self.code.to_bytecode_string())
+        self.assertEqual(branch.__code__.co_consts, self.code.consts.as_tuple())
+
+    def test_stack_size_taken_from_label(self):
+        else_ = self.build_branch()
+
+        self.assertEqual(0, else_.stack_size)
+        self.assertEqual(1, self.code.stacksize)
+        self.assertIsNone(self.code.stack_size)
+
+    def test_mark_twice(self):
+        label = self.code.mark()
+        self.assertRaises(AssemblerBytecodeException, self.code.mark, label)
+
+    def test_unbound_label(self):
+        self.code.JUMP_FORWARD()
+        self.assertRaises(AssemblerBytecodeException, self.code.resolve)
+
+    def test_forward_jump_relaxation(self):
+        self.code.LOAD_CONST(True)
+        end = self.code.POP_JUMP_IF_FALSE()
+        for i in range(300):
+            self.code.NOP()
+        self.code.mark(end)
+        self.code.resolve()
+
+        self.assertEqual(606, end.offset)
+        self.assertEqual(606, len(self.code.code))
+        self.assertEqual(self.encoded_jump(6, 606), list(self.code.code[2:6]))
+        self.assertEqual([(0, 0), (2, 1), (6, 0)], list(self.code.stack_history.items()))
+        self.assertEqual(1, self.code.stack_depth_at(4))
+        self.assertEqual(0, self.code.stack_depth_at(6))
+        self.assertEqual([2], self.code.find_opcode_index(144))
+        self.assertEqual([4], self.code.find_opcode_index(POP_JUMP_IF_FALSE))
+        self.assertEqual(303, len(self.code.instruction_offsets()))
+
+    def test_cascading_relaxation(self):
+        # far starts right past 0xFF, growing its jump pushes near past 0xFF as well
+        unit = self.code.encoder.jump_unit
+        self.code.LOAD_CONST(True)
+        self.code.DUP_TOP()
+        far = self.code.POP_JUMP_IF_FALSE()
+        self.code.DUP_TOP()
+        near = self.code.POP_JUMP_IF_FALSE()
+        for i in range(128 * unit - 6):
+            self.code.NOP()
+        self.code.mark(near)
+        self.code.NOP()
+        self.code.mark(far)
+        self.code.resolve()
+
+        self.assertEqual(256 * unit + 2, near.offset)
+        self.assertEqual(256 * unit + 4, far.offset)
+        self.assertEqual(self.encoded_jump(8, far.offset), list(self.code.code[4:8]))
+        self.assertEqual(self.encoded_jump(14, near.offset), list(self.code.code[10:14]))
+
+    def test_backward_jump_to_bound_label(self):
+        top = self.code.mark()
+        self.code.NOP()
+        self.assertIs(top, self.code.jump(BACKWARD_JUMP, top))
+        self.code.resolve()
+
+        self.assertEqual(0, top.offset)
+        self.assertEqual(4, len(self.code.code))
+        self.assertEqual([], self.code.fixups)
+        self.assertEqual([top], self.code.blocks)
@@ -0,0 +1,130 @@
+import dis
+import sys
+import traceback
+from array import array
+from unittest import TestCase, skipIf
+from pyVoodoo.assembler import Code, PythonParser
+from pyVoodoo.assemblerExceptions import CodeTypeException
+from pyVoodoo.linetable import LineTable, encode_lnotab, encode_linetable, encode_locations
+from test import supported_bytecode
+
+
+def divide(a, b):
+    total = 0
+    for i in range(b):
+        total += a
+    return a / b
+
+
+def line_starts(code_object):
+    return [(offset, line) for offset, line in dis.findlinestarts(code_object) if line is not None]
+
+
+class LineTableTest(TestCase):
+    def test_records_changes_only(self):
+        table = LineTable()
+        table.record(0, 1)
+        table.record(2, 1)
+        table.record(4, 2)
+        table.record(4, 3)
+        self.assertEqual([(0, 1), (4, 3)], list(table.items()))
+        self.assertEqual(1, table.line_at(2))
+        self.assertEqual(3, table.line_at(10))
+        self.assertRaises(CodeTypeException, table.record, 2, 5)
+
+    def test_lnotab(self):
+        offsets, lines = array('I', [0, 300, 302]), array('i', [1, 200, 2])
+        self.assertEqual(bytes((255, 0, 45, 127, 0, 72, 2, 0x80, 0, 0xBA)), encode_lnotab(offsets, lines, 304, 1))
+        self.assertRaises(CodeTypeException, encode_lnotab, offsets, lines, 304, 1, signed=False)
+
+    def test_linetable(self):
+        offsets, lines = array('I', [2, 300]), array('i', [5, -1])
+        self.assertEqual(bytes((2, 0x80, 254, 4, 44, 0, 4, 0x80)), encode_linetable(offsets, lines, 304, 1))
+
+    def test_locations(self):
+        offsets, lines = array('I', [0, 18]), array('i', [3, 2])
+        self.assertEqual(bytes((0xEF, 4, 0xE8, 0, 0xE8, 3)), encode_locations(offsets, lines, 20, 1))
+        self.assertEqual(b'', encode_locations(array('I'), array('i'), 20, 1))
+
+
+@supported_bytecode
+class CodeLinesTest(TestCase):
+    def setUp(self):
+        self.code = Code()
+        self.code.firstlineno = 10
+
+    def test_traceback_line(self):
+        code = self.code
+        code.set_lineno(10)
+        code.LOAD_CONST(1)
+        code.set_lineno(12)
+        code.LOAD_CONST(0)
+        code.BINARY_TRUE_DIVIDE()
+        code.RETURN_VALUE()
+        try:
+            code.to_function()()
+        except ZeroDivisionError:
+            self.assertEqual(12, traceback.extract_tb(sys.exc_info()[2])[-1].lineno)
+        else:
+            self.fail("no ZeroDivisionError")
+        self.assertEqual(12, code.lineno_at(len(code.code) - 1))
+
+    def test_jump_relaxation(self):
+        code = self.code
+        code.set_lineno(11)
+        code.LOAD_CONST(True)
+        skip = code.POP_JUMP_IF_TRUE()
+        code.set_lineno(12)
+        for _ in range(300):
+            code.NOP()
+        code.mark(skip)
+        code.set_lineno(2000)
+        code.LOAD_CONST(None)
+        code.RETURN_VALUE()
+        code_object = code.to_code_type()
+        starts = line_starts(code_object)
+        self.assertEqual([11, 12, 2000], [line for offset, line in starts])
+        self.assertEqual(code.find_opcode_index('LOAD_CONST')[-1], starts[-1][0])
+
+    def test_optimize(self):
+        code = self.code
+        code.set_lineno(11)
+        code.LOAD_CONST(2)
+        code.LOAD_CONST(3)
+        code.set_lineno(12)
+        code.BINARY_MULTIPLY()
+        code.set_lineno(13)
+        code.RETURN_VALUE()
+        code.optimize()
+        # the folded constant keeps the line of the first operand
+        self.assertEqual(11, code.lineno_at(0))
+        self.assertEqual(13, code.lineno_at(code.find_first_opcode_index('RETURN_VALUE')))
+        self.assertEqual(6, code.to_function()())
+
+    def test_cache_invalidated(self):
+        code = self.code
+        code.set_lineno(11)
+        code.LOAD_CONST(None)
+        code.RETURN_VALUE()
+        first = code.to_code_type()
+        code.set_lineno(14)
+        self.assertIsNot(first, code.to_code_type())
+
+    def test_no_lines(self):
+        code = self.code
+        code.LOAD_CONST(None)
+        code.RETURN_VALUE()
+        self.assertEqual(b'', code.to_code_type().co_lnotab)
+
+    def test_parse_round_trip(self):
+        code_object = PythonParser().parse(divide.__code__).to_code_type()
+        self.assertEqual(line_starts(divide.__code__), line_starts(code_object))
+
+    @skipIf(sys.version_info < (3, 10), "co_lines is python 3.10")
+    def test_without_line(self):
+        code = self.code
+        code.set_lineno(11)
+        code.LOAD_CONST(None)
+        code.set_lineno(None)
+        code.RETURN_VALUE()
+        self.assertEqual([11, None], [line for start, end, line in code.to_code_type().co_lines()])
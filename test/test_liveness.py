@@ -0,0 +1,125 @@
+from unittest import TestCase
+from pyVoodoo.assembler import Code
+from pyVoodoo.ir import FlowGraph
+from pyVoodoo.liveness import block_liveness, reuse_slots
+from test import supported_bytecode
+
+
+def chain(count):
+    """x -> ((x + 0) + 1) + ..., every step through its own temporary"""
+    code = Code()
+    code.argcount = 1
+    code.varnames.add('x')
+    code.LOAD_FAST('x')
+    for i in range(count):
+        code.LOAD_CONST(i)
+        code.BINARY_ADD()
+        temp = code.temporary()
+        code.STORE_FAST(temp)
+        code.LOAD_FAST(temp)
+    code.RETURN_VALUE()
+    return code
+
+
+@supported_bytecode
+class LivenessTest(TestCase):
+    def test_block_liveness(self):
+        code = Code()
+        code.argcount = 1
+        code.varnames.add('x')
+        code.LOAD_FAST('x')
+        other = code.POP_JUMP_IF_FALSE()
+        code.LOAD_CONST(1)
+        code.STORE_FAST('y')
+        code.mark(other)
+        code.LOAD_FAST('x')
+        code.RETURN_VALUE()
+        live_in, live_out = block_liveness(FlowGraph(code))
+        self.assertEqual([0b1, 0b1, 0b1], live_in)
+        self.assertEqual([0b1, 0b1, 0], live_out)
+
+
+@supported_bytecode
+class ReuseSlotsTest(TestCase):
+    def test_chain_shares_one_slot(self):
+        code = chain(50)
+        allocation = code.reuse_slots()
+        self.assertEqual((51, 2), allocation[:2])
+        self.assertEqual(2, code.to_code_type().co_nlocals)
+        self.assertEqual(sum(range(50)) + 3, code.to_function()(3))
+
+    def test_overlapping_temporaries_keep_slots(self):
+        code = Code()
+        first, second = code.temporary(), code.temporary()
+        code.LOAD_CONST(1)
+        code.STORE_FAST(first)
+        code.LOAD_CONST(2)
+        code.STORE_FAST(second)
+        code.LOAD_FAST(first)
+        code.LOAD_FAST(second)
+        code.BINARY_SUBTRACT()
+        code.RETURN_VALUE()
+        self.assertEqual({}, code.reuse_slots().shared)
+        self.assertEqual(-1, code.to_function()())
+
+    def test_named_locals_untouched(self):
+        code = chain(3)
+        code.temporaries.clear()
+        self.assertEqual((4, 4, {}), code.reuse_slots())
+        explicit = chain(3)
+        names = explicit.varnames.as_tuple()
+        allocation = explicit.reuse_slots(temporaries=names[1:])
+        self.assertEqual(names[:2], explicit.varnames.as_tuple())
+        self.assertEqual({names[2]: names[1], names[3]: names[1]}, allocation.shared)
+
+    def test_arguments_never_shared(self):
+        code = chain(3)
+        self.assertNotIn('x', code.reuse_slots(temporaries=['x'] + list(code.temporaries)).shared)
+        self.assertEqual('x', code.varnames[0])
+
+    def test_read_before_write_not_shared(self):
+        code = Code()
+        first, second = code.temporary(), code.temporary()
+        code.LOAD_CONST(1)
+        code.STORE_FAST(first)
+        code.LOAD_FAST(second)
+        code.RETURN_VALUE()
+        self.assertEqual({}, code.reuse_slots().shared)
+
+    def test_loop(self):
+        # the counter is live around the loop but dead while the step is, so they share
+        code = Code()
+        code.argcount = 1
+        code.varnames.add('n')
+        counter, step = code.temporary(), code.temporary()
+        code.LOAD_CONST(0)
+        code.STORE_FAST(counter)
+        top = code.mark()
+        code.LOAD_FAST(counter)
+        code.LOAD_FAST('n')
+        code.COMPARE_OP(0)
+        done = code.POP_JUMP_IF_FALSE()
+        code.LOAD_FAST(counter)
+        code.LOAD_CONST(1)
+        code.BINARY_ADD()
+        code.STORE_FAST(step)
+        code.LOAD_FAST(step)
+        code.STORE_FAST(counter)
+        code.JUMP_ABSOLUTE(top)
+        code.mark(done)
+        code.LOAD_FAST(counter)
+        code.RETURN_VALUE()
+        self.assertEqual({step: counter}, code.reuse_slots().shared)
+        self.assertEqual(7, code.to_function()(7))
+
+    def test_wide_slots(self):
+        code = chain(300)
+        code.reuse_slots()
+        self.assertEqual(sum(range(300)), code.to_function()(0))
+        self.assertEqual(len(code.code), len(chain(300).code))
+
+    def test_no_temporaries(self):
+        code = Code()
+        code.LOAD_CONST(None)
+        code.RETURN_VALUE()
+        self.assertEqual((0, 0, {}), reuse_slots(code))
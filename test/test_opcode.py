@@ -1,4 +1,7 @@
+import subprocess
+import sys
 import unittest
+import pyVoodoo
 from pyVoodoo import assembler
 import opcode as op
 
@@ -16,6 +19,31 @@ class TestOpcodes(unittest.TestCase):
         for code, name in assembler.opname.items():
             self.assertEqual(name, op.opname[code])
 
+    @unittest.skipIf(sys.version_info < (3, 7), "no module __getattr__ before python 3.7")
+    def test_import_is_lazy(self):
+        script = "import pyVoodoo; print('hasflow' in vars(pyVoodoo.assembler), 'LOAD_CONST' in vars(pyVoodoo.assembler))"
+        self.assertEqual('False False', subprocess.check_output([sys.executable, '-c', script],
+                                                                universal_newlines=True).strip())
+        self.assertIs(assembler.hasflow, pyVoodoo.hasflow)
+        self.assertEqual(op.opmap['LOAD_CONST'], pyVoodoo.LOAD_CONST)
+        self.assertRaises(AttributeError, getattr, pyVoodoo, 'NOT_AN_OPCODE')
+
+    @unittest.skipIf(sys.version_info < (3, 7), "no module __getattr__ before python 3.7")
+    def test_submodules_are_lazy(self):
+        script = "import sys, pyVoodoo; print([name for name in ('hashlib', 'mmap', 'concurrent.futures', " \
+                 "'pyVoodoo.codecache', 'pyVoodoo.pyc') if name in sys.modules])"
+        self.assertEqual('[]', subprocess.check_output([sys.executable, '-c', script],
+                                                       universal_newlines=True).strip())
+        from pyVoodoo import pyc
+        self.assertIs(pyc.load_pyc, pyVoodoo.load_pyc)
+        self.assertIs(pyc, pyVoodoo.pyc)
+
+    def test_lazy_names(self):
+        for name, names in pyVoodoo._lazy_modules.items():
+            self.assertEqual(set(getattr(pyVoodoo, name).__all__), set(names))
+            for attribute in names:
+                self.assertTrue(hasattr(pyVoodoo, attribute))
+
     def test_hasopcode(self):
         for opcode in assembler.hasarg:
             self.assertGreaterEqual(opcode.code(), op.HAVE_ARGUMENT)
@@ -0,0 +1,196 @@
+from unittest import TestCase
+from pyVoodoo.assembler import Code, opmap
+from test import supported_bytecode
+
+LOAD_CONST = opmap['LOAD_CONST']
+LOAD_FAST = opmap['LOAD_FAST']
+RETURN_VALUE = opmap['RETURN_VALUE']
+JUMP_FORWARD = opmap['JUMP_FORWARD']
+POP_JUMP_IF_FALSE = opmap.get('POP_JUMP_IF_FALSE')
+POP_JUMP_IF_TRUE = opmap.get('POP_JUMP_IF_TRUE')
+
+
+def run(code, *args):
+    return code.to_function()(*args)
+
+
+@supported_bytecode
+class PeepholeTest(TestCase):
+    def setUp(self):
+        self.code = Code()
+
+    def ops(self):
+        return [op for offset, op, arg, after in self.code.encoder.iter_instructions(self.code.code)]
+
+    def test_constant_folding_chain(self):
+        self.code.LOAD_CONST(2)
+        self.code.LOAD_CONST(3)
+        self.code.BINARY_ADD()
+        self.code.LOAD_CONST(4)
+        self.code.BINARY_MULTIPLY()
+        self.code.RETURN_VALUE()
+        optimizer = self.code.optimize()
+
+        self.assertEqual([LOAD_CONST, self.code.consts.index(20), RETURN_VALUE, 0], list(self.code.code))
+        self.assertEqual((6, 2), (optimizer.before, optimizer.after))
+        self.assertEqual(1, self.code.stacksize)
+
+    def test_no_folding_of_large_or_mutable_results(self):
+        self.code.LOAD_CONST('a')
+        self.code.LOAD_CONST(10000)
+        self.code.BINARY_MULTIPLY()
+        self.code.LOAD_CONST([1])
+        self.code.LOAD_CONST([2])
+        self.code.BINARY_ADD()
+        self.code.optimize()
+
+        self.assertEqual(6, len(self.code.instruction_offsets()))
+        self.assertEqual(3, self.code.stacksize)
+
+    def test_folding_keeps_signed_zeros(self):
+        self.code.LOAD_CONST(0.0)
+        self.code.LOAD_CONST(-1)
+        self.code.BINARY_MULTIPLY()
+        self.code.LOAD_CONST(0.0)
+        self.code.BUILD_TUPLE(2)
+        self.code.RETURN_VALUE()
+        self.code.optimize()
+
+        self.assertEqual('(-0.0, 0.0)', repr(run(self.code)))
+
+    def test_no_folding_of_large_results_from_bools(self):
+        self.code.LOAD_CONST(True)
+        self.code.LOAD_CONST(10 ** 7)
+        self.code.BINARY_LSHIFT()
+        self.code.LOAD_CONST(True)
+        self.code.LOAD_CONST(3)
+        self.code.BINARY_LSHIFT()
+        self.code.BUILD_TUPLE(2)
+        self.code.RETURN_VALUE()
+        self.code.optimize()
+
+        self.assertEqual(6, len(self.code.instruction_offsets()))
+        self.assertIn(8, self.code.consts)
+
+    def test_no_folding_of_formatting(self):
+        self.code.LOAD_CONST('%05d')
+        self.code.LOAD_CONST(1)
+        self.code.BINARY_MODULO()
+        self.code.LOAD_CONST(7)
+        self.code.LOAD_CONST(3)
+        self.code.BINARY_MODULO()
+        self.code.BUILD_TUPLE(2)
+        self.code.RETURN_VALUE()
+        self.code.optimize()
+
+        self.assertEqual(6, len(self.code.instruction_offsets()))
+        self.assertIn(1, self.code.consts)
+
+    def test_load_const_pop_top_removed(self):
+        self.code.LOAD_CONST('docstring')
+        self.code.POP_TOP()
+        self.code.LOAD_CONST(None)
+        self.code.RETURN_VALUE()
+        self.code.optimize()
+
+        self.assertEqual([LOAD_CONST, 0, RETURN_VALUE, 0], list(self.code.code))
+
+    def test_not_jump_is_negated(self):
+        self.code.argcount = 1
+        self.code.varnames.add('x')
+        self.code.LOAD_FAST('x')
+        self.code.UNARY_NOT()
+        else_ = self.code.POP_JUMP_IF_FALSE()
+        self.code.LOAD_CONST(1)
+        self.code.RETURN_VALUE()
+        self.code.mark(else_)
+        self.code.LOAD_CONST(2)
+        self.code.RETURN_VALUE()
+        self.code.optimize()
+
+        self.assertEqual([LOAD_FAST, POP_JUMP_IF_TRUE, LOAD_CONST, RETURN_VALUE, LOAD_CONST, RETURN_VALUE], self.ops())
+        self.assertEqual(8, else_.offset)
+        self.assertEqual(1, run(self.code, 0))
+        self.assertEqual(2, run(self.code, 1))
+
+    def test_constant_branch_and_dead_code(self):
+        self.code.LOAD_CONST(True)
+        else_ = self.code.POP_JUMP_IF_FALSE()
+        self.code.LOAD_CONST(1)
+        self.code.RETURN_VALUE()
+        self.code.mark(else_)
+        self.code.LOAD_CONST(2)
+        self.code.RETURN_VALUE()
+        self.code.optimize()
+
+        self.assertEqual([LOAD_CONST, RETURN_VALUE], self.ops())
+        self.assertEqual(1, run(self.code))
+
+    def test_jump_threading(self):
+        self.code.argcount = 1
+        self.code.varnames.add('x')
+        self.code.LOAD_FAST('x')
+        first = self.code.POP_JUMP_IF_FALSE()
+        self.code.LOAD_CONST(1)
+        self.code.RETURN_VALUE()
+        self.code.mark(first)
+        second = self.code.JUMP_FORWARD()
+        self.code.mark(second)
+        third = self.code.JUMP_FORWARD()
+        self.code.mark(third)
+        self.code.LOAD_CONST(2)
+        self.code.RETURN_VALUE()
+        optimizer = self.code.optimize()
+
+        self.assertEqual([LOAD_FAST, POP_JUMP_IF_FALSE, LOAD_CONST, RETURN_VALUE, LOAD_CONST, RETURN_VALUE], self.ops())
+        self.assertEqual((8, 6), (optimizer.before, optimizer.after))
+        self.assertEqual(third.offset, first.offset)
+        self.assertEqual(2, run(self.code, 0))
+        self.assertEqual(1, run(self.code, 1))
+
+    def test_loop_survives(self):
+        self.code.argcount = 1
+        self.code.varnames.add('n')
+        self.code.LOAD_CONST(0)
+        self.code.STORE_FAST('total')
+        top = self.code.mark()
+        self.code.LOAD_FAST('n')
+        end = self.code.POP_JUMP_IF_FALSE()
+        self.code.LOAD_FAST('total')
+        self.code.LOAD_FAST('n')
+        self.code.BINARY_ADD()
+        self.code.STORE_FAST('total')
+        self.code.LOAD_FAST('n')
+        self.code.LOAD_CONST(1)
+        self.code.BINARY_SUBTRACT()
+        self.code.STORE_FAST('n')
+        self.code.jump('JUMP_ABSOLUTE' if 'JUMP_ABSOLUTE' in opmap else 'JUMP_BACKWARD', top)
+        self.code.mark(end)
+        self.code.LOAD_FAST('total')
+        self.code.RETURN_VALUE()
+        optimizer = self.code.optimize()
+
+        self.assertEqual(optimizer.before, optimizer.after)
+        self.assertEqual(55, run(self.code, 10))
+
+    def test_comparison_and_unary_folding(self):
+        self.code.LOAD_CONST('fast')
+        self.code.LOAD_CONST('fast')
+        self.code.COMPARE_OP(2)
+        self.code.UNARY_NOT()
+        self.code.RETURN_VALUE()
+        self.code.optimize()
+
+        self.assertEqual([LOAD_CONST, self.code.consts.index(False), RETURN_VALUE, 0], list(self.code.code))
+
+    def test_constant_or_pop(self):
+        # x = 0 or 5
+        self.code.LOAD_CONST(0)
+        end = self.code.JUMP_IF_TRUE_OR_POP()
+        self.code.LOAD_CONST(5)
+        self.code.mark(end)
+        self.code.RETURN_VALUE()
+        self.code.optimize()
+
+        self.assertEqual([LOAD_CONST, RETURN_VALUE], self.ops())
+        self.assertEqual(5, run(self.code))
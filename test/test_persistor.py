@@ -0,0 +1,110 @@
+import sys
+from unittest import TestCase, skipIf
+from pyVoodoo.assembler import Code, Persistor
+from pyVoodoo.assemblerExceptions import PersistorException
+from pyVoodoo.encoding import WordcodeEncoder
+from pyVoodoo.flags import CO_GENERATOR
+from test import supported_bytecode
+
+
+@supported_bytecode
+class PersistorTest(TestCase):
+    def setUp(self):
+        self.code = Code()
+        self.persistor = Persistor()
+
+    def add(self):
+        self.code.argcount = 2
+        self.code.name = 'add'
+        self.code.varnames.add('a')
+        self.code.varnames.add('b')
+        self.code.LOAD_FAST('a')
+        self.code.LOAD_FAST('b')
+        self.code.BINARY_ADD()
+        self.code.RETURN_VALUE()
+
+    def test_to_code_type(self):
+        self.add()
+        code_object = self.persistor.to_code_type(self.code)
+
+        self.assertEqual(bytes(self.code.code), code_object.co_code)
+        self.assertEqual(('a', 'b'), code_object.co_varnames)
+        self.assertEqual(2, code_object.co_argcount)
+        self.assertEqual(2, code_object.co_nlocals)
+        self.assertEqual(2, code_object.co_stacksize)
+        self.assertEqual('add', code_object.co_name)
+        self.assertEqual(5, self.code.to_function()(2, 3))
+
+    def test_invalid_instance(self):
+        self.assertRaises(PersistorException, self.persistor.to_code_type, object())
+
+    def test_names_must_be_strings(self):
+        self.code.LOAD_GLOBAL(1)
+        self.code.RETURN_VALUE()
+        self.assertRaises(PersistorException, self.code.to_code_type)
+        code = Code()
+        code.varnames.add(('a',))
+        code.LOAD_CONST(None)
+        code.RETURN_VALUE()
+        self.assertRaises(PersistorException, code.to_code_type)
+
+    def test_code_object_is_cached(self):
+        self.add()
+        code_object = self.code.to_code_type()
+
+        self.assertIs(code_object, self.code.to_code_type())
+        self.assertIs(code_object, self.persistor.to_code_type(self.code))
+
+    def test_cache_invalidated_on_emit(self):
+        self.code.LOAD_CONST(1)
+        self.code.POP_TOP()
+        first = self.code.to_code_type()
+        self.code.LOAD_CONST(2)
+        self.code.RETURN_VALUE()
+        second = self.code.to_code_type()
+
+        self.assertIsNot(first, second)
+        self.assertEqual(bytes(self.code.code), second.co_code)
+        self.assertEqual((None, 1, 2), second.co_consts)
+
+    def test_cache_invalidated_on_attribute_change(self):
+        self.add()
+        first = self.code.to_code_type()
+        self.code.name = 'plus'
+
+        self.assertEqual('plus', self.code.to_code_type().co_name)
+        self.assertIsNot(first, self.code.to_code_type())
+
+    def test_pending_jumps_resolved(self):
+        self.code.argcount = 1
+        self.code.varnames.add('x')
+        self.code.LOAD_FAST('x')
+        other = self.code.POP_JUMP_IF_FALSE()
+        self.code.LOAD_CONST('yes')
+        self.code.RETURN_VALUE()
+        self.code.mark(other)
+        self.code.LOAD_CONST('no')
+        self.code.RETURN_VALUE()
+        function = self.code.to_function()
+
+        self.assertEqual('yes', function(True))
+        self.assertEqual('no', function(False))
+
+    def test_generator(self):
+        self.code.LOAD_CONST(1)
+        self.code.YIELD_VALUE()
+        self.code.POP_TOP()
+        self.code.LOAD_CONST(None)
+        self.code.RETURN_VALUE()
+
+        self.assertTrue(self.code.to_code_type().co_flags & CO_GENERATOR)
+        self.assertEqual([1], list(self.code.to_function()()))
+
+
+@skipIf(sys.version_info < (3, 11), "python 3.11 code objects need an exception table")
+class ExceptionTablePersistorTest(TestCase):
+    def test_refused(self):
+        code = Code(WordcodeEncoder())
+        code.LOAD_CONST(None)
+        code.RETURN_VALUE()
+        self.assertRaises(PersistorException, code.to_code_type)
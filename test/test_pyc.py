@@ -0,0 +1,179 @@
+import marshal
+import os
+import shutil
+import struct
+import sys
+import tempfile
+from importlib.machinery import SourcelessFileLoader
+from unittest import TestCase, skipIf
+from pyVoodoo.assembler import Code
+from pyVoodoo.assemblerExceptions import PersistorException
+from pyVoodoo.pyc import MAGIC_NUMBER, HEADER_SIZE, pyc_header, dumps_pyc, write_pyc, PycCache, \
+    read_pyc_header, loads_pyc, load_pyc, load_pycs
+from test import supported_bytecode
+
+
+def module_code(value):
+    code = Code()
+    code.flags = 0
+    code.name = '<module>'
+    code.LOAD_CONST(value)
+    code.STORE_NAME('value')
+    code.LOAD_CONST(None)
+    code.RETURN_VALUE()
+    return code
+
+
+@supported_bytecode
+class PycWriterTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def load(self, path):
+        return SourcelessFileLoader('generated', path).load_module('generated')
+
+    def test_timestamp_header(self):
+        header = pyc_header(b'source', mtime=1234)
+
+        self.assertEqual(HEADER_SIZE, len(header))
+        self.assertEqual(MAGIC_NUMBER, header[:4])
+        self.assertEqual((1234, 6), struct.unpack('<II', header[-8:]))
+
+    @skipIf(sys.version_info < (3, 7), 'PEP 552 headers')
+    def test_hash_header(self):
+        from importlib.util import source_hash
+        header = pyc_header(b'source', hash_based=True, check_source=False)
+
+        self.assertEqual((1,), struct.unpack('<I', header[4:8]))
+        self.assertEqual(source_hash(b'source'), header[8:])
+        self.assertRaises(PersistorException, pyc_header, None, hash_based=True)
+
+    def test_write_and_import(self):
+        path = os.path.join(self.directory, 'generated.pyc')
+        write_pyc(module_code(42), path, mtime=0)
+
+        self.assertEqual(42, self.load(path).value)
+        self.assertEqual(['generated.pyc'], os.listdir(self.directory))
+
+    def test_dumps_code_object(self):
+        code_object = compile('value = 1', '<string>', 'exec')
+        data = dumps_pyc(code_object, mtime=0)
+
+        self.assertEqual(code_object, marshal.loads(data[HEADER_SIZE:]))
+        self.assertRaises(PersistorException, dumps_pyc, object())
+
+
+@supported_bytecode
+class PycCacheTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = PycCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_missing(self):
+        self.assertIsNone(self.cache.get('answer'))
+
+    def test_put_get(self):
+        stored = self.cache.put('answer', module_code(42))
+        loaded = PycCache(self.directory).get('answer')
+
+        self.assertEqual(stored, loaded)
+        namespace = {}
+        exec(loaded, namespace)
+        self.assertEqual(42, namespace['value'])
+        self.assertEqual([MAGIC_NUMBER.hex()], os.listdir(self.directory))
+
+    def test_get_or_build(self):
+        built = []
+
+        def build():
+            built.append(1)
+            return module_code(1)
+
+        first = self.cache.get_or_build('one', build)
+        second = self.cache.get_or_build('one', build)
+
+        self.assertEqual([1], built)
+        self.assertEqual(first, second)
+
+    def test_corrupted_entry_is_missing(self):
+        self.cache.put('answer', module_code(42))
+        path = self.cache.path('answer')
+        with open(path, 'rb') as f:
+            data = f.read()
+        with open(path, 'wb') as f:
+            f.write(data[:-3])
+
+        self.assertIsNone(self.cache.get('answer'))
+
+    def test_other_magic_is_missing(self):
+        self.cache.put('answer', module_code(42))
+        path = self.cache.path('answer')
+        with open(path, 'rb') as f:
+            data = f.read()
+        with open(path, 'wb') as f:
+            f.write(b'\0\0\r\n' + data[4:])
+
+        self.assertIsNone(self.cache.get('answer'))
+
+
+@supported_bytecode
+class PycLoaderTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_python2_header(self):
+        header = read_pyc_header(struct.pack('<H', 62211) + b'\r\n' + struct.pack('<I', 7) + b'c')
+        self.assertEqual((None, 7, None, None, 8), header[1:])
+
+    def test_python32_header(self):
+        header = read_pyc_header(struct.pack('<H', 3180) + b'\r\n' + struct.pack('<I', 7))
+        self.assertEqual((None, 7, None, None, 8), header[1:])
+        # the 3.3 alphas before 3210 have no source size either
+        header = read_pyc_header(struct.pack('<H', 3200) + b'\r\n' + struct.pack('<I', 7))
+        self.assertEqual((None, 7, None, None, 8), header[1:])
+
+    def test_python33_header(self):
+        header = read_pyc_header(struct.pack('<H', 3210) + b'\r\n' + struct.pack('<II', 7, 100))
+        self.assertEqual((None, 7, 100, None, 12), header[1:])
+
+    def test_pep552_headers(self):
+        magic = struct.pack('<H', 3413) + b'\r\n'
+        timestamp = read_pyc_header(magic + struct.pack('<III', 0, 7, 100))
+        hashed = read_pyc_header(magic + struct.pack('<I', 3) + b'12345678')
+
+        self.assertEqual((0, 7, 100, None, 16), timestamp[1:])
+        self.assertEqual((3, None, None, b'12345678', 16), hashed[1:])
+
+    def test_invalid_headers(self):
+        self.assertRaises(PersistorException, read_pyc_header, b'not a pyc')
+        self.assertRaises(PersistorException, read_pyc_header, struct.pack('<H', 3413) + b'\r\n\0\0\0\0')
+
+    def test_loads_written_pyc(self):
+        code_object = compile('value = 1', '<string>', 'exec')
+        header, loaded = loads_pyc(dumps_pyc(code_object, b'value = 1', mtime=5))
+
+        self.assertEqual(code_object, loaded)
+        self.assertEqual(MAGIC_NUMBER, header.magic)
+        self.assertEqual((5, 9, HEADER_SIZE), (header.mtime, header.size, header.header_size))
+
+    def test_load_pycs(self):
+        good = os.path.join(self.directory, 'good.pyc')
+        empty = os.path.join(self.directory, 'empty.pyc')
+        write_pyc(module_code(1), good, mtime=0)
+        open(empty, 'wb').close()
+        records = list(load_pycs([good, empty, os.path.join(self.directory, 'missing.pyc')]))
+
+        self.assertEqual(good, records[0].path)
+        self.assertEqual(load_pyc(good)[1], records[0].code)
+        self.assertIsNone(records[0].error)
+        self.assertIsInstance(records[1].error, PersistorException)
+        self.assertIsInstance(records[2].error, OSError)
@@ -1,15 +1,21 @@
 from pyVoodoo.assembler import *
+import sys
 import unittest
+from test import supported_bytecode
 
 
+@supported_bytecode
 class TestDissasemble(unittest.TestCase):
     def test_compile_simple_pyfile(self):
-        raw_code = b'd\x00\x00d\x01\x00l\x00\x00Z\x00\x00Gd\x02\x00d\x03\x00\x84\x00\x00d\x03\x00e\x01\x00\x83\x03\x00Z\x02\x00e\x02\x00\x83\x00\x00Z\x03\x00e\x03\x00j\x04\x00\x83\x00\x00\x01e\x05\x00e\x03\x00j\x03\x00\x83\x01\x00\x01d\x01\x00S'
+        # 2 byte wordcode, a.computar() is a LOAD_METHOD/CALL_METHOD pair from python 3.7 on
+        call = b'j\x04\x83\x00' if sys.version_info < (3, 7) else b'\xa0\x04\xa1\x00'
+        raw_code = (b'd\x00d\x01l\x00Z\x00G\x00d\x02d\x03\x84\x00d\x03e\x01\x83\x03Z\x02e\x02\x83\x00Z\x03e\x03' +
+                    call + b'\x01\x00e\x05e\x03j\x03\x83\x01\x01\x00d\x01S\x00')
         code = PythonParser()._parse_from_py('test/fixture/a.py', False)
         self.assertEqual(raw_code, code.co_code)
         self.assertEqual(1, code.co_firstlineno)
         self.assertEqual(64, code.co_flags)
-        self.assertEqual(b'\x0c\x03\x16\x07\t\x01\n\x01', code.co_lnotab)
+        self.assertEqual(b'\x08\x03\x10\x07\x06\x01\x08\x01', code.co_lnotab)
         self.assertEqual(4, code.co_stacksize)
         self.assertEqual(tuple(), code.co_varnames)
 
@@ -19,12 +25,12 @@ y=2
 print(x+y)"""
         code = PythonParser().convertFromSource(source, False)
         self.assertEqual(
-            b'd\x00\x00Z\x00\x00d\x01\x00Z\x01\x00e\x02\x00e\x00\x00e\x01\x00\x17\x83\x01\x00\x01d\x02\x00S',
+            b'd\x00Z\x00d\x01Z\x01e\x02e\x00e\x01\x17\x00\x83\x01\x01\x00d\x02S\x00',
             code.co_code)
         self.assertEqual((1, 2, None), code.co_consts)
         self.assertEqual(1, code.co_firstlineno)
         self.assertEqual(64, code.co_flags)
-        self.assertEqual(b'\x06\x01\x06\x01', code.co_lnotab)
+        self.assertEqual(b'\x04\x01\x04\x01', code.co_lnotab)
         self.assertEqual(3, code.co_stacksize)
         self.assertEqual(('x', 'y', 'print'), code.co_names)
         self.assertEqual(tuple(), code.co_varnames)
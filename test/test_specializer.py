@@ -0,0 +1,114 @@
+import dis
+import inspect
+from unittest import TestCase
+from pyVoodoo.assembler import Code, opmap
+from pyVoodoo.assemblerExceptions import PersistorException
+from pyVoodoo.specializer import specialize, specialize_function
+from test import supported_bytecode
+
+
+def render(value, mode, scale, strict=False):
+    if mode == 'upper':
+        value = value.upper()
+    elif mode == 'lower':
+        value = value.lower()
+    if strict and not value:
+        raise ValueError(value)
+    return value * scale
+
+
+def bump(a, n):
+    n = n + 1
+    return a * n
+
+
+def adder(a, b):
+    return lambda: a + b
+
+
+def signed(a, *, negate):
+    return -a if negate else a
+
+
+def pack(a, *rest, **options):
+    return (a,) + rest, options
+
+
+def flagged(value, options):
+    upper = 'upper' in options
+    if upper:
+        return value.upper()
+    return value
+
+
+def zeros(sign, x):
+    return (0.0, sign * 0.0, x)
+
+
+def ops(code_object):
+    return [instruction.opname for instruction in dis.get_instructions(code_object)]
+
+
+@supported_bytecode
+class SpecializerTest(TestCase):
+    def test_function(self):
+        upper = specialize_function(render, {'mode': 'upper', 'scale': 2})
+        self.assertEqual(['value', 'strict'], list(inspect.signature(upper).parameters))
+        self.assertEqual('ABAB', upper('ab'))
+        self.assertRaises(ValueError, upper, '', strict=True)
+        instructions = ops(upper.__code__)
+        self.assertNotIn('COMPARE_OP', instructions)
+        # the lower() branch is gone
+        self.assertEqual(1, instructions.count('LOAD_METHOD') or instructions.count('LOAD_ATTR'))
+        self.assertLess(len(upper.__code__.co_code), len(render.__code__.co_code))
+        self.assertEqual(('value', 'strict'), upper.__code__.co_varnames)
+
+    def test_constant_locals(self):
+        upper = specialize_function(flagged, {'options': ('upper',)})
+        self.assertEqual('AB', upper('ab'))
+        self.assertFalse([op for op in ops(upper.__code__) if 'JUMP' in op or op == 'STORE_FAST'])
+
+    def test_signed_zeros(self):
+        negative = specialize_function(zeros, {'sign': -1})
+        self.assertEqual(repr(zeros(-1, 1)), repr(negative(1)))
+
+    def test_assigned_argument(self):
+        bumped = specialize_function(bump, {'n': 2})
+        self.assertEqual(9, bumped(3))
+        self.assertEqual(1, bumped.__code__.co_argcount)
+        self.assertEqual(('a', 'n'), bumped.__code__.co_varnames)
+
+    def test_closure_argument(self):
+        self.assertEqual(3, specialize_function(adder, {'a': 1})(2)())
+
+    def test_keyword_only(self):
+        negated = specialize_function(signed, {'negate': True})
+        self.assertEqual(-3, negated(3))
+        self.assertEqual(0, negated.__code__.co_kwonlyargcount)
+        self.assertEqual(['LOAD_FAST', 'UNARY_NEGATIVE', 'RETURN_VALUE'], ops(negated.__code__))
+
+    def test_varargs(self):
+        packed = specialize_function(pack, {'a': 1})
+        self.assertEqual(((1, 2, 3), {'x': 4}), packed(2, 3, x=4))
+        self.assertEqual(('rest', 'options'), packed.__code__.co_varnames)
+
+    def test_code(self):
+        code = Code()
+        code.argcount = 1
+        code.varnames.add('x')
+        code.LOAD_FAST('x')
+        code.LOAD_CONST(1)
+        code.BINARY_ADD()
+        code.RETURN_VALUE()
+        specialized = code.specialize({'x': 2})
+        self.assertEqual([opmap['LOAD_CONST'], opmap['RETURN_VALUE']],
+                         [op for offset, op, arg, end in specialized.encoder.iter_instructions(specialized.code)])
+        self.assertEqual(3, specialized.to_function()())
+        self.assertEqual(1, code.argcount)
+        self.assertEqual(3, code.to_function()(2))
+
+    def test_unknown_argument(self):
+        self.assertRaises(PersistorException, specialize, render, {'missing': 1})
+        self.assertRaises(PersistorException, specialize, bump.__code__, {'rest': 1})
+        self.assertRaises(PersistorException, specialize, pack, {'rest': ()})
+        self.assertRaises(PersistorException, specialize, 'render', {})
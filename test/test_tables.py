@@ -0,0 +1,75 @@
+from unittest import TestCase
+from pyVoodoo.tables import ConstantPool, SymbolTable
+
+
+class ConstantPoolTest(TestCase):
+    def setUp(self):
+        self.pool = ConstantPool([None])
+
+    def test_add_returns_existing_slot(self):
+        self.assertEqual(1, self.pool.add('a'))
+        self.assertEqual(2, self.pool.add('b'))
+        self.assertEqual(1, self.pool.add('a'))
+        self.assertEqual([None, 'a', 'b'], self.pool)
+
+    def test_equal_values_of_different_type_are_kept_apart(self):
+        self.assertEqual(1, self.pool.add(1))
+        self.assertEqual(2, self.pool.add(1.0))
+        self.assertEqual(3, self.pool.add(True))
+        self.assertEqual(1, self.pool.add(1))
+        self.assertEqual((None, 1, 1.0, True), self.pool.as_tuple())
+
+    def test_signed_zeros_are_kept_apart(self):
+        for zero, negative in ((0.0, -0.0), (0j, complex(0.0, -0.0)), (0j, complex(-0.0, 0.0)),
+                               ((1, 0.0), (1, -0.0)), (frozenset([0.0]), frozenset([-0.0])), ((0,), (0.0,))):
+            pool = ConstantPool()
+            self.assertEqual(0, pool.add(zero))
+            self.assertEqual(1, pool.add(negative))
+            self.assertEqual(0, pool.add(zero))
+            self.assertEqual(repr(negative), repr(pool[1]))
+
+    def test_unhashables_are_keyed_by_identity(self):
+        first, second = [1], [1]
+        self.assertEqual(1, self.pool.add(first))
+        self.assertEqual(2, self.pool.add(second))
+        self.assertEqual(1, self.pool.add(first))
+        self.assertIs(second, self.pool[2])
+
+    def test_truncate(self):
+        self.pool.add('a')
+        self.pool.append('a')
+        self.pool.add('b')
+        self.pool.truncate(2)
+        self.assertEqual([None, 'a'], self.pool)
+        self.assertNotIn('b', self.pool)
+        self.assertEqual(1, self.pool.index('a'))
+        self.assertEqual(2, self.pool.add('b'))
+
+    def test_index_and_contains(self):
+        self.pool.add(42)
+        self.assertEqual(1, self.pool.index(42))
+        self.assertIn(42, self.pool)
+        self.assertNotIn(42.0, self.pool)
+        self.assertRaises(ValueError, self.pool.index, 42.0)
+
+
+class SymbolTableTest(TestCase):
+    def setUp(self):
+        self.table = SymbolTable()
+
+    def test_add_allocates_once(self):
+        self.assertEqual(0, self.table.add('a'))
+        self.assertEqual(1, self.table.add('b'))
+        self.assertEqual(0, self.table.add('a'))
+        self.assertEqual(('a', 'b'), self.table.as_tuple())
+
+    def test_get_missing_name(self):
+        self.assertIsNone(self.table.get('a'))
+        self.assertRaises(ValueError, self.table.index, 'a')
+
+    def test_append_always_allocates(self):
+        self.table.append(None)
+        self.table.append(None)
+        self.assertEqual(2, len(self.table))
+        self.assertEqual(0, self.table.index(None))
+        self.assertEqual(2, self.table.add('a'))
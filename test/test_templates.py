@@ -0,0 +1,91 @@
+from unittest import TestCase
+from pyVoodoo.assembler import Code
+from pyVoodoo.assemblerExceptions import AssemblerBytecodeException, PersistorException
+from pyVoodoo.templates import Placeholder, Template
+from test import supported_bytecode
+
+
+def bounded():
+    code = Code()
+    code.argcount = 1
+    code.varnames.add('x')
+    code.LOAD_FAST('x')
+    code.LOAD_CONST(Placeholder('limit'))
+    code.COMPARE_OP(0)
+    code.RETURN_VALUE()
+    return code
+
+
+@supported_bytecode
+class TemplateTest(TestCase):
+    def test_specialize_constants(self):
+        template = bounded().freeze()
+        below_ten = template.function(limit=10)
+        below_two = template.function(limit=2)
+        self.assertTrue(below_ten(5))
+        self.assertFalse(below_two(5))
+
+    def test_specialized_code_shares_bytecode(self):
+        template = bounded().freeze()
+        first, second = template.specialize(limit=1), template.specialize(limit='a')
+        self.assertEqual(first.co_code, second.co_code)
+        self.assertIn('a', second.co_consts)
+        self.assertNotIn(Placeholder('limit'), second.co_consts)
+
+    def test_same_key_shares_slot(self):
+        code = Code()
+        code.LOAD_CONST(Placeholder('value'))
+        code.LOAD_CONST(Placeholder('value'))
+        code.BUILD_TUPLE(2)
+        code.RETURN_VALUE()
+        template = Template(code)
+        self.assertEqual(1, len(template.const_slots))
+        self.assertEqual((3, 3), template.function(value=3)())
+
+    def test_specialize_names(self):
+        code = Code()
+        code.LOAD_GLOBAL(Placeholder('field'))
+        code.RETURN_VALUE()
+        template = code.freeze()
+        self.assertEqual(1, template.function({'a': 1, 'b': 2}, field='a')())
+        self.assertEqual(2, template.function({'a': 1, 'b': 2}, field='b')())
+
+    def test_patch_arg(self):
+        code = bounded()
+        template = code.freeze()
+        template.patch_arg('op', code.find_first_opcode_index('COMPARE_OP'))
+        # cmp_op: '<' is 0, '>' is 4
+        self.assertTrue(template.function(limit=3, op=0)(2))
+        self.assertTrue(template.function(limit=3, op=4)(5))
+        self.assertFalse(template.function(limit=3, op=4)(2))
+
+    def test_patch_arg_too_wide(self):
+        code = bounded()
+        template = code.freeze()
+        template.patch_arg('op', code.find_first_opcode_index('COMPARE_OP'))
+        with self.assertRaises(AssemblerBytecodeException):
+            template.specialize(limit=1, op=300)
+
+    def test_missing_value(self):
+        with self.assertRaises(PersistorException):
+            bounded().freeze().specialize()
+
+    def test_invalid_name(self):
+        code = Code()
+        code.LOAD_GLOBAL(Placeholder('field'))
+        code.RETURN_VALUE()
+        with self.assertRaises(PersistorException):
+            code.freeze().specialize(field=1)
+
+    def test_name_placeholder_key_must_be_a_string(self):
+        code = Code()
+        code.LOAD_GLOBAL(Placeholder(1))
+        code.RETURN_VALUE()
+        self.assertRaises(PersistorException, Template, code)
+
+    def test_no_placeholders(self):
+        code = Code()
+        code.LOAD_CONST(1)
+        code.RETURN_VALUE()
+        template = code.freeze()
+        self.assertIs(template.code_object, template.specialize())
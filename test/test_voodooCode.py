@@ -2,8 +2,10 @@ from unittest import TestCase
 from pyVoodoo.assembler import Code, opcode_by_name
 from test.fixture.code_test_fixture import *
 from pyVoodoo import AssemblerBytecodeException
+from test import supported_bytecode
 
 
+@supported_bytecode
 class CodeTest(TestCase):
     def setUp(self):
         self.code = Code()
@@ -13,7 +15,7 @@ class CodeTest(TestCase):
         self.code.RETURN_VALUE()
 
         self.assertEqual([None, 42], self.code.consts)
-        self.assertEqual([100, 1, 0, 83], list(self.code.code))
+        self.assertEqual([100, 1, 83, 0], list(self.code.code))
         self.assertEqual(0, self.code.firstlineno)
         self.assertEqual([], self.code.blocks)
         self.assertEqual(0, self.code.argcount)
@@ -33,12 +35,12 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(1)
         self.code.LOAD_FAST(1)
 
-        self.assertEqual([100, 1, 0, 144, 1, 0, 125, 3, 0, 144, 1, 0, 124, 3, 0], list(self.code.code))
+        self.assertEqual([100, 1, 144, 1, 144, 0, 125, 3, 144, 1, 144, 0, 124, 3], list(self.code.code))
         from pyVoodoo.assemblerExceptions import InexistentInstruction
 
         self.assertRaises(InexistentInstruction, self.code.find_opcode_index, 'EXTENDED_ARG')
         self.assertEqual([6], self.code.find_opcode_index(125))
-        self.assertEqual([3, 9], self.code.find_opcode_index(144))
+        self.assertEqual([2, 4, 8, 10], self.code.find_opcode_index(144))
 
     def test_code_load_return(self):
         self.code.LOAD_CONST(1)
@@ -47,7 +49,7 @@ class CodeTest(TestCase):
         self.code.RETURN_VALUE()
 
         self.assertEqual([None, 1], self.code.consts)
-        self.assertEqual([100, 1, 0, 125, 0, 0, 124, 0, 0, 83], list(self.code.code))
+        self.assertEqual([100, 1, 125, 0, 124, 0, 83, 0], list(self.code.code))
         self.assertEqual(0, self.code.firstlineno)
         self.assertEqual([], self.code.blocks)
         self.assertEqual(0, self.code.argcount)
@@ -57,14 +59,14 @@ class CodeTest(TestCase):
         self.code.LOAD_FAST('b')  # Will fail, STORE_FAST('b') is added to the code
 
         self.assertIn('b', self.code.varnames)
-        self.assertEqual([100, 1, 0, 125, 0, 0, 124, 0, 0], list(self.code.code))
+        self.assertEqual([100, 1, 125, 0, 124, 0], list(self.code.code))
 
     def test_rescue_varname_creation(self):
         self.code.LOAD_CONST(1)
         self.code.STORE_FAST('b')
 
         self.assertIn('b', self.code.varnames)
-        self.assertEqual([100, 1, 0, 125, 0, 0], self.code._code_as_list())
+        self.assertEqual([100, 1, 125, 0], self.code._code_as_list())
 
     def test_semantically_equivalence_load_return(self):
         self.code.LOAD_CONST(1)
@@ -86,7 +88,7 @@ class CodeTest(TestCase):
         self.code.DUP_TOP()
         self.code.DUP_TOP()
 
-        self.assertEqual([100, 1, 0, 4, 4], self.code._code_as_list())
+        self.assertEqual([100, 1, 4, 0, 4, 0], self.code._code_as_list())
         self.assertEqual(3, self.code.stack_size)
 
     def test_unary_index_lookup(self):
@@ -94,8 +96,8 @@ class CodeTest(TestCase):
         for i in range(3):
             self.code.DUP_TOP()
 
-        self.assertEqual(3, self.code.find_first_opcode_index(4))
-        self.assertEqual([3, 4, 5], self.code.find_opcode_index(4))
+        self.assertEqual(2, self.code.find_first_opcode_index(4))
+        self.assertEqual([2, 4, 6], self.code.find_opcode_index(4))
 
     def test_generation_not_unary_pop_top(self):
         self.code.LOAD_CONST(1)
@@ -123,15 +125,15 @@ class CodeTest(TestCase):
         self.code.RETURN_VALUE()
 
         self.assertEqual([0], self.code.find_opcode_index(100))
-        self.assertEqual([3], self.code.find_opcode_index(83))
+        self.assertEqual([2], self.code.find_opcode_index(83))
 
     def test_find_instruction_load(self):
         self.code.LOAD_CONST(1)
         self.code.LOAD_FAST('b')
 
-        self.assertEqual([6], self.code.find_opcode_index(124))
-        self.assertEqual(6, self.code.find_first_opcode_index(124))
-        self.assertEqual([6], self.code.find_opcode_index('LOAD_FAST'))
+        self.assertEqual([4], self.code.find_opcode_index(124))
+        self.assertEqual(4, self.code.find_first_opcode_index(124))
+        self.assertEqual([4], self.code.find_opcode_index('LOAD_FAST'))
 
         self.assertEqual([0], self.code.find_opcode_index('LOAD_CONST'))
 
@@ -155,12 +157,12 @@ class CodeTest(TestCase):
     def test_POP_TOP_instruction(self):  # 1
         self.code.LOAD_CONST(514)
         self.assertEqual(1, self.code.stack_size)
-        self.assertEqual([100, 1, 0], self.code._code_as_list())
+        self.assertEqual([100, 1], self.code._code_as_list())
 
         self.code.POP_TOP()
         self.assertEqual(0, self.code.stack_size)
-        self.assertEqual([100, 1, 0, 1], self.code._code_as_list())
-        self.assertEqual([0, 1, 1, 1], self.code.stack_history)
+        self.assertEqual([100, 1, 1, 0], self.code._code_as_list())
+        self.assertEqual([(0, 0), (2, 1)], list(self.code.stack_history.items()))
 
     def test_ROT_TWO_failure(self):  # 2
         self.code.LOAD_CONST(4242)
@@ -169,11 +171,11 @@ class CodeTest(TestCase):
     def test_ROT_TWO_instruction(self):  # 2
         self.code.LOAD_CONST(3442)
         self.code.LOAD_CONST(2211)
-        self.assertEqual([100, 1, 0, 100, 2, 0], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2], self.code._code_as_list())
         self.assertEqual([None, 3442, 2211], self.code.consts)
 
         self.code.ROT_TWO()
-        self.assertEqual([100, 1, 0, 100, 2, 0, 2], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2, 2, 0], self.code._code_as_list())
         self.assertEqual([None, 3442, 2211], self.code.consts)
 
     def test_ROT_THREE_failure(self):  # 3
@@ -185,11 +187,11 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(3442)
         self.code.LOAD_CONST(2211)
         self.code.LOAD_CONST(1)
-        self.assertEqual([100, 1, 0, 100, 2, 0, 100, 3, 0], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2, 100, 3], self.code._code_as_list())
         self.assertEqual([None, 3442, 2211, 1], self.code.consts)
 
         self.code.ROT_THREE()
-        self.assertEqual([100, 1, 0, 100, 2, 0, 100, 3, 0, 3], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2, 100, 3, 3, 0], self.code._code_as_list())
         self.assertEqual([None, 3442, 2211, 1], self.code.consts)
 
     def test_DUP_TOP_error_instruction(self):  # 4
@@ -204,7 +206,7 @@ class CodeTest(TestCase):
         self.code.DUP_TOP_TWO()
 
         self.assertEqual(4, self.code.stack_size)
-        self.assertEqual([100, 1, 0, 100, 2, 0, 5], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2, 5, 0], self.code._code_as_list())
 
     def test_DUP_TOP_TWO_failure(self):  # 5
         self.code.LOAD_CONST(23425)
@@ -214,7 +216,7 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(341)
         self.code.LOAD_CONST(4828)
         self.code.DUP_TOP_TWO()
-        self.assertEqual([100, 1, 0, 100, 2, 0, 5], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2, 5, 0], self.code._code_as_list())
         self.assertEqual(4, self.code.stack_size)
         self.assertEqual([None, 341, 4828], self.code.consts)
 
@@ -226,7 +228,7 @@ class CodeTest(TestCase):
 
     def test_NOP_opcode(self):  # 9
         self.code.NOP()
-        self.assertEqual([9], list(self.code.code))
+        self.assertEqual([9, 0], list(self.code.code))
         self.assertEqual(0, self.code.stack_size)
 
     def test_UNARY_POSITIVE_failure(self):  # 10
@@ -237,7 +239,7 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(-144)
         self.code.UNARY_POSITIVE()
 
-        self.assertEqual([100, 1, 0, 10], self.code._code_as_list())
+        self.assertEqual([100, 1, 10, 0], self.code._code_as_list())
         self.assertEqual(1, self.code.stack_size)
         self.assertEqual([None, -144], self.code.consts)
 
@@ -249,7 +251,7 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(1344)
         self.code.UNARY_NEGATIVE()
 
-        self.assertEqual([100, 1, 0, 11], self.code._code_as_list())
+        self.assertEqual([100, 1, 11, 0], self.code._code_as_list())
         self.assertEqual(1, self.code.stack_size)
         self.assertEqual([None, 1344], self.code.consts)
 
@@ -261,7 +263,7 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(146)
         self.code.UNARY_NOT()
 
-        self.assertEqual([100, 1, 0, 12], self.code._code_as_list())
+        self.assertEqual([100, 1, 12, 0], self.code._code_as_list())
         self.assertEqual(1, self.code.stack_size)
         self.assertEqual([None, 146], self.code.consts)
 
@@ -273,7 +275,7 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(1)
         self.code.UNARY_INVERT()
 
-        self.assertEqual([100, 1, 0, 15], self.code._code_as_list())
+        self.assertEqual([100, 1, 15, 0], self.code._code_as_list())
         self.assertEqual(1, self.code.stack_size)
         self.assertEqual([None, 1], self.code.consts)
 
@@ -286,7 +288,7 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(1)
         self.code.BINARY_POWER()
 
-        self.assertEqual([100, 1, 0, 100, 2, 0, 19], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2, 19, 0], self.code._code_as_list())
         self.assertEqual(1, self.code.stack_size)
         self.assertEqual([None, 123, 1], self.code.consts)
 
@@ -299,7 +301,7 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(23)
         self.code.BINARY_MULTIPLY()
 
-        self.assertEqual([100, 1, 0, 100, 2, 0, 20], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2, 20, 0], self.code._code_as_list())
         self.assertEqual(1, self.code.stack_size)
         self.assertEqual([None, 1, 23], self.code.consts)
 
@@ -313,7 +315,7 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(53)
         self.code.BINARY_MODULO()
 
-        self.assertEqual([100, 1, 0, 100, 2, 0, 22], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2, 22, 0], self.code._code_as_list())
         self.assertEqual(1, self.code.stack_size)
         self.assertEqual([None, 17, 53], self.code.consts)
 
@@ -327,7 +329,7 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(2)
         self.code.BINARY_ADD()
 
-        self.assertEqual([100, 1, 0, 100, 2, 0, 23], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2, 23, 0], self.code._code_as_list())
         self.assertEqual(1, self.code.stack_size)
         self.assertEqual([None, 27, 2], self.code.consts)
 
@@ -339,7 +341,7 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(8)
         self.code.BINARY_SUBTRACT()
 
-        self.assertEqual([100, 1, 0, 100, 2, 0, 24], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2, 24, 0], self.code._code_as_list())
         self.assertEqual(1, self.code.stack_size)
         self.assertEqual([None, 3451, 8], self.code.consts)
 
@@ -351,7 +353,7 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(2)
         self.code.BINARY_SUBSCR()
 
-        self.assertEqual([100, 1, 0, 100, 2, 0, 25], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2, 25, 0], self.code._code_as_list())
         self.assertEqual(1, self.code.stack_size)
         self.assertEqual([None, 1, 2], self.code.consts)
 
@@ -364,7 +366,7 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(2)
         self.code.BINARY_FLOOR_DIVIDE()
 
-        self.assertEqual([100, 1, 0, 100, 2, 0, 26], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2, 26, 0], self.code._code_as_list())
         self.assertEqual(1, self.code.stack_size)
         self.assertEqual([None, 34, 2], self.code.consts)
 
@@ -377,7 +379,7 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(2)
         self.code.BINARY_TRUE_DIVIDE()
 
-        self.assertEqual([100, 1, 0, 100, 2, 0, 27], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2, 27, 0], self.code._code_as_list())
         self.assertEqual(1, self.code.stack_size)
         self.assertEqual([None, 1, 2], self.code.consts)
 
@@ -389,7 +391,7 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(34)
         self.code.INPLACE_FLOOR_DIVIDE()
 
-        self.assertEqual([100, 1, 0, 100, 2, 0, 28], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2, 28, 0], self.code._code_as_list())
         self.assertEqual(1, self.code.stack_size)
         self.assertEqual([None, 1, 34], self.code.consts)
 
@@ -402,7 +404,7 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(1)
         self.code.INPLACE_TRUE_DIVIDE()
 
-        self.assertEqual([100, 1, 0, 100, 2, 0, 29], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2, 29, 0], self.code._code_as_list())
         self.assertEqual(1, self.code.stack_size)
         self.assertEqual([None, 34, 1], self.code.consts)
 
@@ -418,7 +420,7 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(2)
         self.code.STORE_SUBSCR()
 
-        self.assertEqual([100, 1, 0, 100, 2, 0, 100, 3, 0, 60], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2, 100, 3, 60, 0], self.code._code_as_list())
         self.assertEqual(0, self.code.stack_size)
         self.assertEqual([None, 1, 23, 2], self.code.consts)
 
@@ -432,7 +434,7 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(3)
         self.code.DELETE_SUBSCR()
 
-        self.assertEqual([100, 1, 0, 100, 2, 0, 100, 3, 0, 61], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2, 100, 3, 61, 0], self.code._code_as_list())
         self.assertEqual(1, self.code.stack_size)
         self.assertEqual([None, 1, 23, 3], self.code.consts)
 
@@ -445,7 +447,7 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(3)
         self.code.BINARY_LSHIFT()
 
-        self.assertEqual([100, 1, 0, 100, 2, 0, 62], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2, 62, 0], self.code._code_as_list())
         self.assertEqual(1, self.code.stack_size)
         self.assertEqual([None, 1, 3], self.code.consts)
 
@@ -458,7 +460,7 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(2)
         self.code.BINARY_RSHIFT()
 
-        self.assertEqual([100, 1, 0, 100, 2, 0, 63], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2, 63, 0], self.code._code_as_list())
         self.assertEqual(1, self.code.stack_size)
         self.assertEqual([None, 53, 2], self.code.consts)
 
@@ -471,7 +473,7 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(1)
         self.code.BINARY_AND()
 
-        self.assertEqual([100, 1, 0, 100, 1, 0, 64], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 1, 64, 0], self.code._code_as_list())
         self.assertEqual(1, self.code.stack_size)
         self.assertEqual([None, 1], self.code.consts)
 
@@ -486,7 +488,7 @@ class CodeTest(TestCase):
 
         self.code.BINARY_XOR()
 
-        self.assertEqual([100, 1, 0, 100, 2, 0, 65], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2, 65, 0], self.code._code_as_list())
         self.assertEqual(1, self.code.stack_size)
         self.assertEqual([None, 13, 12], self.code.consts)
 
@@ -501,7 +503,7 @@ class CodeTest(TestCase):
 
         self.code.INPLACE_POWER()
 
-        self.assertEqual([100, 1, 0, 100, 2, 0, 67], self.code._code_as_list())
+        self.assertEqual([100, 1, 100, 2, 67, 0], self.code._code_as_list())
         self.assertEqual(1, self.code.stack_size)
         self.assertEqual([None, 2, 3], self.code.consts)
 
@@ -513,7 +515,237 @@ class CodeTest(TestCase):
         self.code.LOAD_CONST(12)
         self.code.GET_ITER()
 
-        self.assertEqual([100, 1, 0, 68], self.code._code_as_list())
+        self.assertEqual([100, 1, 68, 0], self.code._code_as_list())
         self.assertEqual(1, self.code.stack_size)
         self.assertEqual([None, 12], self.code.consts)
 
+
+    def test_LOAD_CONST_dedupe(self):
+        for const in (1, 1.0, True, 1, 'a', True):
+            self.code.LOAD_CONST(const)
+
+        self.assertEqual([None, 1, 1.0, True, 'a'], self.code.consts)
+        self.assertEqual([100, 1, 100, 2, 100, 3, 100, 1, 100, 4, 100, 3], self.code._code_as_list())
+
+    def test_name_opcodes_use_names_table(self):
+        self.code.LOAD_GLOBAL('print')
+        self.code.LOAD_GLOBAL('len')
+        self.code.LOAD_GLOBAL('print')
+
+        self.assertEqual(['print', 'len'], self.code.names)
+        self.assertEqual([116, 0, 116, 1, 116, 0], self.code._code_as_list())
+
+    def test_deref_slots(self):
+        self.code.cellvars.add('cell')
+        self.code.LOAD_DEREF('free')
+        self.code.LOAD_DEREF('cell')
+
+        self.assertEqual(['free'], self.code.freevars)
+        self.assertEqual([136, 1, 136, 0], self.code._code_as_list())
+
+    def test_DELETE_FAST_uses_varnames(self):
+        self.code.LOAD_CONST(1)
+        self.code.STORE_FAST('a')
+        self.code.DELETE_FAST('b')
+        self.code.DELETE_FAST('a')
+
+        self.assertEqual(['a', 'b'], self.code.varnames)
+        self.assertEqual([100, 1, 125, 0, 126, 1, 126, 0], self.code._code_as_list())
+
+    def test_stack_history_queries(self):
+        self.code.LOAD_CONST(1)
+        self.code.LOAD_CONST(2)
+        self.code.BINARY_ADD()
+        self.code.DUP_TOP()
+        self.code.POP_TOP()
+        self.code.RETURN_VALUE()
+
+        self.assertEqual([(0, 0), (2, 1), (4, 2), (6, 1), (8, 2), (10, 1)],
+                         list(self.code.stack_history.items()))
+        self.assertEqual(2, self.code.stack_depth_at(5))
+        self.assertEqual(1, self.code.stack_depth_at(6))
+        self.assertIsNone(self.code.stack_depth_at(12))
+        self.assertEqual(2, self.code.max_stack_depth())
+        self.assertEqual(1, self.code.max_stack_depth(0, 3))
+        self.assertEqual(2, self.code.max_stack_depth(6, 8))
+        self.assertEqual(1, self.code.max_stack_depth(10, 12))
+
+    def test_stack_history_is_run_length_encoded(self):
+        for i in range(100):
+            self.code.NOP()
+        self.code.LOAD_CONST(1)
+        for i in range(100):
+            self.code.NOP()
+
+        self.assertEqual(2, len(self.code.stack_history))
+        self.assertEqual(0, self.code.stack_depth_at(198))
+        self.assertEqual(1, self.code.stack_depth_at(202))
+
+    def test_opcode_index_queries(self):
+        self.code.LOAD_CONST(1)
+        self.code.STORE_FAST('a')
+        self.code.LOAD_FAST('a')
+        self.code.LOAD_FAST('a')
+        self.code.BINARY_ADD()
+        self.code.RETURN_VALUE()
+
+        self.assertEqual([0, 2, 4, 6, 8, 10], self.code.instruction_offsets())
+        self.assertEqual(2, self.code.count_opcode('LOAD_FAST'))
+        self.assertEqual(0, self.code.count_opcode('POP_TOP'))
+        self.assertEqual([0, 4, 6], self.code.find_opcodes_index('LOAD_CONST', 'LOAD_FAST'))
+        self.assertEqual(8, self.code.find_first_opcode_index('BINARY_ADD'))
+
+    def test_find_first_missing_opcode(self):
+        from pyVoodoo.assemblerExceptions import InstructionNotFoundException
+
+        self.code.LOAD_CONST(1)
+        self.assertRaises(InstructionNotFoundException, self.code.find_first_opcode_index, 'POP_TOP')
+
+
+@supported_bytecode
+class EmitTest(TestCase):
+    def setUp(self):
+        self.code = Code()
+        self.methods = Code()
+
+    def test_same_bytecode_as_methods(self):
+        self.methods.LOAD_CONST(1)
+        self.methods.STORE_FAST('a')
+        self.methods.LOAD_GLOBAL('len')
+        self.methods.LOAD_FAST('a')
+        self.methods.BINARY_ADD()
+        self.methods.RETURN_VALUE()
+        self.code.emit('LOAD_CONST', 1)
+        self.code.emit('STORE_FAST', 'a')
+        self.code.emit(opcode_by_name('LOAD_GLOBAL'), 'len')
+        self.code.emit('LOAD_FAST', 'a')
+        self.code.emit('BINARY_ADD')
+        self.code.emit('RETURN_VALUE')
+
+        self.assertEqual(self.methods.code, self.code.code)
+        self.assertEqual(list(self.methods.stack_history.items()), list(self.code.stack_history.items()))
+        self.assertEqual((2, None), (self.code.stacksize, self.code.stack_size))
+        self.assertEqual(self.methods.instruction_offsets(), self.code.instruction_offsets())
+        self.assertEqual(['len'], list(self.code.names))
+
+    def test_argument_dependent_stack_effect(self):
+        for i in range(3):
+            self.code.emit('LOAD_CONST', i)
+        self.code.emit('BUILD_TUPLE', 3)
+
+        self.assertEqual((3, 1), (self.code.stacksize, self.code.stack_size))
+
+    def test_jump(self):
+        self.code.emit('LOAD_CONST', True)
+        label = self.code.emit('POP_JUMP_IF_FALSE')
+        self.code.emit('LOAD_CONST', 1)
+        self.code.emit('RETURN_VALUE')
+        self.code.mark(label)
+        self.code.emit('LOAD_CONST', 2)
+        self.code.emit('RETURN_VALUE')
+
+        self.assertEqual(1, self.code.to_function()())
+
+    def test_wide_argument_indexed(self):
+        for i in range(300):
+            self.code.names.add('n{0}'.format(i))
+        self.code.emit('LOAD_GLOBAL', 'n299')
+
+        self.assertEqual([0, 2], self.code.instruction_offsets())
+        self.assertEqual([2], self.code.find_opcode_index('LOAD_GLOBAL'))
+
+    def test_errors(self):
+        from pyVoodoo.assemblerExceptions import InexistentInstruction, CodeTypeException
+
+        self.assertRaises(InexistentInstruction, self.code.emit, 'NOT_AN_OPCODE')
+        self.assertRaises(AssemblerBytecodeException, self.code.emit, 'POP_TOP')
+        self.code.emit('LOAD_CONST', 1)
+        self.code.emit('RETURN_VALUE')
+        self.assertRaises(CodeTypeException, self.code.emit, 'LOAD_CONST', 1)
+
+
+@supported_bytecode
+class BulkEmitTest(TestCase):
+    def setUp(self):
+        self.code = Code()
+        self.expected = Code()
+        self.expected.LOAD_CONST(1)
+        self.expected.STORE_FAST('a')
+        self.expected.LOAD_FAST('a')
+        self.expected.LOAD_GLOBAL('g')
+        self.expected.BINARY_ADD()
+        self.expected.RETURN_VALUE()
+
+    def check(self):
+        self.assertEqual(self.expected.code, self.code.code)
+        self.assertEqual(list(self.expected.stack_history.items()), list(self.code.stack_history.items()))
+        self.assertEqual(self.expected.instruction_offsets(), self.code.instruction_offsets())
+        self.assertEqual((2, None), (self.code.stacksize, self.code.stack_size))
+
+    def test_pairs(self):
+        self.code.emit_many([('LOAD_CONST', 1), ('STORE_FAST', 'a'), ('LOAD_FAST', 'a'), ('LOAD_GLOBAL', 'g'),
+                             ('BINARY_ADD', None), ('RETURN_VALUE', None)])
+
+        self.check()
+        self.assertEqual(['g'], list(self.code.names))
+
+    def test_array(self):
+        from array import array
+
+        self.code.consts.add(1)
+        self.code.varnames.add('a')
+        self.code.names.add('g')
+        ops = [opcode_by_name(name) for name in ('LOAD_CONST', 'STORE_FAST', 'LOAD_FAST', 'LOAD_GLOBAL',
+                                                 'BINARY_ADD', 'RETURN_VALUE')]
+        self.code.emit_many(array('I', [ops[0], 1, ops[1], 0, ops[2], 0, ops[3], 0, ops[4], 0, ops[5], 0]))
+
+        self.check()
+
+    def test_encoded(self):
+        self.code.consts.add(1)
+        self.code.varnames.add('a')
+        self.code.names.add('g')
+        self.code.emit_encoded(bytes(self.expected.code))
+
+        self.check()
+
+    def test_nothing_written_on_error(self):
+        self.code.LOAD_CONST(1)
+        before = bytes(self.code.code)
+
+        self.assertRaises(AssemblerBytecodeException, self.code.emit_many, [('POP_TOP', None), ('POP_TOP', None)])
+        self.assertRaises(AssemblerBytecodeException, self.code.emit_encoded, bytes(self.expected.code))
+        self.assertEqual(before, bytes(self.code.code))
+        self.assertEqual(1, self.code.stack_size)
+
+    def test_tables_untouched_on_error(self):
+        self.code.LOAD_CONST('x')
+        tables = (self.code.consts, self.code.names, self.code.varnames, self.code.freevars)
+        before = [list(table) for table in tables]
+        label = self.code.label()
+
+        self.assertRaises(AssemblerBytecodeException, self.code.emit_many, [
+            ('LOAD_CONST', 'y'), ('LOAD_NAME', 'foo'), ('STORE_FAST', 'v'), ('LOAD_DEREF', 'cell'),
+            ('POP_JUMP_IF_FALSE', label), ('POP_TOP', None), ('POP_TOP', None), ('POP_TOP', None)])
+        self.assertEqual(before, [list(table) for table in tables])
+        self.assertNotIn('y', self.code.consts)
+        self.assertIsNone(self.code.varnames.get('v'))
+        self.assertIsNone(label.stack_size)
+        self.assertEqual(len(before[0]), self.code.consts.add('y'))
+
+    def test_labels(self):
+        label = self.code.label()
+        self.code.emit_many([('LOAD_CONST', False), ('POP_JUMP_IF_FALSE', label), ('LOAD_CONST', 1),
+                             ('RETURN_VALUE', None)])
+        self.code.mark(label)
+        self.code.emit_many([('LOAD_CONST', 2), ('RETURN_VALUE', None)])
+
+        self.assertEqual(2, self.code.to_function()())
+
+    def test_wide_arguments(self):
+        for i in range(300):
+            self.code.consts.add(i)
+        self.code.emit_many([('LOAD_CONST', 299), ('POP_TOP', None)])
+
+        self.assertEqual(3, len(self.code.instruction_offsets()))
+        self.assertEqual([2], self.code.find_opcode_index('LOAD_CONST'))